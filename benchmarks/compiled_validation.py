@@ -0,0 +1,118 @@
+"""
+The time per item of the validation of the create mutations, with a `ModelForm` per item and with the
+compiled validation (`COMPILED_VALIDATION`), on the `Book` model of the tests in an in-memory SQLite.
+
+    python benchmarks/compiled_validation.py --items 2000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.apps import apps  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+
+from graphene_django_cruddals_v1 import CruddalsModel  # noqa: E402
+from graphene_django_cruddals_v1.registry.registry_global import get_global_registry  # noqa: E402
+from graphene_django_cruddals_v1.utils.bulk_mutation import validate_forms  # noqa: E402
+from tests.shop.models import Author, Book, Label  # noqa: E402
+from tests.shop.schema import schema  # noqa: E402
+
+
+CREATE_BOOKS = """
+mutation ($input: [{input_type}!]) {
+  {mutation}(input: $input) {
+    objects { id }
+    errors { objectPosition }
+  }
+}
+"""
+
+
+class CompiledValidationInterface:
+    class Create:
+        compiled_validation = True
+
+
+class CompiledBooks(CruddalsModel):
+    """The same mutations of `Book` as the schema of the tests, with the compiled validation"""
+
+    class Meta:
+        model = Book
+        suffix = "Compiled"
+        interfaces = [CompiledValidationInterface]
+
+
+class Rollback(Exception):
+    pass
+
+
+def get_items(count):
+    """Books with a title, a unique isbn, a foreign key and a many-to-many field"""
+    author = Author.objects.create(name="Author")
+    labels = [str(Label.objects.create(name=f"Label {i}").pk) for i in range(3)]
+    return [
+        {"title": f"Book {i}", "isbn": f"isbn-{i}", "author": str(author.pk), "labels": labels[:i % 4]}
+        for i in range(count)
+    ]
+
+
+def time_validation(create, items, repeat):
+    """The best time of `validate_forms` for all the items, the step of the mutation that builds and validates the forms"""
+    positions = list(range(len(items)))
+
+    def validate():
+        valid_forms, errors = validate_forms(create, None, None, {position: dict(items[position]) for position in positions}, positions)
+        assert not errors and len(valid_forms) == len(items)
+
+    return min(timeit.repeat(validate, number=1, repeat=repeat))
+
+
+def time_mutation(schema, mutation, input_type, items, repeat):
+    """The best time of the whole create `mutation` of `schema`, the books are rolled back after every run"""
+    query = CREATE_BOOKS.replace("{mutation}", mutation).replace("{input_type}", input_type)
+
+    def mutate():
+        try:
+            with transaction.atomic():
+                result = schema.execute(query, variable_values={"input": items}, context_value=type("Context", (), {})())
+                assert result.errors is None and not result.data[mutation]["errors"]
+                raise Rollback
+        except Rollback:
+            pass
+
+    return min(timeit.repeat(mutate, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=2000, help="The number of items of the mutation")
+    parser.add_argument("--repeat", type=int, default=5, help="The runs of every measure, the best one is kept")
+    options = parser.parse_args()
+
+    with connection.schema_editor() as schema_editor:
+        for model in apps.get_app_config("shop").get_models():
+            schema_editor.create_model(model)
+    items = get_items(options.items)
+    cruddals = get_global_registry().get_registry_for_model(Book)["cruddals"]
+
+    print(f"{options.items} Book items, best of {options.repeat}")
+    runs = (
+        ("ModelForm", cruddals.meta.mutation_create, schema, "createBooks", "CreateBookInput"),
+        ("compiled", CompiledBooks.meta.mutation_create, CompiledBooks.Schema, "createBooksCompiled", "CreateCompiledBookInput"),
+    )
+    for name, create, run_schema, mutation_name, input_type in runs:
+        validation = time_validation(create, items, options.repeat)
+        mutation = time_mutation(run_schema, mutation_name, input_type, items, options.repeat)
+        print(f"  {name:<10} validation {validation / options.items * 1e6:7.1f} us/item, whole mutation {mutation:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -47,12 +47,8 @@ def get_unbound_function(func):
 
 
 def resolve_for_relation_field(field, model, _type, root, info, **args):
-    attname = field.name
-    default_value = field.default
-    instance = getattr(root, attname, default_value)
-    queryset = model.objects.filter(id=instance.id)
-    _type.get_queryset(queryset, info)
-    return queryset.get()
+    from graphene_django_cruddals_v1.utils.loaders import load_related_object
+    return load_related_object(root, field, _type, info)
 
 
 def get_function_for_type(graphene_type, func_name, name):
@@ -225,7 +221,7 @@ def convert_onetoone_field_to_djangomodel(field, registry:RegistryGlobal=None):
         default_resolver = partial(resolve_for_relation_field, field, related_model, related_type)
 
         if direct_type:
-            default_resolver = get_function_for_type(direct_type, f"resolve_{field.name}", field.name)
+            default_resolver = get_function_for_type(direct_type, f"resolve_{field.name}", field.name) or default_resolver
 
         return Field( related_type, required=not field.null, resolver=default_resolver)
 
@@ -257,7 +253,7 @@ def convert_field_to_djangomodel(field, registry:RegistryGlobal=None):
         default_resolver = partial(resolve_for_relation_field, field, related_model, related_type)
 
         if direct_type:
-            default_resolver = get_function_for_type(direct_type, f"resolve_{field.name}", field.name)
+            default_resolver = get_function_for_type(direct_type, f"resolve_{field.name}", field.name) or default_resolver
 
         return Field( related_type, description=get_django_field_description(field), required=not field.blank, resolver=default_resolver)
 
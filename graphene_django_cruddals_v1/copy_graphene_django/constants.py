@@ -1 +1,2 @@
 MUTATION_ERRORS_FLAG = "graphene_mutation_has_errors"
+STREAMING_RESPONSE_FLAG = "cruddals_streaming_response"
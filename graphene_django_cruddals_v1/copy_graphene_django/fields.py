@@ -1,12 +1,17 @@
 from functools import partial
 
+from django.db.models import Model
 from django.db.models.query import QuerySet
 
 
 from graphene import NonNull
 from graphene.types import Field, List
 
-from graphene_django_cruddals_v1.utils.utils import convert_model_to_paginated_object_type, maybe_queryset, order_by_input_to_args, paginate_queryset, where_input_to_Q
+from graphene_django_cruddals_v1.utils.utils import apply_where_and_order_by, convert_model_to_paginated_object_type, get_model_fields_map, get_paginated_result, maybe_queryset, normalize_page_and_page_size, paginate_queryset
+from graphene_django_cruddals_v1.utils.query_optimizer import get_prefetch_to_attr, optimize_queryset
+from graphene_django_cruddals_v1.utils.loaders import batch_paginated_field, get_batched_page_attr, mark_siblings
+from graphene_django_cruddals_v1.utils.aggregates import QuerysetAggregates
+from graphene_django_cruddals_v1.utils.cost_guard import get_cost_limits_for_model, guard_query_cost
 
 
 
@@ -47,6 +52,10 @@ class DjangoListField(Field):
             # Pass queryset to the DjangoObjectType get_queryset method
             queryset = maybe_queryset(django_object_type.get_queryset(queryset, info))
 
+            # The rows resolved together are used to batch the load of their related objects
+            return mark_siblings(queryset)
+
+        # Lists come from the prefetched or batched objects of a paginated field, already marked
         return queryset
 
     def wrap_resolve(self, parent_resolver):
@@ -90,40 +99,69 @@ class DjangoPaginatedField(Field):
     @staticmethod
     def resolver_for_paginated_field( paginated_object_type, django_object_type, resolver, default_manager, root, info, **args ):
         
-        maybe_manager = resolver(root, info, **args)
-        attname, default_value = resolver.args
+        paginated = args.get("paginated", {})
+
+        def get_queryset():
+            maybe_manager = resolver(root, info, **args)
+            attname, default_value = resolver.args
+            if attname.startswith("paginated_"):
+                posible_field = attname.replace("paginated_", "", 1)
+                if hasattr(root, posible_field):
+                    maybe_manager = getattr(root, posible_field, default_value)
+
+            queryset:QuerySet = maybe_queryset(maybe_manager)
+
+            if queryset is None:
+                queryset = maybe_queryset(default_manager)
+
+            if isinstance(queryset, QuerySet):
+                # Pass queryset to the DjangoObjectType get_queryset method
+                queryset = maybe_queryset(django_object_type.get_queryset(queryset, info))
+
+            return apply_where_and_order_by(queryset, args)
+
+        def guard_cost(queryset, page_size):
+            # The limits of the related model, set by the interfaces of its CRUDDALS
+            max_estimated_rows, max_estimated_cost = get_cost_limits_for_model(django_object_type._meta.model, django_object_type._meta.registry)
+            if max_estimated_rows is None and max_estimated_cost is None:
+                return page_size
+            queryset = queryset() if callable(queryset) else queryset
+            if not isinstance(queryset, QuerySet):
+                return page_size
+            scope = f"{root._meta.label}.{info.field_name}" if isinstance(root, Model) else info.field_name
+            return guard_query_cost(queryset, args, page_size, max_estimated_rows, max_estimated_cost, scope=scope)
+
+        # The aggregates of a page loaded by a prefetch or a batch are computed with the queryset of the root
+        aggregates = QuerysetAggregates(get_queryset)
+
+        # The parent queryset was optimized and already has the filtered and ordered objects of this field
+        prefetched = getattr(root, get_prefetch_to_attr(info.path.key), None)
+        if prefetched is not None:
+            return paginate_queryset(prefetched, paginated.get('page_size', 'All'), paginated.get('page', 1), paginated_object_type, aggregates=aggregates)
+
+        attname, _ = resolver.args
         if attname.startswith("paginated_"):
             posible_field = attname.replace("paginated_", "", 1)
             if hasattr(root, posible_field):
-                maybe_manager = getattr(root, posible_field, default_value)
-
-        queryset:QuerySet = maybe_queryset(maybe_manager)
-
-        if queryset is None:
-            queryset = maybe_queryset(default_manager)
-
-        if isinstance(queryset, QuerySet):
-            # Pass queryset to the DjangoObjectType get_queryset method
-            queryset = maybe_queryset(django_object_type.get_queryset(queryset, info))
-            
-        if "where" in args:
-            where = args["where"] 
-            obj_q = where_input_to_Q(where)
-            queryset = queryset.filter(obj_q)
-        
-        if "order_by" in args or "orderBy" in args:
-            order_by = args.get("order_by") or args.get("orderBy")
-            if isinstance(order_by, dict):
-                order_by = [order_by]
-            list_for_order = order_by_input_to_args(order_by)
-            queryset = queryset.order_by(*list_for_order)
-        else:
-            queryset = queryset.order_by("pk")
-
-        paginated = args.get("paginated", {})
-        queryset = queryset.distinct()
-
-        return paginate_queryset(queryset, paginated.get('page_size', 'All'), paginated.get('page', 1), paginated_object_type)
+                # The page of this field is loaded for the root and its siblings in one query
+                batched_page_attr = get_batched_page_attr(info.path.key)
+                if not hasattr(root, batched_page_attr):
+                    django_field = get_model_fields_map(root._meta.model).get(posible_field, None)
+                    # A page capped by the cost guard is loaded for every root without the batch
+                    page_size = paginated.get('page_size', 'All')
+                    if django_field is not None and guard_cost(get_queryset, page_size) == page_size:
+                        batch_paginated_field(root, django_field, django_object_type, args, info)
+                batched_page = getattr(root, batched_page_attr, None)
+                if batched_page is not None:
+                    objects, total, page, has_next = batched_page
+                    _, page_size = normalize_page_and_page_size(paginated.get('page', 1), paginated.get('page_size', 'All'))
+                    return get_paginated_result(objects, total, page, page_size, paginated_object_type, has_next=has_next, aggregates=aggregates)
+
+        queryset = get_queryset()
+        page_size = guard_cost(queryset, paginated.get('page_size', 'All'))
+        queryset = optimize_queryset(queryset, info, django_object_type, paginated=True)
+
+        return paginate_queryset(queryset, page_size, paginated.get('page', 1), paginated_object_type, after=paginated.get('after'), before=paginated.get('before'), info=info)
 
     def wrap_resolve(self, parent_resolver):
 
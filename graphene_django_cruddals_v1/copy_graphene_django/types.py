@@ -1,6 +1,6 @@
 import warnings
 from collections import OrderedDict
-from typing import Type
+from typing import Dict, List, Type
 
 import graphene
 from django.db.models import Model
@@ -122,6 +122,7 @@ class DjangoObjectTypeOptions(ObjectTypeOptions):
 
     filter_fields = ()
     filterset_class = None
+    fields_dependencies = None  # type: Dict[str, List[str]]
 
 
 class DjangoObjectType(ObjectType):
@@ -142,6 +143,7 @@ class DjangoObjectType(ObjectType):
         use_connection=None,
         interfaces=(),
         convert_choices_to_enum=True,
+        fields_dependencies=None,
         _meta=None,
         **options
     ):
@@ -239,6 +241,7 @@ class DjangoObjectType(ObjectType):
         _meta.filterset_class = filterset_class
         _meta.fields = django_fields
         _meta.connection = connection
+        _meta.fields_dependencies = fields_dependencies or {}
 
         super().__init_subclass_with_meta__(
             _meta=_meta, interfaces=interfaces, **options
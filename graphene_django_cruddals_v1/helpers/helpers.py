@@ -29,10 +29,63 @@ class PaginationInterface(graphene.Interface):
     has_prev = graphene.Boolean()
     index_start_obj = graphene.Int()
     index_end_obj = graphene.Int()
+    start_cursor = graphene.String()
+    end_cursor = graphene.String()
+    total_is_approximate = graphene.Boolean(description="If `total` and `pages` are estimated from the statistics of the database")
+
+    def resolve_total_is_approximate(root, info):
+        return bool(getattr(root, "total_is_approximate", False))
+
+class FacetBucket(graphene.ObjectType):
+    value = GenericScalar(description="The value of the field, the pk of the related object for a relation")
+    label = graphene.String(description="The label of the choice or the related object of the value")
+    count = graphene.Int(required=True)
+
+class FieldFacet(graphene.ObjectType):
+    field = graphene.String(required=True)
+    buckets = graphene.List(graphene.NonNull(FacetBucket), required=True)
+
+class IntAggregates(graphene.ObjectType):
+    sum = graphene.BigInt()
+    avg = graphene.Float()
+    min = graphene.Int()
+    max = graphene.Int()
+
+class BigIntAggregates(graphene.ObjectType):
+    sum = graphene.BigInt()
+    avg = graphene.Float()
+    min = graphene.BigInt()
+    max = graphene.BigInt()
+
+class FloatAggregates(graphene.ObjectType):
+    sum = graphene.Float()
+    avg = graphene.Float()
+    min = graphene.Float()
+    max = graphene.Float()
+
+class DecimalAggregates(graphene.ObjectType):
+    sum = graphene.Decimal()
+    avg = graphene.Decimal()
+    min = graphene.Decimal()
+    max = graphene.Decimal()
+
+class DateAggregates(graphene.ObjectType):
+    min = graphene.Date()
+    max = graphene.Date()
+
+class DateTimeAggregates(graphene.ObjectType):
+    min = graphene.DateTime()
+    max = graphene.DateTime()
+
+class TimeAggregates(graphene.ObjectType):
+    min = graphene.Time()
+    max = graphene.Time()
 
 class PaginatedInput(graphene.InputObjectType):
     page = graphene.InputField(type_=graphene.Int, default_value=1)
     page_size = graphene.InputField(type_=IntOrAll, default_value="All")
+    after = graphene.InputField(type_=graphene.String, description="Return the page after this cursor, without counting the previous rows")
+    before = graphene.InputField(type_=graphene.String, description="Return the page before this cursor, without counting the next rows")
 
 
 
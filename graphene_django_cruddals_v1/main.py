@@ -26,15 +26,22 @@ from graphene_django_cruddals_v1.copy_graphene_django.types import ErrorsType
 from .utils.utils import (
                     DjangoModelFormMutation, add_cruddals_model_to_request, build_class, 
                     convert_model_fields_to_mutation_input_fields, convert_model_to_model_form, convert_model_to_mutation_input_object_type, convert_model_to_object_type, convert_model_to_paginated_object_type, 
+                    convert_model_to_filter_input_object_type, convert_model_to_order_by_input_object_type, 
                     delete_keys, get_global_registry, get_name_of_model_in_different_case, get_order_by_arg, get_paginated_arg, get_where_arg, maybe_queryset, order_by_input_to_args, toggle_active_status, transform_args_type_relation, update_dict_with_model_instance, 
-                    paginate_queryset, merge_dict, validate_list_func_cruddals, where_input_to_Q
+                    paginate_queryset, merge_dict, validate_list_func_cruddals, where_input_to_Q, apply_where_and_order_by, distinct_if_needed
                 )
+from .utils.query_optimizer import optimize_queryset
+from .utils.text_search import get_text_search, register_text_search
+from .utils.facets import get_facets
+from .utils.index_advisor import track_query_usage
+from .utils.cost_guard import guard_query_cost
+from .helpers.helpers import FieldFacet
 from .settings import cruddals_settings
 
 
 # For interfaces, is executed first AppInterface, after Model Interface, for both is executed in order of list
 
-CLASS_CRUDDALS_NAMES = ["Create", "Read", "Update", "Delete", "Deactivate", "Activate", "List", "Search"]
+CLASS_CRUDDALS_NAMES = ["Create", "Read", "Update", "Delete", "Deactivate", "Activate", "List", "Search", "Facet"]
 CLASS_TYPE_NAMES = ["InputObjectType", "ObjectType"]
 FINAL_CLASS_NAMES = CLASS_CRUDDALS_NAMES + CLASS_TYPE_NAMES
 
@@ -47,6 +54,7 @@ class CruddalsInterfaceNames(Enum):
     ACTIVATE = "Activate"
     LIST = "List"
     SEARCH = "Search"
+    FACET = "Facet"
 
     INPUT_OBJECT_TYPE = "InputObjectType"
     OBJECT_TYPE = "ObjectType"
@@ -117,6 +125,24 @@ class BuilderQuery(BuilderBase):
     def get_final_resolve(self, kwargs, resolve):
         return self.get_last_element("override_total_resolve", kwargs, resolve)
 
+    def get_approximate_count_threshold(self, kwargs):
+        """
+        The `approximate_count` attr of the interface enables the estimated total for the model,
+        used from `approximate_count_threshold` rows (`APPROXIMATE_COUNT_THRESHOLD` by default).
+        """
+        if not self.get_last_element("approximate_count", kwargs, False):
+            return None
+        return self.get_last_element("approximate_count_threshold", kwargs, cruddals_settings.APPROXIMATE_COUNT_THRESHOLD)
+
+    def get_cost_limits(self, kwargs):
+        """
+        The `max_estimated_rows` and `max_estimated_cost` attrs of the interface reject the queries of the model
+        whose plan is estimated over them (`MAX_ESTIMATED_ROWS` and `MAX_ESTIMATED_COST` by default).
+        """
+        max_estimated_rows = self.get_last_element("max_estimated_rows", kwargs, cruddals_settings.MAX_ESTIMATED_ROWS)
+        max_estimated_cost = self.get_last_element("max_estimated_cost", kwargs, cruddals_settings.MAX_ESTIMATED_COST)
+        return max_estimated_rows, max_estimated_cost
+
     def get_pre_and_post_resolves(self, kwargs):
         pre_default = lambda cls, info, **kwargs : (cls, info, kwargs)
         post_default = lambda cls, info, default_response, **kwargs : default_response
@@ -190,6 +216,7 @@ class BuilderCreate(BuilderMutation):
                 "form_class": self.model_as_form, 
                 "input_fields": arg_for_create_default, 
                 "arguments": extra_arg_for_create,
+                "compiled_validation": self.get_last_element("compiled_validation", attrs_for_build_the_create, cruddals_settings.COMPILED_VALIDATION),
                 "registry": get_global_registry(f"{self.prefix}{self.suffix}")
             }
         )
@@ -216,9 +243,10 @@ class BuilderRead(BuilderQuery):
             final_data = maybe_queryset(self.model_as_object_type.get_queryset(final_data, info))
             if "where" in kwargs.keys():
                 where = kwargs["where"] 
-                obj_q = where_input_to_Q(where)
+                obj_q = where_input_to_Q(where, self.model)
                 final_data = final_data.filter(obj_q)
-                final_data = final_data.distinct()
+                final_data = distinct_if_needed(final_data)
+            final_data = optimize_queryset(final_data, info, self.model_as_object_type)
             return final_data.get()
         
         pre_resolves_read, post_resolves_read = self.get_pre_and_post_resolves(kwargs)
@@ -298,6 +326,7 @@ class BuilderUpdate(BuilderMutation):
                 "form_class": self.model_as_form,
                 "input_fields": arg_for_update_default,
                 "arguments": extra_arg_for_update,
+                "compiled_validation": self.get_last_element("compiled_validation", attrs_for_build_the_update, cruddals_settings.COMPILED_VALIDATION),
                 "registry": get_global_registry(f"{self.prefix}{self.suffix}")
             }
         )
@@ -322,7 +351,7 @@ class BuilderDelete(BuilderMutation):
             final_data:QuerySet = self.model.objects.all()
             if "where" in kwargs.keys():
                 where = kwargs["where"] 
-                obj_q = where_input_to_Q(where)
+                obj_q = where_input_to_Q(where, self.model)
                 final_data = final_data.filter(obj_q)
                 final_data.delete()
                 return dict(success=True)
@@ -388,9 +417,9 @@ class BuilderDeactivate(BuilderMutation):
             final_data:QuerySet = self.model.objects.all()
             if "where" in kwargs.keys():
                 where = kwargs["where"] 
-                obj_q = where_input_to_Q(where)
+                obj_q = where_input_to_Q(where, self.model)
                 final_data = final_data.filter(obj_q)
-                final_data = final_data.distinct()
+                final_data = distinct_if_needed(final_data)
                 final_data = toggle_active_status('DEACTIVATE', final_data, field_for_activate_deactivate)
                 return dict(objects=final_data)
             else:
@@ -456,9 +485,9 @@ class BuilderActivate(BuilderMutation):
             final_data:QuerySet = self.model.objects.all()
             if "where" in kwargs.keys():
                 where = kwargs["where"] 
-                obj_q = where_input_to_Q(where)
+                obj_q = where_input_to_Q(where, self.model)
                 final_data = final_data.filter(obj_q)
-                final_data = final_data.distinct()
+                final_data = distinct_if_needed(final_data)
                 final_data = toggle_active_status('ACTIVATE', final_data, field_for_activate_deactivate)
                 return dict(objects=final_data)
             else:
@@ -518,12 +547,15 @@ class BuilderList(BuilderQuery):
         self.validate_attrs(props, 'override_total_resolve', 'List', name)
 
     def get_fun_resolve_for_list(self, kwargs):
+        approximate_count_threshold = self.get_approximate_count_threshold(kwargs)
+
         def resolve_default(cls, info, **kwargs):
             final_data_to_paginate:QuerySet = self.model.objects.all().order_by("pk")
+            final_data_to_paginate = optimize_queryset(final_data_to_paginate, info, self.model_as_object_type, paginated=True)
             
             paginated = kwargs.get("paginated", {})
 
-            return paginate_queryset(final_data_to_paginate, paginated.get('page_size', 'All'), paginated.get('page', 1), self.paginated_object_type)
+            return paginate_queryset(final_data_to_paginate, paginated.get('page_size', 'All'), paginated.get('page', 1), self.paginated_object_type, after=paginated.get('after'), before=paginated.get('before'), info=info, approximate_count_threshold=approximate_count_threshold)
         
         pre_resolves_list, post_resolves_list = self.get_pre_and_post_resolves(kwargs)
         resolve_model = self.get_last_element('resolve', kwargs, resolve_default)
@@ -531,7 +563,8 @@ class BuilderList(BuilderQuery):
             add_cruddals_model_to_request(info, self)
             for pre_resolve_list in pre_resolves_list:
                 cls, info, kwargs = pre_resolve_list(cls, info, **kwargs)
-            response = resolve_model(cls, info, **kwargs)
+            with track_query_usage(self.model, kwargs):
+                response = resolve_model(cls, info, **kwargs)
             for post_resolve_list in post_resolves_list:
                 response = post_resolve_list(cls, info, response, **kwargs)
             return response
@@ -562,28 +595,58 @@ class BuilderSearch(BuilderQuery):
     def validate_props_search(self, props, name=None):
         self.validate_attrs(props, 'override_total_resolve', 'Search', name)
     
-    def get_fun_resolve_for_search(self, kwargs):
+    def get_text_search(self, kwargs):
+        """
+        The `text_search_fields` attr of the interface enables the `text` argument, searched in the
+        full-text index of those fields with the `text_search_config` of the backend (`TEXT_SEARCH_CONFIG` by default).
+        """
+        # The fields of all the interfaces are indexed together
+        text_search_fields = kwargs.get("text_search_fields", None)
+        if not text_search_fields:
+            return None
+        if isinstance(text_search_fields, str):
+            text_search_fields = [text_search_fields]
+        return register_text_search(self.model, list(dict.fromkeys(text_search_fields)), self.get_last_element("text_search_config", kwargs, None))
+
+    def build_indexed_only_inputs(self, kwargs):
+        """
+        The `indexed_only` attr of the interface builds the where and order_by inputs of the model with only the
+        lookups and sort keys its indexes serve, and those of `allowed_filters`/`allowed_order_by`. The inputs are
+        shared by every field of the model, so they are built before the fields.
+        """
+        if not self.get_last_element("indexed_only", kwargs, False):
+            return
+        allowed_filters = kwargs.get("allowed_filters", [])
+        allowed_order_by = kwargs.get("allowed_order_by", [])
+        meta_attrs = {
+            "indexed_only": True,
+            "allowed_filters": [allowed_filters] if isinstance(allowed_filters, str) else list(allowed_filters),
+            "allowed_order_by": [allowed_order_by] if isinstance(allowed_order_by, str) else list(allowed_order_by),
+        }
+        extra_fields_for_where = kwargs.get("modify_where_argument", {}).get("extra_fields", {})
+        extra_fields_for_order_by = kwargs.get("modify_order_by_argument", {}).get("extra_fields", {})
+        convert_model_to_filter_input_object_type(model=self.model, meta_attrs=meta_attrs, extra_attrs=extra_fields_for_where, prefix_for_name=self.prefix, suffix_for_name=self.suffix)
+        convert_model_to_order_by_input_object_type(model=self.model, meta_attrs=meta_attrs, extra_attrs=extra_fields_for_order_by, prefix_for_name=self.prefix, suffix_for_name=self.suffix)
+
+    def get_fun_resolve_for_search(self, kwargs, text_search=None):
         
+        approximate_count_threshold = self.get_approximate_count_threshold(kwargs)
+        max_estimated_rows, max_estimated_cost = self.get_cost_limits(kwargs)
+
         def resolve_default(cls, info, **kwargs):
             final_data_to_paginate:QuerySet = self.model.objects.all()
-            
-            if "where" in kwargs:
-                where = kwargs["where"] 
-                obj_q = where_input_to_Q(where)
-                final_data_to_paginate = final_data_to_paginate.filter(obj_q)
-            
-            if "order_by" in kwargs or "orderBy" in kwargs:
-                order_by = kwargs.get("order_by") or kwargs.get("orderBy")
-                if isinstance(order_by, dict):
-                    order_by = [order_by]
-                list_for_order = order_by_input_to_args(order_by)
-                final_data_to_paginate = final_data_to_paginate.order_by(*list_for_order)
-            else:
-                final_data_to_paginate = final_data_to_paginate.order_by("pk")
+            final_data_to_paginate = apply_where_and_order_by(final_data_to_paginate, kwargs)
+            if text_search is not None and kwargs.get("text"):
+                order_by_rank = "order_by" not in kwargs and "orderBy" not in kwargs
+                final_data_to_paginate = text_search.search(final_data_to_paginate, kwargs["text"], order_by_rank=order_by_rank)
 
             paginated = kwargs.get("paginated", {})
-            final_data_to_paginate = final_data_to_paginate.distinct()
-            return paginate_queryset(final_data_to_paginate, paginated.get('page_size', 'All'), paginated.get('page', 1), self.paginated_object_type)
+            page_size = guard_query_cost(final_data_to_paginate, kwargs, paginated.get('page_size', 'All'), max_estimated_rows, max_estimated_cost, scope="search")
+            final_data_to_paginate = optimize_queryset(final_data_to_paginate, info, self.model_as_object_type, paginated=True)
+
+            # Only the total of all the rows can be estimated
+            threshold = None if kwargs.get("where") or kwargs.get("text") else approximate_count_threshold
+            return paginate_queryset(final_data_to_paginate, page_size, paginated.get('page', 1), self.paginated_object_type, after=paginated.get('after'), before=paginated.get('before'), info=info, approximate_count_threshold=threshold)
         
         pre_resolves_search, post_resolves_search = self.get_pre_and_post_resolves(kwargs)
         resolve_model = self.get_last_element('resolve', kwargs, resolve_default)
@@ -593,7 +656,8 @@ class BuilderSearch(BuilderQuery):
             for pre_resolve_search in pre_resolves_search:
                 cls, info, kwargs = pre_resolve_search(cls, info, **kwargs)
 
-            response = resolve_model(cls, info, **kwargs)
+            with track_query_usage(self.model, kwargs):
+                response = resolve_model(cls, info, **kwargs)
             
             for post_resolve_search in post_resolves_search:
                 response = post_resolve_search(cls, info, response, **kwargs)
@@ -608,6 +672,8 @@ class BuilderSearch(BuilderQuery):
         where_arg = get_where_arg(model=self.model, kw=kwargs, default_required=False, prefix=self.prefix, suffix=self.suffix)
         order_by_arg = get_order_by_arg(model=self.model, kw=kwargs, prefix=self.prefix, suffix=self.suffix)
         paginated_arg = get_paginated_arg(kw=kwargs)
+        text_search = self.get_text_search(kwargs)
+        text_arg = {"text": graphene.Argument(graphene.String, description="Text searched in the full-text index of the model")} if text_search else {}
         
         search_custom = graphene.Field(
             self.paginated_object_type, 
@@ -616,14 +682,72 @@ class BuilderSearch(BuilderQuery):
                 **where_arg,
                 **order_by_arg,
                 **paginated_arg,
+                **text_arg,
                 **extra_arg_for_search
             }
         )
-        resolve = self.get_fun_resolve_for_search(kwargs)
+        resolve = self.get_fun_resolve_for_search(kwargs, text_search)
         return search_custom, resolve
 
 
-class BuilderCruddalsModel(BuilderCreate, BuilderRead, BuilderUpdate, BuilderDelete, BuilderDeactivate, BuilderActivate, BuilderList, BuilderSearch):
+class BuilderFacet(BuilderQuery):
+
+    def validate_props_facet(self, props, name=None):
+        self.validate_attrs(props, 'override_total_resolve', 'Facet', name)
+
+    def get_fun_resolve_for_facet(self, kwargs):
+
+        buckets_limit = self.get_last_element("buckets_limit", kwargs, cruddals_settings.FACET_BUCKETS_LIMIT)
+
+        def resolve_default(cls, info, **kwargs):
+            queryset:QuerySet = self.model.objects.all()
+            if "where" in kwargs:
+                queryset = queryset.filter(where_input_to_Q(kwargs["where"], self.model))
+            text_search = get_text_search(self.model)
+            if text_search is not None and kwargs.get("text"):
+                queryset = text_search.search(queryset, kwargs["text"], order_by_rank=False)
+            return get_facets(queryset, kwargs["fields"], kwargs.get("limit", buckets_limit), self.model_as_object_type, info)
+
+        pre_resolves_facet, post_resolves_facet = self.get_pre_and_post_resolves(kwargs)
+        resolve_model = self.get_last_element('resolve', kwargs, resolve_default)
+
+        def resolve_facet(cls, info, **kwargs):
+            add_cruddals_model_to_request(info, self)
+            for pre_resolve_facet in pre_resolves_facet:
+                cls, info, kwargs = pre_resolve_facet(cls, info, **kwargs)
+
+            with track_query_usage(self.model, kwargs):
+                response = resolve_model(cls, info, **kwargs)
+
+            for post_resolve_facet in post_resolves_facet:
+                response = post_resolve_facet(cls, info, response, **kwargs)
+            return response
+
+        return self.get_final_resolve(kwargs, resolve_facet)
+
+    def build_facet( self, **kwargs ):
+        extra_arg_for_facet = self.get_extra_arguments(kwargs)
+
+        where_arg = get_where_arg(model=self.model, kw=kwargs, default_required=False, prefix=self.prefix, suffix=self.suffix)
+        # The text search of the model is registered by its search field
+        text_arg = {"text": graphene.Argument(graphene.String, description="Text searched in the full-text index of the model")} if get_text_search(self.model) else {}
+
+        facet_custom = graphene.Field(
+            graphene.NonNull(graphene.List(graphene.NonNull(FieldFacet))),
+            name=f"facet{self.name_plural_camel_case}",
+            args={
+                **where_arg,
+                "fields": graphene.Argument(graphene.List(graphene.NonNull(graphene.String)), required=True, description="The fields to count by value"),
+                "limit": graphene.Argument(graphene.Int, description="The max number of buckets of every field"),
+                **text_arg,
+                **extra_arg_for_facet
+            }
+        )
+        resolve = self.get_fun_resolve_for_facet(kwargs)
+        return facet_custom, resolve
+
+
+class BuilderCruddalsModel(BuilderCreate, BuilderRead, BuilderUpdate, BuilderDelete, BuilderDeactivate, BuilderActivate, BuilderList, BuilderSearch, BuilderFacet):
     """
         C = "Create"
         R = "Read"
@@ -633,6 +757,7 @@ class BuilderCruddalsModel(BuilderCreate, BuilderRead, BuilderUpdate, BuilderDel
         A = "Activate"
         L = "List"
         S = "Search"
+        + Facet
     """
     
     model = None
@@ -650,6 +775,9 @@ class BuilderCruddalsModel(BuilderCreate, BuilderRead, BuilderUpdate, BuilderDel
     paginated_object_type = None
     model_as_form = None
 
+    max_estimated_rows = None
+    max_estimated_cost = None
+
     field_for_read = None
     resolve_field_for_read = None
 
@@ -659,6 +787,9 @@ class BuilderCruddalsModel(BuilderCreate, BuilderRead, BuilderUpdate, BuilderDel
     field_for_list = None
     resolve_field_for_list = None
 
+    field_for_facet = None
+    resolve_field_for_facet = None
+
     mutation_create = None
     mutation_update = None
     mutation_activate = None
@@ -690,12 +821,16 @@ class BuilderCruddalsModel(BuilderCreate, BuilderRead, BuilderUpdate, BuilderDel
             "model_as_input_object_type",
             "paginated_object_type",
             "model_as_form",
+            "max_estimated_rows",
+            "max_estimated_cost",
             "field_for_read",
             "resolve_field_for_read",
             "field_for_search",
             "resolve_field_for_search",
             "field_for_list",
             "resolve_field_for_list",
+            "field_for_facet",
+            "resolve_field_for_facet",
             "mutation_create",
             "mutation_update",
             "mutation_activate",
@@ -753,11 +888,15 @@ class BuilderCruddalsModel(BuilderCreate, BuilderRead, BuilderUpdate, BuilderDel
         self.model_as_input_object_type = convert_model_to_mutation_input_object_type(model=self.model, type_mutation="create_update", meta_attrs=dict_of_interface_attr["MetaInputObjectType"], extra_attrs=dict_of_interface_attr[CruddalsInterfaceNames.INPUT_OBJECT_TYPE.value], prefix_for_name=prefix, suffix_for_name=suffix)        
         self.paginated_object_type = convert_model_to_paginated_object_type(model=self.model, model_as_object_type=self.model_as_object_type, extra_attrs={}, prefix_for_name=prefix, suffix_for_name=suffix)
         self.model_as_form = convert_model_to_model_form(model=self.model, extra_meta_attrs={}, extra_attrs={}, prefix_for_name=prefix, suffix_for_name=suffix)
+        self.build_indexed_only_inputs(dict_of_interface_attr[CruddalsInterfaceNames.SEARCH.value])
+        # The limits of the search guard the paginated fields of the model in other types too
+        self.max_estimated_rows, self.max_estimated_cost = self.get_cost_limits(dict_of_interface_attr[CruddalsInterfaceNames.SEARCH.value])
 
         builders = {
             'Read': self.build_read,
             'Search': self.build_search,
             'List': self.build_list,
+            'Facet': self.build_facet,
             'Create': self.build_create,
             'Update': self.build_update,
             'Activate': self.build_activate,
@@ -767,7 +906,7 @@ class BuilderCruddalsModel(BuilderCreate, BuilderRead, BuilderUpdate, BuilderDel
 
         for prop_name, builder in builders.items():
             built = builder(**dict_of_interface_attr[prop_name])
-            if prop_name in ['Read', 'Search', 'List']:
+            if prop_name in ['Read', 'Search', 'List', 'Facet']:
                 field_name = f"field_for_{prop_name.lower()}"
                 resolve_field_name = f"resolve_{field_name}"
                 setattr(self, field_name, built[0])
@@ -789,6 +928,7 @@ class CruddalsModel(SubclassWithMeta):
     attrs_for_query_read = None
     attrs_for_query_list = None
     attrs_for_query_search = None
+    attrs_for_query_facet = None
     attr_for_mutation_create = None
     attr_for_mutation_update = None
     attr_for_mutation_activate = None
@@ -822,6 +962,7 @@ class CruddalsModel(SubclassWithMeta):
             "attrs_for_query_read",
             "attrs_for_query_list",
             "attrs_for_query_search",
+            "attrs_for_query_facet",
             "attr_for_mutation_create",
             "attr_for_mutation_update",
             "attr_for_mutation_activate",
@@ -841,7 +982,7 @@ class CruddalsModel(SubclassWithMeta):
 
         self.meta = cruddals_of_model
 
-        functions_type_query = ['read', 'list', 'search']
+        functions_type_query = ['read', 'list', 'search', 'facet']
         functions_type_mutation = ['create', 'update', 'activate', 'deactivate', 'delete']
 
         for function in functions_type_query:
@@ -0,0 +1,91 @@
+import os
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations import AddIndex, Migration, RunSQL
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from graphene_django_cruddals_v1.utils.index_advisor import (
+    TRIGRAM,
+    clear_query_usage,
+    get_index_suggestions,
+    get_usage_directory,
+    load_query_usage,
+)
+
+
+class Command(BaseCommand):
+    help = "Propose the indexes missing for the filters and sort keys recorded with `RECORD_QUERY_USAGE`"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="The database whose indexes are checked")
+        parser.add_argument("--directory", default=None, help="The directory of the recorded usage, `QUERY_USAGE_DIR` by default")
+        parser.add_argument("--min-count", type=int, default=1, help="The min number of uses of a column to propose an index for it")
+        parser.add_argument("--write-migrations", action="store_true", help="Write a draft migration with the indexes of every app")
+        parser.add_argument("--clear", action="store_true", help="Delete the recorded usage after reading it")
+
+    def handle(self, *args, **options):
+        directory = options["directory"] or get_usage_directory()
+        usage = load_query_usage(directory)
+        if not usage:
+            self.stdout.write(f"There is no recorded usage in {directory}, enable `RECORD_QUERY_USAGE` to record it")
+            return
+
+        connection = connections[options["database"]]
+        suggestions, not_indexable = get_index_suggestions(usage, connection, min_count=options["min_count"])
+
+        if not suggestions:
+            self.stdout.write(self.style.SUCCESS("Every recorded filter and sort key has an index"))
+        for suggestion in suggestions:
+            self.stdout.write(
+                f"{suggestion.model._meta.label}.{suggestion.field.name} [{', '.join(suggestion.lookups)}]: "
+                f"used {suggestion.count} times, {suggestion.avg_ms:.1f} ms avg, {suggestion.max_ms:.1f} ms max"
+            )
+            self.stdout.write(f"    {suggestion.get_index_definition()}")
+        for row in not_indexable:
+            self.stdout.write(self.style.WARNING(f"No index can serve {row['model']}: {row['path']} [{row['lookup']}] on {connection.vendor}"))
+
+        if options["write_migrations"] and suggestions:
+            self.write_migrations(suggestions, connection)
+        if options["clear"]:
+            clear_query_usage(directory)
+
+    def write_migrations(self, suggestions, connection):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        suggestions_by_app = {}
+        for suggestion in suggestions:
+            suggestions_by_app.setdefault(suggestion.model._meta.app_label, []).append(suggestion)
+
+        for app_label, app_suggestions in suggestions_by_app.items():
+            if app_label not in loader.migrated_apps:
+                self.stdout.write(self.style.WARNING(f"The app {app_label} has no migrations, its indexes are not written"))
+                continue
+            leaf_nodes = loader.graph.leaf_nodes(app_label)
+            numbers = [int(match.group()) for match in (re.match(r"\d+", name) for _, name in leaf_nodes) if match]
+            migration = Migration(f"{max(numbers, default=0) + 1:04d}_cruddals_indexes", app_label)
+            migration.dependencies = leaf_nodes
+
+            operations = []
+            if any(suggestion.kind == TRIGRAM for suggestion in app_suggestions):
+                from django.contrib.postgres.operations import TrigramExtension
+
+                operations.append(TrigramExtension())
+            for suggestion in app_suggestions:
+                index = suggestion.get_index()
+                if index is not None:
+                    operations.append(AddIndex(model_name=suggestion.model._meta.model_name, index=index))
+                else:
+                    operations.append(RunSQL(suggestion.get_create_sql(connection), reverse_sql=suggestion.get_drop_sql(connection)))
+            migration.operations = operations
+
+            writer = MigrationWriter(migration)
+            if os.path.exists(writer.path):
+                self.stdout.write(self.style.WARNING(f"{writer.path} already exists, it is not overwritten"))
+                continue
+            with open(writer.path, "w", encoding="utf-8") as file:
+                file.write(writer.as_string())
+            self.stdout.write(self.style.SUCCESS(f"Wrote {writer.path}"))
+            # The autodetector would remove an index that isn't in the Meta of its model
+            self.stdout.write("    Add the `models.Index` of the migration to `Meta.indexes` of the models")
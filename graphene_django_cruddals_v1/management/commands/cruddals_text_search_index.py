@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import get_resolver
+
+from graphene_django_cruddals_v1.utils.text_search import get_text_searches
+
+
+class Command(BaseCommand):
+    help = "Build the full-text search indexes of the models with `text_search_fields` in their Search interface"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="The database where the indexes are built")
+        parser.add_argument("--rebuild", action="store_true", help="Drop the indexes and build them again")
+
+    def handle(self, *args, **options):
+        # The schemas of CRUDDALS are built with the urls, and with them the text searches of the models
+        get_resolver().url_patterns
+
+        text_searches = get_text_searches()
+        if not text_searches:
+            self.stdout.write("There are no models with `text_search_fields`")
+            return
+
+        for text_search in text_searches:
+            label = text_search.model._meta.label
+            if text_search.build_index(options["database"], rebuild=options["rebuild"]):
+                self.stdout.write(self.style.SUCCESS(f"Built the full-text index of {label}"))
+            else:
+                self.stdout.write(self.style.WARNING(f"The database has no full-text index for {label}, the text is searched with icontains"))
@@ -31,6 +31,7 @@ class RegistryGlobal:
                 "input_object_type_for_create": ClassMyModelCreateInputObjectType,
                 "input_object_type_for_update": ClassMyModelUpdateInputObjectType,
                 "input_object_type_for_filter": ClassMyModelFilterInputObjectType,
+                "input_object_type_for_indexed_filter": ClassMyModelIndexedFilterInputObjectType,
                 "input_object_type_for_order_by": ClassMyModelOrderInputObjectType,
                 "input_object_type_for_connect_disconnect": ClassMyModelConnectDisconnectInputObjectType,
                 "cruddals": ClassMyModelCRUDDALS,
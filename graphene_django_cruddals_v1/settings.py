@@ -19,6 +19,33 @@ DEFAULTS = {
     "ACTIVE_INACTIVE_STATE_CONTROLLER_FIELD": "is_active", #TODO: Mejorar esto para que sea mas automático y responsabilidad de cruddals
     "INTERFACES": [],
     "SETTINGS_FOR_APP": {},
+    "OPTIMIZE_QUERIES": True,
+    "BATCH_PAGINATED_FIELDS": True,
+    "DEFER_UNREQUESTED_FIELDS": True,
+    "COUNT_TOTAL_WITH_WINDOW": False,
+    "APPROXIMATE_COUNT_THRESHOLD": 1000000,
+    # The rows of the page size 'All' read per chunk by a view with `stream_response`, the completed result is
+    # still built whole by the execution, only the reads from the database and the JSON written are chunked
+    "STREAMING_CHUNK_SIZE": 2000,
+    "MAX_ROWS_FOR_PAGE_SIZE_ALL": None,
+    "USE_EXISTS_FOR_TO_MANY_FILTERS": True,
+    "LARGE_IN_LIST_THRESHOLD": 1000,
+    "TEXT_SEARCH_CONFIG": "simple",
+    "TEXT_SEARCH_TABLE_CHECK_INTERVAL": 60,
+    "FACET_BUCKETS_LIMIT": 100,
+    "FACETS_WITH_GROUPING_SETS": True,
+    "RECORD_QUERY_USAGE": False,
+    "QUERY_USAGE_DIR": None,
+    "QUERY_USAGE_FLUSH_INTERVAL": 60,
+    "MAX_ESTIMATED_ROWS": None,
+    "MAX_ESTIMATED_COST": None,
+    "COST_GUARD_ACTION": "reject",
+    "COST_GUARD_PAGE_SIZE": 100,
+    "COST_GUARD_CACHE_TIMEOUT": 300,
+    "BULK_CREATE_MUTATIONS": True,
+    "BULK_CREATE_BATCH_SIZE": 1000,
+    "COMPILED_VALIDATION": False,
+    "M2M_CHANGED_SIGNALS": True,
 
     # {
     #     "app_name": {
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Aggregates of the numeric and date fields of the rows of a paginated field.
+
+The `aggregates` field of a paginated type computes `Count`, and the `Sum`/`Avg`/`Min`/`Max` of the
+fields, over all the rows that match the `where` of the field (not only the rows of the page), with a
+single `aggregate()` call that has only the aggregates selected in the query.
+"""
+from django.db.models import (
+    AutoField,
+    Avg,
+    BigAutoField,
+    BigIntegerField,
+    Count,
+    DateField,
+    DateTimeField,
+    DecimalField,
+    FloatField,
+    IntegerField,
+    Max,
+    Min,
+    QuerySet,
+    SmallAutoField,
+    Sum,
+    TimeField,
+)
+from graphene.utils.str_converters import to_camel_case
+from graphql import get_named_type
+
+from ..helpers.helpers import (
+    BigIntAggregates,
+    DateAggregates,
+    DateTimeAggregates,
+    DecimalAggregates,
+    FloatAggregates,
+    IntAggregates,
+    TimeAggregates,
+)
+
+
+AGGREGATE_FUNCTIONS = {"sum": Sum, "avg": Avg, "min": Min, "max": Max}
+
+
+def get_aggregates_type_for_field(field):
+    """Return the type with the aggregates of `field`, None if it can't be aggregated"""
+    if isinstance(field, (AutoField, BigAutoField, SmallAutoField)) or field.is_relation or field.choices:
+        return None
+    if isinstance(field, BigIntegerField):
+        return BigIntAggregates
+    if isinstance(field, IntegerField):
+        return IntAggregates
+    if isinstance(field, FloatField):
+        return FloatAggregates
+    if isinstance(field, DecimalField):
+        return DecimalAggregates
+    # A DateTimeField is a DateField too
+    if isinstance(field, DateTimeField):
+        return DateTimeAggregates
+    if isinstance(field, DateField):
+        return DateAggregates
+    if isinstance(field, TimeField):
+        return TimeAggregates
+    return None
+
+
+def get_aggregatable_fields(model, object_type=None):
+    """Return the fields of `model` that can be aggregated, by name, only those of `object_type` when it's given"""
+    return {
+        field.name: field
+        for field in model._meta.concrete_fields
+        if field.name != "count" and get_aggregates_type_for_field(field) is not None
+        and (object_type is None or field.name in object_type._meta.fields)
+    }
+
+
+class QuerysetAggregates:
+    """
+    The aggregates of the rows of a paginated field, computed when the `aggregates` field is resolved.
+
+    :param queryset: The filtered queryset, or a function that returns it for the fields whose page
+        was loaded without it (e.g. by a prefetch or a batch).
+    """
+
+    def __init__(self, queryset):
+        self._queryset = queryset
+
+    def get_queryset(self):
+        queryset = self._queryset() if callable(self._queryset) else self._queryset
+        return queryset.order_by() if isinstance(queryset, QuerySet) else None
+
+    def resolve(self, info):
+        from .query_optimizer import get_selected_field_nodes
+        from .utils import has_multivalued_joins
+
+        queryset = self.get_queryset()
+        if queryset is None:
+            return None
+        # Only the fields of the aggregates type, those of the object type of the model
+        type_fields = get_named_type(info.return_type).fields
+        fields_by_graphql_name = {to_camel_case(name): name for name in get_aggregatable_fields(queryset.model) if to_camel_case(name) in type_fields}
+
+        expressions = {}
+        for field_node in info.field_nodes:
+            for sub_field_node in get_selected_field_nodes(field_node.selection_set, info):
+                name = sub_field_node.name.value
+                if name == "count":
+                    expressions["count"] = Count("pk")
+                elif name in fields_by_graphql_name:
+                    field_name = fields_by_graphql_name[name]
+                    for function_node in get_selected_field_nodes(sub_field_node.selection_set, info):
+                        function = function_node.name.value
+                        if function in AGGREGATE_FUNCTIONS:
+                            expressions[f"{field_name}__{function}"] = AGGREGATE_FUNCTIONS[function](field_name)
+
+        if not expressions:
+            return {}
+        if has_multivalued_joins(queryset):
+            # The JOINs of the where repeat the rows, so they are aggregated once by pk
+            queryset = queryset.model._base_manager.filter(pk__in=queryset.values("pk"))
+        values = queryset.aggregate(**expressions)
+
+        result = {"count": values.get("count", None)}
+        for key, value in values.items():
+            if key != "count":
+                field_name, function = key.rsplit("__", 1)
+                result.setdefault(field_name, {})[function] = value
+        return result
@@ -0,0 +1,666 @@
+# -*- coding: utf-8 -*-
+"""
+Batched engine of the create and update mutations.
+
+The items of the input of a mutation without nested relation objects (only the ids of their relations)
+are validated first, all of them, and then saved:
+
+    - the items that create an object are inserted with `bulk_create` in batches of
+      `BULK_CREATE_BATCH_SIZE`, with the links of their many-to-many fields inserted in the through
+      tables in bulk
+    - the items that update an object are saved one by one with their validated form, and their
+      many-to-many fields with one query for the current rows of the through table, one
+      `bulk_create(ignore_conflicts=True)` for the new links and one `DELETE ... IN` for the old ones,
+      instead of loading the related objects of every instance as `set()`
+    - the other items (nested objects, reverse relations, files) are validated and saved one by one as
+      before, by `mutate_item`
+
+The items are saved in the order of the input: the runs of consecutive plain items are validated and saved
+together, after the other items before them, so the same item wins a unique value as with the saves one by one.
+
+The uniqueness of the validated items is checked for all of them at once, with one `IN` query per unique
+constraint instead of one query per constraint and item, and an item that repeats the unique values of a
+previous item of the input gets the same error as if the previous one was already saved. The objects of
+the ids of their foreign keys and many-to-many fields are loaded with one `in_bulk` per related queryset,
+and the `ModelChoiceField`/`ModelMultipleChoiceField` of their forms find them there instead of running
+a query per item.
+
+`bulk_create` doesn't call `save()`, so the models that override it are always saved one by one, and
+the `pre_save`/`post_save`/`m2m_changed` signals are sent for every row when they have receivers
+(`m2m_changed` only with `M2M_CHANGED_SIGNALS`). The
+pks of the new rows are needed for the payload and the many-to-many links, so the items are inserted in
+bulk only on the databases that return them (PostgreSQL, or any with Django 4.0+ and recent SQLite/
+MariaDB) or when the pk has a default (e.g. a `UUIDField(default=uuid4)`).
+"""
+import copy
+from contextlib import contextmanager
+from itertools import chain, groupby
+
+from django.core.exceptions import NON_FIELD_ERRORS, FieldDoesNotExist, ValidationError
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import ForeignKey, ManyToManyField, Model
+from django.forms.models import BaseModelForm, ModelChoiceField, ModelMultipleChoiceField
+from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.db.models.fields.files import FileField
+import graphene
+
+from ..copy_graphene_django.constants import MUTATION_ERRORS_FLAG
+from ..copy_graphene_django.types import ErrorsType, ErrorType
+from ..settings import cruddals_settings
+from .compiled_validation import CompiledForm, get_compiled_validator
+
+
+def can_bulk_create_model(model):
+    if model.save is not Model.save or model._meta.parents:
+        # `bulk_create` skips `save()` and can't insert the rows of a multi-table inheritance
+        return False
+    if model._meta.pk.has_default():
+        return True
+    connection = connections[router.db_for_write(model)]
+    return connection.features.can_return_rows_from_bulk_insert
+
+
+def is_nested_value(value):
+    if isinstance(value, dict):
+        return True
+    return isinstance(value, (list, tuple)) and any(isinstance(element, dict) for element in value)
+
+
+def is_plain_item(model, item):
+    """If `item` only has values and ids of relations, without nested objects, reverse relations or files"""
+    from .utils import get_model_fields_map
+
+    fields = get_model_fields_map(model)
+    for name, value in item.items():
+        field = fields.get(name, None)
+        if field is None:
+            continue
+        if field.is_relation and not field.concrete:
+            # The reverse relations are saved after the object
+            return False
+        if is_nested_value(value):
+            return False
+        if isinstance(field, FileField) and value is not None and not isinstance(value, str):
+            return False
+    return True
+
+
+class NestedRelationsFailed(Exception):
+    """A nested object or an item of the plan of the nested relations failed"""
+
+
+def get_nested_direct_relations(model, item, registry):
+    """
+    Return `{name: (field, inputs)}` of the foreign keys and many-to-many fields of `item` with new nested
+    objects, None if it has nested values that the plan doesn't handle (connect/disconnect, updates of the
+    nested objects, many-to-many fields of an update).
+    """
+    from .utils import get_model_fields_map, get_mutations_for_model
+
+    fields = get_model_fields_map(model)
+    relations = {}
+    for name, value in item.items():
+        field = fields.get(name, None)
+        if field is None or not field.is_relation or not field.concrete or not is_nested_value(value):
+            continue
+        related_model = field.related_model
+        registries = registry.get_registry_for_model(related_model) or {}
+        input_object_type_for_connect_disconnect = registries.get("input_object_type_for_connect_disconnect", None)
+        inputs = list(value) if isinstance(value, (list, tuple)) else [value]
+        if not all(isinstance(input, graphene.InputObjectType) for input in inputs):
+            return None
+        if input_object_type_for_connect_disconnect and any(isinstance(input, input_object_type_for_connect_disconnect) for input in inputs):
+            return None
+        if any(related_model._meta.pk.name in input for input in inputs):
+            return None
+        if field.many_to_many and item.get("id", None):
+            # The objects of an update are added to its current objects
+            return None
+        if not get_mutations_for_model(related_model, registry):
+            return None
+        relations[name] = (field, inputs)
+    return relations
+
+
+def create_nested_direct_relations(registry, root, info, items, relations_by_position):
+    """
+    Create the nested objects of `relations_by_position` with one nested mutation per related model, and
+    return copies of their items with the pks of the objects.
+    """
+    from .utils import get_mutations_for_model
+
+    entries_by_model = {}
+    planned_items = {}
+    for position, relations in relations_by_position.items():
+        planned_items[position] = dict(items[position])
+        for name, (field, inputs) in relations.items():
+            if field.many_to_many:
+                planned_items[position][name] = []
+            for input in inputs:
+                entries_by_model.setdefault(field.related_model, []).append((position, name, field, input))
+
+    for related_model, entries in entries_by_model.items():
+        mutation_for_create, _ = get_mutations_for_model(related_model, registry)
+        # The nested mutation replaces the nested objects of its inputs, the items are saved again from the originals if the plan fails
+        response = mutation_for_create.mutate_and_get_payload(root, info, [copy.deepcopy(input) for *_, input in entries])
+        objects = response.objects or []
+        if response.errors or len(objects) != len(entries):
+            raise NestedRelationsFailed()
+        for (position, name, field, _), obj in zip(entries, objects):
+            if field.many_to_many:
+                planned_items[position][name].append(obj.pk)
+            else:
+                planned_items[position][name] = obj.pk
+    return planned_items
+
+
+def defer_validate_unique(form):
+    """Skip the unique queries of the form, `validate_unique_batch` runs them for all the forms of the input"""
+    if type(form).validate_unique is BaseModelForm.validate_unique:
+        form.validate_unique = lambda: None
+        return True
+    return False
+
+
+def get_unique_lookup(instance, unique_check, connection):
+    """The values of `unique_check` of `instance`, None if the check is skipped as in `Model._perform_unique_checks`"""
+    values = []
+    for field_name in unique_check:
+        field = instance._meta.get_field(field_name)
+        value = getattr(instance, field.attname)
+        if value is None or (value == "" and connection.features.interprets_empty_strings_as_nulls):
+            return None
+        if field.primary_key and not instance._state.adding:
+            return None
+        values.append(value)
+    return tuple(values)
+
+
+def get_existing_unique_lookups(model_class, unique_check, lookups):
+    """Return `{values: pks}` of the rows of `model_class` that have any of `lookups`, one query per batch"""
+    existing = {}
+    lookups = list(set(lookups))
+    batch_size = cruddals_settings.BULK_CREATE_BATCH_SIZE
+    for start in range(0, len(lookups), batch_size):
+        batch = lookups[start:start + batch_size]
+        filters = {f"{field_name}__in": {lookup[i] for lookup in batch} for i, field_name in enumerate(unique_check)}
+        queryset = model_class._default_manager.filter(**filters).values_list("pk", *unique_check)
+        for pk, *values in queryset:
+            existing.setdefault(tuple(values), set()).add(pk)
+    return existing
+
+
+def validate_unique_batch(model, forms):
+    """
+    Validate the uniqueness of the instances of `forms`, the forms of the items of the input by their position,
+    as `ModelForm.validate_unique` but with one query per unique constraint for all of them.
+
+    The items are validated as if they were saved one by one in the order of the input: a row that has the
+    values of an item doesn't conflict with it when a previous valid item of the input changes them.
+    """
+    connection = connections[router.db_for_read(model)]
+    checks_by_position = {}
+    lookups_by_check = {}
+    for position, form in forms.items():
+        unique_checks, date_checks = form.instance._get_unique_checks(exclude=form._get_validation_exclusions())
+        checks_by_position[position] = (unique_checks, date_checks)
+        for model_class, unique_check in unique_checks:
+            lookup = get_unique_lookup(form.instance, unique_check, connection)
+            if lookup is not None:
+                lookups_by_check.setdefault((model_class, tuple(unique_check)), []).append(lookup)
+
+    existing_by_check = {
+        check: get_existing_unique_lookups(check[0], check[1], lookups)
+        for check, lookups in lookups_by_check.items()
+    }
+
+    # The unique values of the items already valid, as if they were saved in the order of the input
+    seen_by_check = {check: {} for check in lookups_by_check}
+    # and the new values of the rows they update
+    saved_by_check = {check: {} for check in lookups_by_check}
+    for position in sorted(forms):
+        form = forms[position]
+        instance = form.instance
+        unique_checks, date_checks = checks_by_position[position]
+        errors = {}
+        lookups = {}
+        for model_class, unique_check in unique_checks:
+            check = (model_class, tuple(unique_check))
+            lookup = get_unique_lookup(instance, unique_check, connection)
+            if lookup is None:
+                continue
+            lookups[check] = lookup
+            # The rows changed by a previous item don't have these values anymore
+            pks = {pk for pk in existing_by_check[check].get(lookup, ()) if saved_by_check[check].get(pk, lookup) == lookup}
+            seen_pk = seen_by_check[check].get(lookup, None)
+            if seen_pk is not None:
+                pks.add(seen_pk)
+            if not instance._state.adding:
+                pks.discard(instance.pk)
+            if pks:
+                key = unique_check[0] if len(unique_check) == 1 else NON_FIELD_ERRORS
+                errors.setdefault(key, []).append(instance.unique_error_message(model_class, unique_check))
+        for key, messages in instance._perform_date_checks(date_checks).items():
+            errors.setdefault(key, []).extend(messages)
+        if errors:
+            form._update_errors(ValidationError(errors))
+        if not form.errors:
+            for check, lookup in lookups.items():
+                seen_by_check[check].setdefault(lookup, instance.pk if instance.pk is not None else object())
+            if not instance._state.adding:
+                for model_class, unique_check in unique_checks:
+                    check = (model_class, tuple(unique_check))
+                    if check in saved_by_check and not any(instance._meta.get_field(name).primary_key for name in unique_check):
+                        saved_by_check[check][instance.pk] = lookups.get(check, None)
+
+
+def to_choice_key(key_field, value):
+    """The value of a choice as the key of its object, None if it isn't valid for the key field"""
+    if isinstance(value, key_field.model):
+        value = getattr(value, key_field.attname)
+    try:
+        return key_field.to_python(value)
+    except (ValidationError, ValueError, TypeError):
+        return None
+
+
+def get_choice_values(form, name, field):
+    value = field.widget.value_from_datadict(form.data, form.files, form.add_prefix(name))
+    values = value if isinstance(value, (list, tuple)) else [value]
+    try:
+        return [value for value in values if value not in field.empty_values]
+    except TypeError:
+        return []
+
+
+def serve_choice_field(field, key_field, objects):
+    """Make the form field `field` find its objects in `objects`, the prefetched objects by the str of their key"""
+    if isinstance(field, ModelMultipleChoiceField):
+        def check_values(value):
+            try:
+                value = list(dict.fromkeys(value))
+            except TypeError:
+                raise ValidationError(field.error_messages["invalid_list"], code="invalid_list")
+            for pk in value:
+                if to_choice_key(key_field, pk) is None:
+                    raise ValidationError(field.error_messages["invalid_pk_value"], code="invalid_pk_value", params={"pk": pk})
+            for pk in value:
+                if str(pk) not in objects:
+                    raise ValidationError(field.error_messages["invalid_choice"], code="invalid_choice", params={"value": pk})
+            return [objects[str(pk)] for pk in value]
+
+        field._check_values = check_values
+    else:
+        def to_python(value):
+            if value in field.empty_values:
+                return None
+            key = to_choice_key(key_field, value)
+            if key is None or str(key) not in objects:
+                raise ValidationError(field.error_messages["invalid_choice"], code="invalid_choice")
+            return objects[str(key)]
+
+        field.to_python = to_python
+
+
+def prefetch_choices(forms):
+    """
+    Load the objects of the ids of the `ModelChoiceField`/`ModelMultipleChoiceField` of `forms`, with one
+    `in_bulk` per related queryset, and serve the form fields from them.
+
+    :return: The names of the foreign keys served of every form.
+    """
+    querysets = {}
+    values_by_queryset = {}
+    fields_by_queryset = {}
+    queryset_key_by_field = {}
+    for form in forms:
+        for name, field in form.fields.items():
+            if not isinstance(field, ModelChoiceField):
+                continue
+            if (type(form), name) not in queryset_key_by_field:
+                queryset = field.queryset
+                try:
+                    key_field = queryset.model._meta.get_field(field.to_field_name) if field.to_field_name else queryset.model._meta.pk
+                    queryset_key = (queryset.model, key_field.name, str(queryset.query)) if not queryset.query.is_sliced else None
+                except Exception:
+                    # e.g. `EmptyResultSet` of a `none()` queryset, the field runs its own query
+                    key_field, queryset_key = None, None
+                queryset_key_by_field[(type(form), name)] = (key_field, queryset_key)
+                if queryset_key is not None:
+                    querysets.setdefault(queryset_key, queryset)
+            key_field, queryset_key = queryset_key_by_field[(type(form), name)]
+            if queryset_key is None:
+                continue
+            values = values_by_queryset.setdefault(queryset_key, set())
+            for value in get_choice_values(form, name, field):
+                key = to_choice_key(key_field, value)
+                if key is not None:
+                    values.add(key)
+            fields_by_queryset.setdefault(queryset_key, []).append((form, name, field, key_field))
+
+    served_foreign_keys = {form: [] for form in forms}
+    for queryset_key, fields in fields_by_queryset.items():
+        values = values_by_queryset[queryset_key]
+        objects = querysets[queryset_key].in_bulk(list(values), field_name=queryset_key[1]) if values else {}
+        objects = {str(key): obj for key, obj in objects.items()}
+        served_fields = set()
+        for form, name, field, key_field in fields:
+            if id(field) not in served_fields:
+                # The compiled forms of a batch share their fields
+                served_fields.add(id(field))
+                serve_choice_field(field, key_field, objects)
+            try:
+                if isinstance(form._meta.model._meta.get_field(name), ForeignKey):
+                    served_foreign_keys[form].append(name)
+            except FieldDoesNotExist:
+                pass
+    return served_foreign_keys
+
+
+@contextmanager
+def skip_foreign_key_validation(instance, names):
+    """
+    Exclude the foreign keys of `names` from the validation of the model `instance`, their form fields already
+    found their objects in a queryset of the related model and `ForeignKey.validate` would query it again.
+    """
+    if not names:
+        yield
+        return
+    full_clean = instance.full_clean
+
+    def full_clean_without_foreign_keys(exclude=None, validate_unique=True):
+        return full_clean(exclude=[*(exclude or []), *names], validate_unique=validate_unique)
+
+    instance.full_clean = full_clean_without_foreign_keys
+    try:
+        yield
+    finally:
+        del instance.full_clean
+
+
+def builds_own_forms(cls):
+    """If the mutation overrides `get_form` or `get_form_kwargs`, so its forms can't be built by a `CompiledValidator`"""
+    from .utils import DjangoModelFormMutation
+
+    return any(getattr(cls, name).__func__ is not getattr(DjangoModelFormMutation, name).__func__ for name in ("get_form", "get_form_kwargs"))
+
+
+def validate_forms(cls, root, info, items, positions):
+    """
+    Build and validate the forms of the items of `positions`.
+
+    :return: A tuple with the valid forms and the `ErrorsType` of the invalid ones, by position.
+    """
+    validator = None
+    if cls._meta.compiled_validation and not builds_own_forms(cls):
+        validator = get_compiled_validator(cls._meta.form_class)
+    if validator is not None:
+        forms = validator.get_forms({position: items[position] for position in positions})
+    else:
+        forms = {position: cls.get_form(root, info, items[position]) for position in positions}
+    forms_to_validate_unique = {position: form for position, form in forms.items() if defer_validate_unique(form)}
+    served_foreign_keys = prefetch_choices(list(forms.values()))
+    for form in forms.values():
+        with skip_foreign_key_validation(form.instance, served_foreign_keys[form]):
+            form.full_clean()
+    validate_unique_batch(cls._meta.model, forms_to_validate_unique)
+
+    valid_forms = {}
+    errors_by_position = {}
+    for position, form in forms.items():
+        if form.is_valid():
+            valid_forms[position] = form
+        else:
+            errors_by_position[position] = [ErrorsType.from_errors(position, ErrorType.from_errors(form.errors))]
+            if info and info.context:
+                setattr(info.context, MUTATION_ERRORS_FLAG, True)
+    return valid_forms, errors_by_position
+
+
+def can_bulk_add_m2m(field):
+    through = field.remote_field.through
+    if not through._meta.auto_created or type(field).save_form_data is not ManyToManyField.save_form_data:
+        return False
+    # A symmetrical relation to the same model has the rows of both directions
+    return not (field.remote_field.symmetrical and field.related_model == field.model)
+
+
+def get_m2m_attnames(field):
+    """The attnames of the columns of the through table of `field` to its model and to its related model"""
+    through = field.remote_field.through
+    return through._meta.get_field(field.m2m_field_name()).attname, through._meta.get_field(field.m2m_reverse_field_name()).attname
+
+
+def get_m2m_links(field, source_values, using=None):
+    """
+    Return `{source value: {target value: pk of the row}}` of the rows of the through table of `field` of the
+    objects of `source_values`, with one query per batch. The related objects are the ones of the default
+    manager of the related model, as the related manager reads them.
+    """
+    through = field.remote_field.through
+    source_attname, target_attname = get_m2m_attnames(field)
+    related_objects = field.related_model._default_manager.values(field.m2m_reverse_target_field_name())
+    queryset = through._default_manager.using(using).filter(**{f"{target_attname}__in": related_objects})
+    source_values = list(dict.fromkeys(source_values))
+    links = {source_value: {} for source_value in source_values}
+    batch_size = cruddals_settings.BULK_CREATE_BATCH_SIZE
+    for start in range(0, len(source_values), batch_size):
+        rows = queryset.filter(**{f"{source_attname}__in": source_values[start:start + batch_size]}).values_list("pk", source_attname, target_attname)
+        for pk, source_value, target_value in rows:
+            links.setdefault(source_value, {})[target_value] = pk
+    return links
+
+
+def bulk_set_m2m(field, links, using, created=False):
+    """
+    Write the rows of the through table of `field` so every instance is linked with exactly its related objects,
+    with one query for the current rows, one `bulk_create(ignore_conflicts=True)` for the new ones and one
+    `DELETE ... IN` for the old ones (per batch of the database). `m2m_changed` is sent as by `set()` when it
+    has receivers and `M2M_CHANGED_SIGNALS` is on.
+
+    :param links: A list of `(instance, related objects)`.
+    :param created: If the instances are new, so they have no rows to read.
+    """
+    through = field.remote_field.through
+    connection = connections[using]
+    source_attname, target_attname = get_m2m_attnames(field)
+    source_target_field = field.m2m_target_field_name()
+    target_target_field = field.m2m_reverse_target_field_name()
+    send_signals = cruddals_settings.M2M_CHANGED_SIGNALS and m2m_changed.has_listeners(through)
+
+    targets_by_instance = [
+        (instance, getattr(instance, source_target_field), list(dict.fromkeys(getattr(related_object, target_target_field) for related_object in related_objects)))
+        for instance, related_objects in links
+    ]
+    current_links = {} if created else get_m2m_links(field, [source_value for _, source_value, _ in targets_by_instance], using)
+    removed_by_instance = []
+    added_by_instance = []
+    for instance, source_value, target_values in targets_by_instance:
+        current_targets = current_links.get(source_value, {})
+        target_set = set(target_values)
+        removed = {target_value: pk for target_value, pk in current_targets.items() if target_value not in target_set}
+        added = [target_value for target_value in target_values if target_value not in current_targets]
+        if removed:
+            removed_by_instance.append((instance, removed))
+        if added:
+            added_by_instance.append((instance, source_value, added))
+
+    def send(action, instance, pk_set):
+        m2m_changed.send(sender=through, action=action, instance=instance, reverse=False, model=field.related_model, pk_set=set(pk_set), using=using)
+
+    if removed_by_instance:
+        if send_signals:
+            for instance, removed in removed_by_instance:
+                send("pre_remove", instance, removed)
+        pks = [pk for _, removed in removed_by_instance for pk in removed.values()]
+        batch_size = connection.ops.bulk_batch_size(["pk"], pks) or len(pks)
+        for start in range(0, len(pks), batch_size):
+            through._default_manager.using(using).filter(pk__in=pks[start:start + batch_size]).delete()
+        if send_signals:
+            for instance, removed in removed_by_instance:
+                send("post_remove", instance, removed)
+
+    if added_by_instance:
+        if send_signals:
+            for instance, _, added in added_by_instance:
+                send("pre_add", instance, added)
+        rows = [through(**{source_attname: source_value, target_attname: target_value}) for _, source_value, added in added_by_instance for target_value in added]
+        through._default_manager.using(using).bulk_create(
+            rows, batch_size=cruddals_settings.BULK_CREATE_BATCH_SIZE, ignore_conflicts=connection.features.supports_ignore_conflicts,
+        )
+        if send_signals:
+            for instance, _, added in added_by_instance:
+                send("post_add", instance, added)
+
+
+def save_m2m(forms, using, created=False):
+    """Save the many-to-many fields of `forms` as `ModelForm._save_m2m`, with the rows of the through tables written in bulk"""
+    links_by_field = {}
+    for form in forms:
+        instance = form.instance
+        opts = form._meta
+        for field in chain(instance._meta.many_to_many, instance._meta.private_fields):
+            if not hasattr(field, "save_form_data") or field.name not in form.cleaned_data:
+                continue
+            if (opts.fields and field.name not in opts.fields) or (opts.exclude and field.name in opts.exclude):
+                continue
+            if field.many_to_many and can_bulk_add_m2m(field):
+                links_by_field.setdefault(field, []).append((instance, form.cleaned_data[field.name]))
+            else:
+                field.save_form_data(instance, form.cleaned_data[field.name])
+    for field, links in links_by_field.items():
+        bulk_set_m2m(field, links, using, created=created)
+
+
+def save_form(form):
+    """Save the instance of the valid `form` and its many-to-many fields with `save_m2m`"""
+    if type(form).save not in (BaseModelForm.save, CompiledForm.save):
+        return form.save()
+    instance = form.instance
+    instance.save()
+    save_m2m([form], router.db_for_write(type(instance), instance=instance))
+    return instance
+
+
+def bulk_insert(model, forms, using):
+    """Insert the instances of the valid `forms` and the links of their many-to-many fields"""
+    instances = [form.instance for form in forms]
+    if pre_save.has_listeners(model):
+        for instance in instances:
+            pre_save.send(sender=model, instance=instance, raw=False, using=using, update_fields=None)
+    model._default_manager.using(using).bulk_create(instances, batch_size=cruddals_settings.BULK_CREATE_BATCH_SIZE)
+    save_m2m(forms, using, created=True)
+
+    if post_save.has_listeners(model):
+        for instance in instances:
+            post_save.send(sender=model, instance=instance, created=True, update_fields=None, raw=False, using=using)
+    for instance in instances:
+        instance._state.adding = False
+        instance._state.db = using
+
+
+def save_plain_items(cls, root, info, items, positions, registry):
+    """
+    Save the plain items of `positions`, consecutive in the input, validating together and inserting in bulk the ones that can be.
+
+    :return: A tuple with the instances saved and the lists of `ErrorsType`, by position.
+    """
+    model = cls._meta.model
+    valid_forms, errors_by_position = validate_forms(cls, root, info, items, positions)
+    instances_by_position = {}
+
+    forms_to_bulk_create = {}
+    if can_bulk_create_model(model):
+        forms_to_bulk_create = {position: form for position, form in valid_forms.items() if form.instance._state.adding}
+    if len(forms_to_bulk_create) < 2:
+        forms_to_bulk_create = {}
+    if forms_to_bulk_create:
+        using = router.db_for_write(model)
+        try:
+            with transaction.atomic(using=using):
+                bulk_insert(model, list(forms_to_bulk_create.values()), using)
+            instances_by_position.update({position: form.instance for position, form in forms_to_bulk_create.items()})
+        except IntegrityError:
+            # A row conflicts with one saved after the validation, every item is saved alone to find it
+            for position in forms_to_bulk_create:
+                valid_forms[position] = None
+
+    for position in positions:
+        if position in instances_by_position or position in errors_by_position:
+            continue
+        instance, errors = cls.mutate_item(root, info, items[position], position, registry, form=valid_forms.get(position, None))
+        if instance is not None:
+            instances_by_position[position] = instance
+        if errors:
+            errors_by_position[position] = errors
+    return instances_by_position, errors_by_position
+
+
+def save_items(cls, root, info, items, registry):
+    """
+    Save `items`, the items of the input by their position, in the order of the input: the runs of consecutive
+    plain items are validated together and inserted in bulk, and the other items are saved one by one between
+    them, so every item is validated after the previous ones are saved.
+
+    :return: A tuple with the instances saved and the lists of `ErrorsType`, by position.
+    """
+    model = cls._meta.model
+    instances_by_position = {}
+    errors_by_position = {}
+    for plain, group in groupby(sorted(items), key=lambda position: is_plain_item(model, items[position])):
+        positions = list(group)
+        if plain:
+            instances, errors = save_plain_items(cls, root, info, items, positions, registry)
+            instances_by_position.update(instances)
+            errors_by_position.update(errors)
+            continue
+        for position in positions:
+            instance, errors = cls.mutate_item(root, info, items[position], position, registry)
+            if instance is not None:
+                instances_by_position[position] = instance
+            if errors:
+                errors_by_position[position] = errors
+    return instances_by_position, errors_by_position
+
+
+def bulk_mutate(cls, root, info, input, registry):
+    """
+    Save the items of `input` of the mutation `cls`, planning their nested relations and inserting in bulk the ones that can be.
+
+    :return: A tuple with the list of instances saved, in the order of the input, and the list of `ErrorsType`.
+    """
+    model = cls._meta.model
+    items = dict(enumerate(input or []))
+    relations_by_position = {}
+    positions_in_plan = set()
+    for position, item in items.items():
+        relations = get_nested_direct_relations(model, item, registry)
+        if relations:
+            relations_by_position[position] = relations
+        elif not is_plain_item(model, item):
+            # The plan ends at the first other item, the items from it are saved after the plan in the order of the input
+            break
+        positions_in_plan.add(position)
+
+    instances_by_position = None
+    if len(relations_by_position) > 1:
+        try:
+            with transaction.atomic(using=router.db_for_write(model)):
+                planned_items = create_nested_direct_relations(registry, root, info, items, relations_by_position)
+                items_in_plan = {position: planned_items.get(position, items[position]) for position in positions_in_plan}
+                instances_by_position, errors_by_position = save_items(cls, root, info, items_in_plan, registry)
+                if any(position in relations_by_position for position in errors_by_position):
+                    raise NestedRelationsFailed()
+        except NestedRelationsFailed:
+            instances_by_position = None
+        if instances_by_position is not None:
+            other_items = {position: item for position, item in items.items() if position not in positions_in_plan}
+            other_instances, other_errors = save_items(cls, root, info, other_items, registry)
+            instances_by_position.update(other_instances)
+            errors_by_position.update(other_errors)
+    if instances_by_position is None:
+        instances_by_position, errors_by_position = save_items(cls, root, info, items, registry)
+
+    instances = [instances_by_position[position] for position in sorted(instances_by_position)]
+    errors = [error for position in sorted(errors_by_position) for error in errors_by_position[position]]
+    return instances, errors
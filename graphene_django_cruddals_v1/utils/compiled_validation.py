@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled validation of the items of the create and update mutations.
+
+With the `compiled_validation` attr of the `Create`/`Update` class of its interfaces (`COMPILED_VALIDATION`
+by default), the plain items of the input of a mutation are validated without building a `ModelForm` per
+item. The form of the model is compiled once to flat lists of steps:
+
+    - the form fields: `value_from_datadict` of the widget and `clean` of the field
+    - the construction of the instance: the fields of the model set from the cleaned data
+    - the model fields: `to_python`, the checks of `choices`, `null` and `blank`, and the validators
+
+and every item runs them on its dict, with the same errors (fields, codes and messages) as the form. A
+`CompiledForm` has the part of the interface of `ModelForm` that the mutations use, so it's saved as a form.
+
+The forms that can't be compiled keep the `ModelForm`: the forms with their own `__init__`, `clean` or
+`clean_<field>`, file or disabled fields, and the models that override `clean_fields` or `full_clean`. So do
+the mutations that build their forms themselves, with their own `get_form` or `get_form_kwargs`.
+"""
+import copy
+from enum import Enum
+
+import graphene
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import models
+from django.forms import BaseForm
+from django.forms.fields import FileField
+from django.forms.models import BaseModelForm, InlineForeignKeyField, ModelChoiceField, apply_limit_choices_to_to_formfield
+from django.utils.datastructures import MultiValueDict
+
+
+_compiled_validators = {}
+
+
+def is_compilable(form_class):
+    for name, base in (("__init__", BaseModelForm), ("full_clean", BaseForm), ("_clean_fields", BaseForm), ("_clean_form", BaseForm), ("clean", BaseModelForm), ("_post_clean", BaseModelForm)):
+        if getattr(form_class, name) is not getattr(base, name):
+            return False
+    if any(name.startswith("clean_") for name in dir(form_class)):
+        return False
+    for field in form_class.base_fields.values():
+        if field.disabled or isinstance(field, (FileField, InlineForeignKeyField)):
+            return False
+    model = form_class._meta.model
+    return model.clean_fields is models.Model.clean_fields and model.full_clean is models.Model.full_clean
+
+
+def get_choice_keys(field):
+    if field.choices is None:
+        return None
+    keys = []
+    for option_key, option_value in field.choices:
+        if isinstance(option_value, (list, tuple)):
+            # An optgroup
+            keys.extend(optgroup_key for optgroup_key, _ in option_value)
+        else:
+            keys.append(option_key)
+    return keys
+
+
+class ModelFieldStep:
+    """`Field.clean` of a model field, with `Field.validate` inlined when the field doesn't override it"""
+
+    __slots__ = ("field", "name", "attname", "blank", "null", "empty_values", "to_python", "validate", "choice_keys", "validators", "error_messages")
+
+    def __init__(self, field):
+        self.field = field
+        self.name = field.name
+        self.attname = field.attname
+        self.blank = field.blank
+        self.null = field.null
+        self.empty_values = field.empty_values
+        self.to_python = field.to_python
+        # `ForeignKey.validate` checks that the object exists, the form field already found it
+        inline = type(field).validate is models.Field.validate or isinstance(field, models.ForeignKey)
+        self.validate = None if inline else field.validate
+        self.choice_keys = get_choice_keys(field)
+        self.validators = list(field.validators)
+        self.error_messages = field.error_messages
+
+    def clean(self, raw_value, instance):
+        value = self.to_python(raw_value)
+        if self.validate is not None:
+            self.validate(value, instance)
+        else:
+            if self.choice_keys is not None and value not in self.empty_values and value not in self.choice_keys:
+                raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice", params={"value": value})
+            if value is None and not self.null:
+                raise ValidationError(self.error_messages["null"], code="null")
+            if not self.blank and value in self.empty_values:
+                raise ValidationError(self.error_messages["blank"], code="blank")
+        if self.validators and value not in self.empty_values:
+            errors = []
+            for validator in self.validators:
+                try:
+                    validator(value)
+                except ValidationError as e:
+                    if hasattr(e, "code") and e.code in self.error_messages:
+                        e.message = self.error_messages[e.code]
+                    errors.extend(e.error_list)
+            if errors:
+                raise ValidationError(errors)
+        return value
+
+
+class CompiledValidator:
+    """The validation of a `ModelForm` class compiled to flat lists of steps"""
+
+    def __init__(self, form_class):
+        self.form_class = form_class
+        opts = form_class._meta
+        self.model = opts.model
+        fields = form_class.base_fields
+        self.model_steps = [ModelFieldStep(field) for field in self.model._meta.fields]
+        self.construct_steps = [
+            (field, field.name, field.has_default())
+            for field in self.model._meta.fields
+            if field.editable and not isinstance(field, models.AutoField) and field.name in fields
+            and (opts.fields is None or field.name in opts.fields) and not (opts.exclude and field.name in opts.exclude)
+        ]
+
+    def get_fields(self):
+        """The form fields of a batch, the model choice fields are copied to filter and serve them for the batch"""
+        fields = {}
+        for name, base_field in self.form_class.base_fields.items():
+            if isinstance(base_field, ModelChoiceField):
+                field = copy.copy(base_field)
+                field.widget = copy.copy(base_field.widget)
+                field.queryset = base_field.queryset
+                apply_limit_choices_to_to_formfield(field)
+                fields[name] = field
+            else:
+                fields[name] = base_field
+        return fields
+
+    def get_forms(self, inputs):
+        """
+        Build the forms of `inputs`, the items of the input by their position, with one query for the
+        instances of the items that update an object.
+        """
+        model = self.model
+        fields = self.get_fields()
+        data_by_position = {}
+        pks = []
+        for position, input in inputs.items():
+            data = {key: value.value if issubclass(type(value), (graphene.Enum, Enum)) else value for key, value in input.items()}
+            pk = data.pop("id", None)
+            pk = model._meta.pk.to_python(pk) if pk else None
+            if pk is not None:
+                pks.append(pk)
+            data_by_position[position] = (data, pk)
+        instances = model._default_manager.in_bulk(pks) if pks else {}
+
+        forms = {}
+        for position, (data, pk) in data_by_position.items():
+            if pk is None:
+                instance = model()
+            elif pk in instances:
+                instance = instances[pk]
+            else:
+                raise model.DoesNotExist(f"{model._meta.object_name} matching query does not exist.")
+            forms[position] = CompiledForm(self, fields, data, instance)
+        return forms
+
+
+def get_compiled_validator(form_class):
+    """The `CompiledValidator` of `form_class`, None if it can't be compiled"""
+    if form_class not in _compiled_validators:
+        _compiled_validators[form_class] = CompiledValidator(form_class) if is_compilable(form_class) else None
+    return _compiled_validators[form_class]
+
+
+class CompiledForm:
+    """An item of the input validated by a `CompiledValidator`, with the interface of `ModelForm` that the mutations use"""
+
+    is_bound = True
+    prefix = None
+
+    def __init__(self, validator, fields, data, instance):
+        self.validator = validator
+        self.fields = fields
+        self.data = data
+        self.files = MultiValueDict()
+        self.instance = instance
+        self._meta = validator.form_class._meta
+        self._errors = None
+        self.cleaned_data = {}
+
+    def add_prefix(self, field_name):
+        return field_name
+
+    def add_error(self, field, error):
+        if not isinstance(error, ValidationError):
+            error = ValidationError(error)
+        error_dict = error.error_dict if hasattr(error, "error_dict") else {field or NON_FIELD_ERRORS: error.error_list}
+        for name, error_list in error_dict.items():
+            self._errors.setdefault(name, []).extend(error_list)
+            self.cleaned_data.pop(name, None)
+
+    @property
+    def errors(self):
+        if self._errors is None:
+            self.full_clean()
+        return {name: ValidationError(error_list).messages for name, error_list in self._errors.items()}
+
+    def is_valid(self):
+        return not self.errors
+
+    def full_clean(self):
+        self._errors = {}
+        self.cleaned_data = {}
+        data, files = self.data, self.files
+        for name, field in self.fields.items():
+            try:
+                self.cleaned_data[name] = field.clean(field.widget.value_from_datadict(data, files, name))
+            except ValidationError as e:
+                self.add_error(name, e)
+
+        exclude = self._get_validation_exclusions()
+        instance = self.instance
+        cleaned_data = self.cleaned_data
+        for field, name, has_default in self.validator.construct_steps:
+            if name not in cleaned_data:
+                continue
+            form_field = self.fields[name]
+            # Leave the defaults of the fields that aren't in the data, as `construct_instance`
+            if has_default and form_field.widget.value_omitted_from_data(data, files, name) and cleaned_data.get(name) in form_field.empty_values:
+                continue
+            try:
+                field.save_form_data(instance, cleaned_data[name])
+            except ValidationError as e:
+                self._update_errors(e)
+
+        errors = {}
+        for step in self.validator.model_steps:
+            if step.name in exclude:
+                continue
+            raw_value = getattr(instance, step.attname)
+            if step.blank and raw_value in step.empty_values:
+                continue
+            try:
+                setattr(instance, step.attname, step.clean(raw_value, instance))
+            except ValidationError as e:
+                errors[step.name] = e.error_list
+        try:
+            instance.clean()
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+        if errors:
+            self._update_errors(ValidationError(errors))
+
+        self.validate_unique()
+
+    _get_validation_exclusions = BaseModelForm._get_validation_exclusions
+    _update_errors = BaseModelForm._update_errors
+    validate_unique = BaseModelForm.validate_unique
+    _save_m2m = BaseModelForm._save_m2m
+
+    def save(self, commit=True):
+        if self.errors:
+            raise ValueError(f"The {self.instance._meta.object_name} could not be {'created' if self.instance._state.adding else 'changed'} because the data didn't validate.")
+        if commit:
+            self.instance.save()
+            self._save_m2m()
+        return self.instance
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Cost guard of the search and paginated fields, with the estimates of the query planner.
+
+Before a search runs, its queryset is explained (estimated only, it isn't executed) and the estimated
+cost and rows of the plan are compared with `max_estimated_cost`/`max_estimated_rows`. A query over
+the limits is rejected with a GraphQL error, or with `COST_GUARD_ACTION = "paginate"` its page size is
+capped to `COST_GUARD_PAGE_SIZE`.
+
+    - PostgreSQL: the `Total Cost` and `Plan Rows` of the JSON plan
+    - MySQL: the `query_cost` and the max `rows_examined_per_scan` of the JSON plan
+    - SQLite: a heuristic of `EXPLAIN QUERY PLAN`, a `SCAN` of a table costs its rows and a `SEARCH` of an
+      index the log of them plus the rows it finds, with the numbers of `sqlite_stat1` after an ANALYZE or
+      the guesses of SQLite without them
+    - other backends are not guarded
+
+The estimate only depends on the shape of the query, so it's cached by the shape of the where (its
+fields and lookups, not its values), the order and the scope of the field for `COST_GUARD_CACHE_TIMEOUT`
+seconds, and EXPLAIN runs once per query shape.
+"""
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import DatabaseError, connections
+from graphql import GraphQLError
+
+from ..settings import cruddals_settings
+
+
+CACHE_SIZE = 1024
+
+_estimates = OrderedDict()
+_estimates_lock = threading.Lock()
+
+
+def get_postgresql_estimate(queryset):
+    plan = json.loads(queryset.explain(format="json"))[0]["Plan"]
+    return float(plan["Total Cost"]), float(plan["Plan Rows"])
+
+
+def find_values(node, key):
+    if isinstance(node, dict):
+        for node_key, value in node.items():
+            if node_key == key:
+                yield value
+            else:
+                yield from find_values(value, key)
+    elif isinstance(node, list):
+        for value in node:
+            yield from find_values(value, key)
+
+
+def get_mysql_estimate(queryset):
+    plan = json.loads(queryset.explain(format="json"))
+    cost = max((float(value) for value in find_values(plan, "query_cost")), default=0.0)
+    rows = max((float(value) for value in find_values(plan, "rows_examined_per_scan")), default=0.0)
+    return cost, rows
+
+
+def get_sqlite_stat(cursor, table, index=None):
+    """The numbers of the `sqlite_stat1` row of a table or an index, None before the first ANALYZE"""
+    try:
+        if index is None:
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+        else:
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s AND idx = %s", [table, index])
+        row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or not row[0]:
+        return None
+    return [int(number) for number in row[0].split() if number.isdigit()]
+
+
+def get_sqlite_table_rows(cursor, table, cache):
+    if table not in cache:
+        stat = get_sqlite_stat(cursor, table)
+        if stat:
+            rows = stat[0]
+        else:
+            try:
+                cursor.execute(f'SELECT MAX(rowid) FROM "{table}"')
+                rows = cursor.fetchone()[0] or 0
+            except DatabaseError:
+                rows = 0
+        cache[table] = rows
+    return cache[table]
+
+
+def get_sqlite_search_rows(cursor, detail, table, table_rows):
+    """The rows estimated for a `SEARCH` step, with the statistics of its index or the guesses of SQLite"""
+    match = re.search(r"USING (?:COVERING |PRIMARY KEY |INTEGER PRIMARY KEY )?(?:INDEX )?(\S+)? ?\((.*)\)", detail)
+    constraints = match.group(2) if match else ""
+    is_range = ">" in constraints or "<" in constraints
+    if not is_range and ("PRIMARY KEY" in detail or (match and (match.group(1) or "").startswith("sqlite_autoindex"))):
+        return 1
+    stat = get_sqlite_stat(cursor, table, match.group(1)) if match and match.group(1) else None
+    if is_range:
+        # SQLite guesses a range keeps a quarter of the rows
+        return max(1, table_rows // 4)
+    if stat and len(stat) > 1:
+        return stat[1]
+    # and an equality about 10 rows
+    return min(table_rows, 10)
+
+
+def get_sqlite_estimate(queryset):
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    # The subqueries of Django alias their tables, e.g. `"shop_item" U0`
+    tables_by_alias = {alias: table for table, alias in re.findall(r'"(\w+)" ([A-Z]\d+)\b', sql)}
+
+    cost = 0.0
+    rows = 1.0
+    table_rows = {}
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        plan = cursor.fetchall()
+        for *_, detail in plan:
+            words = detail.split()
+            if len(words) < 2 or words[0] not in ("SCAN", "SEARCH"):
+                continue
+            name = words[2] if words[1] == "TABLE" and len(words) > 2 else words[1]
+            table = tables_by_alias.get(name, name)
+            if table == "CONSTANT":
+                continue
+            n = get_sqlite_table_rows(cursor, table, table_rows)
+            if words[0] == "SCAN":
+                cost += n
+                rows = max(rows, n)
+            else:
+                search_rows = get_sqlite_search_rows(cursor, detail, table, n)
+                cost += math.log2(n + 1) + search_rows
+                rows = max(rows, search_rows)
+    return cost, float(rows)
+
+
+def get_plan_estimate(queryset):
+    """Return the `(cost, rows)` estimated by the planner of the database for `queryset`, None if unknown"""
+    vendor = connections[queryset.db].vendor
+    try:
+        if vendor == "postgresql":
+            return get_postgresql_estimate(queryset)
+        if vendor == "mysql":
+            return get_mysql_estimate(queryset)
+        if vendor == "sqlite":
+            return get_sqlite_estimate(queryset)
+    except (DatabaseError, ValueError, KeyError, IndexError, TypeError):
+        return None
+    return None
+
+
+def get_estimate_key(queryset, args, scope):
+    from .where_compiler import get_where_shape
+
+    where_shape = get_where_shape(args.get("where") or {}, [])
+    order_by = json.dumps(args.get("order_by") or args.get("orderBy"), sort_keys=True, default=str)
+    return (scope, queryset.model._meta.label, queryset.db, where_shape, order_by, bool(args.get("text")))
+
+
+def get_cached_plan_estimate(queryset, args, scope=""):
+    """`get_plan_estimate` cached by the shape of the arguments of the field"""
+    key = get_estimate_key(queryset, args, scope)
+    now = time.monotonic()
+    with _estimates_lock:
+        cached = _estimates.get(key, None)
+        if cached is not None and now - cached[0] < cruddals_settings.COST_GUARD_CACHE_TIMEOUT:
+            _estimates.move_to_end(key)
+            return cached[1]
+
+    estimate = get_plan_estimate(queryset)
+    with _estimates_lock:
+        _estimates[key] = (now, estimate)
+        _estimates.move_to_end(key)
+        while len(_estimates) > CACHE_SIZE:
+            _estimates.popitem(last=False)
+    return estimate
+
+
+def get_cost_limits_for_model(model, registry):
+    """
+    Return the `(max_estimated_rows, max_estimated_cost)` of the CRUDDALS of `model` in `registry`, set by the
+    interfaces of its `Search`, or those of the settings if the model has no CRUDDALS.
+    """
+    registries_for_model = registry.get_registry_for_model(model) if registry is not None else None
+    cruddals_of_model = (registries_for_model or {}).get("cruddals", None)
+    if cruddals_of_model is not None and cruddals_of_model.meta is not None:
+        return cruddals_of_model.meta.max_estimated_rows, cruddals_of_model.meta.max_estimated_cost
+    return cruddals_settings.MAX_ESTIMATED_ROWS, cruddals_settings.MAX_ESTIMATED_COST
+
+
+def guard_query_cost(queryset, args, page_size, max_estimated_rows=None, max_estimated_cost=None, scope=""):
+    """
+    Check the estimated cost of `queryset` before it runs.
+
+    :param queryset: The filtered and ordered queryset of the field.
+    :param args: The arguments of the field, its where and order are the key of the cached estimate.
+    :param page_size: The page size requested.
+    :param max_estimated_rows: The max rows estimated for the query, None without limit.
+    :param max_estimated_cost: The max cost estimated for the query, in the units of the planner, None without limit.
+    :param scope: What the queryset is, e.g. the field, so querysets of the same where are cached apart.
+    :return: The page size, capped when the query is over the limits and `COST_GUARD_ACTION` is "paginate".
+    """
+    if max_estimated_rows is None and max_estimated_cost is None:
+        return page_size
+    estimate = get_cached_plan_estimate(queryset, args, scope)
+    if estimate is None:
+        return page_size
+    cost, rows = estimate
+    over_rows = max_estimated_rows is not None and rows > max_estimated_rows
+    over_cost = max_estimated_cost is not None and cost > max_estimated_cost
+    if not (over_rows or over_cost):
+        return page_size
+
+    if cruddals_settings.COST_GUARD_ACTION == "paginate":
+        max_page_size = cruddals_settings.COST_GUARD_PAGE_SIZE
+        if page_size == "All" or int(page_size) > max_page_size:
+            return max_page_size
+        return page_size
+
+    limits = []
+    if over_rows:
+        limits.append(f"{rows:.0f} rows, over the limit of {max_estimated_rows}")
+    if over_cost:
+        limits.append(f"a cost of {cost:.0f}, over the limit of {max_estimated_cost}")
+    model_name = queryset.model._meta.verbose_name_plural
+    raise GraphQLError(f"The query of {model_name} is too expensive, the database estimates {' and '.join(limits)}. Filter by indexed fields or paginate")
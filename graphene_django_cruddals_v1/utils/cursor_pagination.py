@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Keyset (cursor) pagination for the paginated fields.
+
+The rows of a paginated queryset are ordered by its `order_by` keys plus the pk as tiebreaker, and
+every key is annotated in the rows so the first and the last object of a page can be encoded
+as opaque cursors. A page requested with `after`/`before` is loaded with a seek predicate
+`(a, pk) > (x, y)` instead of an `OFFSET`, so deep pages cost the same as the first one.
+
+The keys keep the NULL order of the database, so the cursors of a page requested by number are valid
+for the pages after and before it: the seek predicates take NULL as the greatest value on the databases
+that order it last in ascending order (PostgreSQL, Oracle) and as the smallest value on the others.
+"""
+import base64
+import binascii
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.expressions import OrderBy
+from graphql import GraphQLError
+
+
+CURSOR_KEY_PREFIX = "_cruddals_cursor_"
+
+
+def is_cursor_pagination(paginated):
+    """If the `paginated` argument asks for a page after or before a cursor"""
+    return bool(paginated.get("after", None) or paginated.get("before", None))
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode()).decode()
+
+
+def decode_cursor(cursor, number_of_keys):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        values = None
+    if not isinstance(values, list) or len(values) != number_of_keys:
+        raise GraphQLError(f"The cursor '{cursor}' is not valid for the order of this field")
+    return values
+
+
+def get_cursor_keys(queryset):
+    """
+    Return the `(expression, descending)` keys that order `queryset`, ending with the pk.
+    """
+    ordering = queryset.query.order_by
+    if not ordering and queryset.query.default_ordering:
+        ordering = queryset.model._meta.ordering or ()
+
+    keys = []
+    for item in ordering:
+        if isinstance(item, OrderBy):
+            keys.append((item.expression, item.descending))
+        elif isinstance(item, str):
+            if item == "?":
+                raise GraphQLError("A random order can't be paginated with cursors")
+            keys.append((F(item[1:]), True) if item.startswith("-") else (F(item), False))
+        elif hasattr(item, "resolve_expression"):
+            keys.append((item, False))
+
+    pk_names = {"pk", queryset.model._meta.pk.name, queryset.model._meta.pk.attname}
+    if not keys or not (isinstance(keys[-1][0], F) and keys[-1][0].name in pk_names):
+        keys.append((F("pk"), False))
+    return keys
+
+
+def get_cursor_ordering(keys):
+    """The `order_by` expressions of the keys"""
+    return [expression.desc() if descending else expression.asc() for expression, descending in keys]
+
+
+def order_by_cursor_keys(queryset, keys=None):
+    """Annotate the keys of the order of `queryset` in its rows and order it by them"""
+    if f"{CURSOR_KEY_PREFIX}0" in queryset.query.annotations:
+        return queryset
+    keys = keys or get_cursor_keys(queryset)
+    queryset = queryset.annotate(**{
+        f"{CURSOR_KEY_PREFIX}{i}": expression for i, (expression, _) in enumerate(keys)
+    })
+    return queryset.order_by(*get_cursor_ordering(keys))
+
+
+def get_cursor(obj, number_of_keys):
+    """Encode the cursor of an object annotated by `order_by_cursor_keys`, None if it isn't annotated"""
+    attrs = [f"{CURSOR_KEY_PREFIX}{i}" for i in range(number_of_keys)]
+    if obj is None or not attrs or not all(hasattr(obj, attr) for attr in attrs):
+        return None
+    return encode_cursor([getattr(obj, attr) for attr in attrs])
+
+
+def get_start_and_end_cursor(objects):
+    """Return the cursors of the first and the last object of a page"""
+    objects = list(objects)
+    if not objects:
+        return None, None
+    number_of_keys = 0
+    while hasattr(objects[0], f"{CURSOR_KEY_PREFIX}{number_of_keys}"):
+        number_of_keys += 1
+    return get_cursor(objects[0], number_of_keys), get_cursor(objects[-1], number_of_keys)
+
+
+def get_seek_Q(keys, values, after, nulls_largest=False):
+    """
+    Build the predicate of the rows after (or before) the row with the key `values`, e.g.
+    `(a > x) OR (a = x AND pk > y)` for the keys `(a, pk)` ordered ascending.
+
+    :param nulls_largest: If NULL is ordered as the greatest value, as the database orders it.
+    """
+    seek_q = Q(pk__in=[])
+    equal_q = Q()
+    for i, ((_, descending), value) in enumerate(zip(keys, values)):
+        alias = f"{CURSOR_KEY_PREFIX}{i}"
+        # A descending key is read in the opposite direction
+        greater = after != descending
+        if value is None:
+            # There is nothing after NULL in its direction, and all the values in the other one
+            if greater != nulls_largest:
+                seek_q |= equal_q & Q(**{f"{alias}__isnull": False})
+            equal_q &= Q(**{f"{alias}__isnull": True})
+        else:
+            seek_value_q = Q(**{f"{alias}__gt" if greater else f"{alias}__lt": value})
+            # The last key is the pk, it is never NULL
+            if greater == nulls_largest and i < len(keys) - 1:
+                seek_value_q |= Q(**{f"{alias}__isnull": True})
+            seek_q |= equal_q & seek_value_q
+            equal_q &= Q(**{alias: value})
+    return seek_q
+
+
+def paginate_queryset_by_cursor(queryset, page_size, after, before, paginated_type, with_total=True, **kwargs):
+    """
+    Paginate `queryset` with the cursors of the `paginated` argument.
+
+    :param queryset: The ordered queryset to paginate.
+    :param page_size: The number of items per page, or 'All'.
+    :param after: The cursor of the row before the page, or None.
+    :param before: The cursor of the row after the page, or None.
+    :param paginated_type: The pagination type to return.
+    :param with_total: If the rows are counted for `total` and `pages`.
+    :param kwargs: Additional keyword arguments for the paginated_type.
+    :return: An instance of paginated_type with the objects of the page and its cursors.
+        `page` and the indexes of the objects are None because the position of the page is unknown.
+    """
+    from .loaders import mark_siblings
+
+    keys = get_cursor_keys(queryset)
+    queryset = order_by_cursor_keys(queryset, keys)
+    total = queryset.count() if with_total else None
+
+    nulls_largest = connections[queryset.db].features.nulls_order_largest
+    if after:
+        queryset = queryset.filter(get_seek_Q(keys, decode_cursor(after, len(keys)), after=True, nulls_largest=nulls_largest))
+    backward = bool(before) and not after
+    if before:
+        queryset = queryset.filter(get_seek_Q(keys, decode_cursor(before, len(keys)), after=False, nulls_largest=nulls_largest))
+    if backward:
+        queryset = queryset.reverse()
+
+    if page_size == "All":
+        objects = list(queryset)
+        has_more = False
+    else:
+        page_size = max(1, int(page_size))
+        # One extra row tells if there are more rows in the direction of the pagination
+        objects = list(queryset[:page_size + 1])
+        has_more = len(objects) > page_size
+        objects = objects[:page_size]
+    if backward:
+        objects.reverse()
+    objects = mark_siblings(objects)
+
+    start_cursor, end_cursor = get_start_and_end_cursor(objects)
+    return paginated_type(
+        total=total,
+        page=None,
+        pages=None if total is None else max(1, -(-total // page_size)) if page_size != "All" else 1,
+        # The row of the `before` cursor is after the page
+        has_next=has_more or bool(before) if not backward else True,
+        has_prev=has_more if backward else bool(after),
+        index_start_obj=None,
+        index_end_obj=None,
+        objects=objects,
+        start_cursor=start_cursor,
+        end_cursor=end_cursor,
+        **kwargs
+    )
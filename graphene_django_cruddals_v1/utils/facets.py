@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Facet counts of the fields of a model, for the filter sidebars of the search pages.
+
+The rows of every requested field are grouped in the database with `values(field).annotate(Count("pk"))`,
+so only the buckets `value -> count` are returned. On PostgreSQL all the fields are grouped in a single
+`GROUP BY GROUPING SETS` query when `FACETS_WITH_GROUPING_SETS` is enabled.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Count, F
+from graphql import GraphQLError
+
+from ..settings import cruddals_settings
+
+
+FACET_COUNT_ANNOTATION = "_cruddals_facet_count"
+FACET_VALUE_PREFIX = "_cruddals_facet_"
+
+
+def get_facet_field(model, name, object_type=None):
+    """
+    Return the concrete field of `model` named `name`, in snake or camel case. With `object_type`, only
+    the fields it exposes can be faceted.
+    """
+    from .utils import camel_to_snake
+
+    for field_name in dict.fromkeys([name, camel_to_snake(name)]):
+        if object_type is not None and field_name not in object_type._meta.fields:
+            continue
+        try:
+            field = model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete and not field.many_to_many:
+            return field
+    raise GraphQLError(f"'{name}' is not a field of {model.__name__} that can be faceted")
+
+
+def to_json_value(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    try:
+        return DjangoJSONEncoder().default(value)
+    except TypeError:
+        return str(value)
+
+
+def get_related_queryset(field, object_type, info):
+    """The queryset of the related objects of `field` that the related type of `object_type` shows, None without it"""
+    from .query_optimizer import get_object_type_for_model
+    from .utils import maybe_queryset
+
+    if object_type is None:
+        return None
+    related_type = get_object_type_for_model(field.related_model, object_type._meta.registry)
+    if related_type is None:
+        return None
+    return maybe_queryset(related_type.get_queryset(field.related_model._default_manager.all(), info))
+
+
+def get_labels(field, values, object_type=None, info=None):
+    """
+    Return the label of every value: the label of its choice, or the related object of a relation, read
+    through the queryset of the related type of `object_type` (the value itself without it)
+    """
+    if field.choices:
+        choices = dict(field.flatchoices)
+        return {value: str(choices.get(value, value)) for value in values if value is not None}
+    if field.is_relation:
+        keys = [value for value in values if value is not None]
+        queryset = get_related_queryset(field, object_type, info) if keys else None
+        related_objects = queryset.in_bulk(keys, field_name=field.target_field.name) if queryset is not None else {}
+        return {key: str(related_objects[key]) if key in related_objects else str(key) for key in keys}
+    return {value: str(value) for value in values if value is not None}
+
+
+def get_buckets(field, rows, object_type=None, info=None):
+    """Convert the `(value, count)` rows of a field to its buckets"""
+    labels = get_labels(field, [value for value, _ in rows], object_type, info)
+    return [
+        {"value": to_json_value(value), "label": labels.get(value, None), "count": count}
+        for value, count in rows
+    ]
+
+
+def get_facet_rows(queryset, field, count, limit):
+    rows = (
+        queryset.order_by()
+        .values(field.name)
+        .annotate(**{FACET_COUNT_ANNOTATION: count})
+        .order_by(f"-{FACET_COUNT_ANNOTATION}", field.name)
+        .values_list(field.name, FACET_COUNT_ANNOTATION)
+    )
+    return list(rows[:limit] if limit is not None else rows)
+
+
+def get_facet_rows_with_grouping_sets(queryset, fields, count_distinct, limit):
+    """Group the rows by every field in one `GROUPING SETS` query, return the rows of every field"""
+    aliases = [f"{FACET_VALUE_PREFIX}{i}" for i in range(len(fields))]
+    pk_alias = f"{FACET_VALUE_PREFIX}pk"
+    base = queryset.order_by().annotate(
+        **{alias: F(field.name) for alias, field in zip(aliases, fields)},
+        **{pk_alias: F("pk")},
+    ).values(pk_alias, *aliases)
+    sql, params = base.query.sql_with_params()
+
+    connection = connections[queryset.db]
+    quote_name = connection.ops.quote_name
+    columns = ", ".join(quote_name(alias) for alias in aliases)
+    count = f"COUNT(DISTINCT {quote_name(pk_alias)})" if count_distinct else "COUNT(*)"
+    grouping_sets = ", ".join(f"({quote_name(alias)})" for alias in aliases)
+    grouped_sql = (
+        f"SELECT GROUPING({columns}) AS cruddals_set, {columns}, {count} AS cruddals_count, "
+        f"ROW_NUMBER() OVER (PARTITION BY GROUPING({columns}) ORDER BY {count} DESC, {columns}) AS cruddals_row_number "
+        f"FROM ({sql}) cruddals_facets GROUP BY GROUPING SETS ({grouping_sets})"
+    )
+    grouped_params = list(params)
+    final_sql = f"SELECT * FROM ({grouped_sql}) cruddals_grouped"
+    if limit is not None:
+        final_sql += " WHERE cruddals_row_number <= %s"
+        grouped_params.append(limit)
+    final_sql += " ORDER BY cruddals_set, cruddals_row_number"
+
+    # GROUPING() has a bit for every column, set when the column is not in the grouping set of the row
+    all_bits = (1 << len(fields)) - 1
+    index_by_set = {all_bits & ~(1 << (len(fields) - 1 - i)): i for i in range(len(fields))}
+    rows_by_field = [[] for _ in fields]
+    with connection.cursor() as cursor:
+        cursor.execute(final_sql, grouped_params)
+        for row in cursor.fetchall():
+            i = index_by_set[row[0]]
+            rows_by_field[i].append((row[1 + i], row[1 + len(fields)]))
+    return rows_by_field
+
+
+def get_facets(queryset, field_names, limit=None, object_type=None, info=None):
+    """
+    Count the rows of `queryset` by every value of the fields `field_names`.
+
+    :param queryset: The filtered queryset.
+    :param field_names: The names of the fields, in snake or camel case.
+    :param limit: The max number of buckets of every field, the values with more rows first.
+    :param object_type: The DjangoObjectType of the model, only its fields can be faceted and the labels of
+        the relations are read with the types of the related models.
+    :param info: The info of the field, for `get_queryset` of the related types.
+    :return: A list with the `field` and the `buckets` of every field.
+    """
+    from .utils import has_multivalued_joins
+
+    if limit is not None and limit < 0:
+        raise GraphQLError("The limit of the buckets can't be negative")
+    field_names = list(dict.fromkeys(field_names))
+    fields = [get_facet_field(queryset.model, name, object_type) for name in field_names]
+    if not fields:
+        return []
+    count_distinct = has_multivalued_joins(queryset)
+
+    connection = connections[queryset.db]
+    if cruddals_settings.FACETS_WITH_GROUPING_SETS and len(fields) > 1 and connection.vendor == "postgresql":
+        rows_by_field = get_facet_rows_with_grouping_sets(queryset, fields, count_distinct, limit)
+    else:
+        count = Count("pk", distinct=count_distinct)
+        rows_by_field = [get_facet_rows(queryset, field, count, limit) for field in fields]
+
+    return [
+        {"field": name, "buckets": get_buckets(field, rows, object_type, info)}
+        for name, field, rows in zip(field_names, fields, rows_by_field)
+    ]
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Index advisor: records the filters and the sort keys used by the search and list fields, and proposes
+the indexes that are missing for them.
+
+When `RECORD_QUERY_USAGE` is enabled, every search, list and facet field records the lookup path, the
+lookup type and the sort keys of its `where` and `order_by` arguments per model, with how many times
+they were used and the time spent by the field that used them. Every process keeps its usage in memory
+and writes it to its own JSON file in `QUERY_USAGE_DIR` every `QUERY_USAGE_FLUSH_INTERVAL` seconds.
+
+The `cruddals_index_advice` management command reads those files and proposes, for the columns without
+an index that covers them:
+
+    - a B-tree `Index` for the exact, range and prefix lookups and the sort keys
+    - a functional `Index(Lower(...))` for the case-insensitive sort keys
+    - a trigram GIN index (PostgreSQL) for the contains, case-insensitive and regex lookups
+"""
+import atexit
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from ..settings import cruddals_settings
+
+
+FILTER = "filter"
+ORDER = "order"
+
+ORDER_LOOKUPS = {"ASC": "asc", "DESC": "desc", "IASC": "iasc", "IDESC": "idesc"}
+
+USAGE_FILE_SUFFIX = ".cruddals-usage.json"
+
+
+def get_usage_directory():
+    return cruddals_settings.QUERY_USAGE_DIR or os.path.join(tempfile.gettempdir(), "cruddals_query_usage")
+
+
+def get_where_usages(where, prefix=()):
+    """Return the `(path, lookup)` of every filter of a where input"""
+    usages = []
+    for key, value in (where or {}).items():
+        if key in ("OR", "AND"):
+            for sub_where in value or []:
+                usages.extend(get_where_usages(sub_where, prefix))
+        elif key == "NOT":
+            usages.extend(get_where_usages(value, prefix))
+        elif isinstance(value, dict):
+            usages.extend(get_where_usages(value, prefix + (key,)))
+        elif prefix:
+            usages.append(("__".join(prefix), "exact" if key == "equals" else key))
+    return usages
+
+
+def get_order_by_usages(order_by):
+    """Return the `(path, direction)` of every sort key of an order_by input"""
+    from .utils import get_paths, nested_get
+
+    if isinstance(order_by, dict):
+        order_by = [order_by]
+    usages = []
+    for rule in order_by or []:
+        for path in get_paths(rule):
+            value = nested_get(rule, path)
+            if not isinstance(value, dict) and value in ORDER_LOOKUPS:
+                usages.append(("__".join(path), ORDER_LOOKUPS[value]))
+    return usages
+
+
+def get_query_usages(args):
+    """Return the `(kind, path, lookup)` used by the arguments of a field, every one only once"""
+    usages = [(FILTER, path, lookup) for path, lookup in get_where_usages(args.get("where"))]
+    order_by = args.get("order_by") or args.get("orderBy")
+    usages += [(ORDER, path, lookup) for path, lookup in get_order_by_usages(order_by)]
+    return list(dict.fromkeys(usages))
+
+
+class QueryUsageRecorder:
+    """The usage of the filters and sort keys of the models in this process"""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.file_name = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}{USAGE_FILE_SUFFIX}"
+        self._lock = threading.Lock()
+        self._usage = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, model, usages, elapsed_ms):
+        label = model._meta.label
+        with self._lock:
+            for kind, path, lookup in usages:
+                entry = self._usage.setdefault((label, kind, path, lookup), [0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed_ms
+                entry[2] = max(entry[2], elapsed_ms)
+            flush = time.monotonic() - self._last_flush >= cruddals_settings.QUERY_USAGE_FLUSH_INTERVAL
+        if flush:
+            self.flush()
+
+    def get_usage(self):
+        with self._lock:
+            return [
+                {"model": label, "kind": kind, "path": path, "lookup": lookup, "count": count, "total_ms": total_ms, "max_ms": max_ms}
+                for (label, kind, path, lookup), (count, total_ms, max_ms) in self._usage.items()
+            ]
+
+    def flush(self):
+        """Write the usage of this process to its file, the file always has all the usage of the process"""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._usage:
+                return
+        usage = self.get_usage()
+        directory = self.directory or get_usage_directory()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, self.file_name)
+            temporary_path = f"{path}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump({"usage": usage}, file)
+            os.replace(temporary_path, path)
+        except OSError:
+            # The usage is only advice, it never breaks a request
+            pass
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = QueryUsageRecorder()
+                atexit.register(_recorder.flush)
+    return _recorder
+
+
+@contextmanager
+def track_query_usage(model, args):
+    """Record the filters and sort keys of `args` for `model`, with the time spent by the block"""
+    if not cruddals_settings.RECORD_QUERY_USAGE:
+        yield
+        return
+    start = time.perf_counter()
+    yield
+    usages = get_query_usages(args)
+    if usages:
+        get_recorder().record(model, usages, (time.perf_counter() - start) * 1000)
+
+
+def load_query_usage(directory=None):
+    """Merge the usage written by every process in `directory`"""
+    directory = directory or get_usage_directory()
+    merged = {}
+    if not os.path.isdir(directory):
+        return []
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(USAGE_FILE_SUFFIX):
+            continue
+        try:
+            with open(os.path.join(directory, file_name)) as file:
+                usage = json.load(file).get("usage", [])
+        except (OSError, ValueError):
+            continue
+        for row in usage:
+            key = (row["model"], row["kind"], row["path"], row["lookup"])
+            entry = merged.setdefault(key, {"model": row["model"], "kind": row["kind"], "path": row["path"], "lookup": row["lookup"], "count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += row["count"]
+            entry["total_ms"] += row["total_ms"]
+            entry["max_ms"] = max(entry["max_ms"], row["max_ms"])
+    return list(merged.values())
+
+
+def clear_query_usage(directory=None):
+    directory = directory or get_usage_directory()
+    if not os.path.isdir(directory):
+        return
+    for file_name in os.listdir(directory):
+        if file_name.endswith(USAGE_FILE_SUFFIX):
+            os.remove(os.path.join(directory, file_name))
+    if _recorder is not None:
+        with _recorder._lock:
+            _recorder._usage.clear()
+
+
+BTREE = "btree"
+LOWER = "lower"
+TRIGRAM = "trigram"
+
+BTREE_LOOKUPS = {"exact", "in", "gt", "gte", "lt", "lte", "range", "isnull", "startswith", "year", "month", "day", "date", "asc", "desc"}
+LOWER_LOOKUPS = {"iasc", "idesc"}
+TRIGRAM_LOOKUPS = {"contains", "icontains", "iexact", "istartswith", "endswith", "iendswith", "regex", "iregex"}
+# The lookups compared with `UPPER(column)` by the PostgreSQL backend of Django
+UPPER_TRIGRAM_LOOKUPS = {"icontains", "iexact", "istartswith", "iendswith"}
+
+
+def resolve_column_field(model, path):
+    """
+    Return the concrete field of the column filtered or sorted by `path`, None if there is no column
+    (e.g. a reverse relation).
+    """
+    from django.core.exceptions import FieldDoesNotExist
+
+    previous_field = None
+    field = None
+    for name in path.split("__"):
+        if field is not None:
+            if not field.is_relation or field.related_model is None:
+                # A transform of the column, e.g. the key of a JSON field
+                return field if field.concrete else None
+            model = field.related_model
+            previous_field = field
+        try:
+            field = model._meta.pk if name == "pk" else model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+    if field is None:
+        return None
+    if previous_field is not None and previous_field.concrete and (previous_field.many_to_one or previous_field.one_to_one):
+        # `customer__id` is the column `customer_id` of the filtered model
+        if getattr(previous_field, "target_field", None) == field:
+            field = previous_field
+    if field.is_relation and not (field.concrete and (field.many_to_one or field.one_to_one)):
+        return None
+    return field if field.concrete else None
+
+
+def get_index_kind(lookup, vendor):
+    if lookup in LOWER_LOOKUPS:
+        return LOWER
+    if vendor == "postgresql" and (lookup in TRIGRAM_LOOKUPS or lookup == "startswith"):
+        # The LIKE of PostgreSQL only uses a B-tree index with the C collation
+        return TRIGRAM
+    if lookup in BTREE_LOOKUPS:
+        return BTREE
+    return None
+
+
+class IndexSuggestion:
+    """An index proposed for a column, with the usage of the filters and sort keys it serves"""
+
+    def __init__(self, field, kind, upper=False):
+        self.field = field
+        self.kind = kind
+        self.upper = upper
+        self.lookups = []
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    @property
+    def model(self):
+        return self.field.model
+
+    @property
+    def name(self):
+        import hashlib
+
+        key = f"{self.model._meta.db_table}:{self.field.column}:{self.kind}:{self.upper}"
+        return f"cruddals_{hashlib.md5(key.encode()).hexdigest()[:12]}"
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    def add_usage(self, row):
+        if row["lookup"] not in self.lookups:
+            self.lookups.append(row["lookup"])
+        self.count += row["count"]
+        self.total_ms += row["total_ms"]
+        self.max_ms = max(self.max_ms, row["max_ms"])
+
+    def get_index(self):
+        """The `Index` of the model, None for a trigram index that is created with SQL"""
+        from django.db.models import Index
+        from django.db.models.functions import Lower
+
+        if self.kind == BTREE:
+            return Index(fields=[self.field.name], name=self.name)
+        if self.kind == LOWER:
+            return Index(Lower(self.field.name), name=self.name)
+        return None
+
+    def get_index_definition(self):
+        if self.kind == BTREE:
+            return f'models.Index(fields=["{self.field.name}"], name="{self.name}")'
+        if self.kind == LOWER:
+            return f'models.Index(Lower("{self.field.name}"), name="{self.name}")'
+        return self.get_create_sql()
+
+    def get_create_sql(self, connection=None):
+        from django.db import connection as default_connection
+
+        quote_name = (connection or default_connection).ops.quote_name
+        expression = f"{quote_name(self.field.column)}::text"
+        if self.upper:
+            expression = f"UPPER({expression})"
+        return f"CREATE INDEX IF NOT EXISTS {quote_name(self.name)} ON {quote_name(self.model._meta.db_table)} USING gin (({expression}) gin_trgm_ops)"
+
+    def get_drop_sql(self, connection=None):
+        from django.db import connection as default_connection
+
+        return f"DROP INDEX IF EXISTS {(connection or default_connection).ops.quote_name(self.name)}"
+
+
+def get_existing_indexes(model, connection):
+    """Return the names of the indexes of the table of `model` and the columns that lead an index"""
+    with connection.cursor() as cursor:
+        if model._meta.db_table in connection.introspection.table_names(cursor):
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+            leading_columns = {
+                constraint["columns"][0]
+                for constraint in constraints.values()
+                if constraint["columns"] and (constraint["index"] or constraint["unique"] or constraint["primary_key"])
+            }
+            return set(constraints), leading_columns
+
+    # The table doesn't exist yet, the indexes are those of the model
+    names = {index.name for index in model._meta.indexes}
+    leading_columns = {
+        field.column for field in model._meta.concrete_fields if field.db_index or field.unique or field.primary_key
+    }
+    for index in model._meta.indexes:
+        if index.fields:
+            leading_columns.add(model._meta.get_field(index.fields[0].lstrip("-")).column)
+    for fields in [*model._meta.unique_together, *model._meta.index_together]:
+        leading_columns.add(model._meta.get_field(fields[0]).column)
+    return names, leading_columns
+
+
+def is_covered(suggestion, connection, cache):
+    model = suggestion.model
+    if model not in cache:
+        cache[model] = get_existing_indexes(model, connection)
+    names, leading_columns = cache[model]
+    if suggestion.name in names:
+        return True
+    if suggestion.kind == BTREE:
+        return suggestion.field.column in leading_columns
+    return False
+
+
+def get_index_suggestions(usage, connection, min_count=1):
+    """
+    Return the indexes missing for the recorded `usage`, the ones that served more time first.
+
+    :param usage: The rows of `load_query_usage`.
+    :param connection: The connection of the database the indexes are proposed for.
+    :param min_count: The min number of uses of a column to propose an index for it.
+    :return: A tuple with the list of `IndexSuggestion` and the rows that no index can serve.
+    """
+    from django.apps import apps
+
+    suggestions = {}
+    not_indexable = []
+    for row in usage:
+        try:
+            model = apps.get_model(row["model"])
+        except LookupError:
+            continue
+        field = resolve_column_field(model, row["path"])
+        kind = get_index_kind(row["lookup"], connection.vendor)
+        if field is None or kind is None:
+            not_indexable.append(row)
+            continue
+        upper = kind == TRIGRAM and row["lookup"] in UPPER_TRIGRAM_LOOKUPS
+        key = (field.model, field.column, kind, upper)
+        if key not in suggestions:
+            suggestions[key] = IndexSuggestion(field, kind, upper)
+        suggestions[key].add_usage(row)
+
+    cache = {}
+    missing = [
+        suggestion
+        for suggestion in suggestions.values()
+        if suggestion.count >= min_count and not is_covered(suggestion, connection, cache)
+    ]
+    missing.sort(key=lambda suggestion: suggestion.total_ms, reverse=True)
+    return missing, not_indexable
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Indexed-only where and order_by inputs.
+
+With the `indexed_only` attr of the `Search` class of its interfaces, the where input of a model only has
+the lookups that an index of the model can serve, and its order_by input only the fields that lead an
+index, so a client can't send a filter or a sort that scans the whole table. The indexes are read from
+the model: the primary key, `unique`, `db_index`, the foreign keys, `unique_together`, `index_together`,
+`Meta.indexes` and `Meta.constraints`. Other fields and lookups are exposed with the `allowed_filters`
+(`"field"` or `"field__lookup"`) and `allowed_order_by` (`"field"`) attrs.
+
+    - a B-tree index that leads with the column serves `exact`, `in`, the ranges and `isnull`, and the sort
+    - a `GinIndex` of the column with the `gin_trgm_ops` opclass serves `contains`, `startswith`,
+      `endswith` and the regexes (PostgreSQL)
+    - an index of `Upper(column)` serves `iexact`, with the `gin_trgm_ops` opclass also `icontains`,
+      `istartswith` and `iendswith`, the lookups Django compares with `UPPER` on PostgreSQL
+
+The where and order_by inputs of a model are shared by all its fields, and by the relations of the
+other models to it, so the option applies to all of them. The relations of a where input restricted to
+the indexes (foreign keys, reverse relations and many-to-many fields) are filtered with the where input
+of the related model restricted to its indexes too, `Indexed<Model>FilterInput` when the related model
+isn't indexed-only itself, unless they are in `allowed_filters`.
+"""
+from collections import defaultdict
+
+import graphene
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Index, UniqueConstraint
+from django.db.models.functions import Upper
+from graphene.utils.str_converters import to_camel_case
+
+from graphene_django_cruddals_v1.registry.registry_global import get_global_registry
+
+
+BTREE_LOOKUPS = {"exact", "in", "gt", "gte", "lt", "lte", "range", "isnull"}
+TRIGRAM_LOOKUPS = {"contains", "startswith", "endswith", "regex", "iregex"}
+UPPER_LOOKUPS = {"iexact"}
+UPPER_TRIGRAM_LOOKUPS = {"iexact", "icontains", "istartswith", "iendswith"}
+
+TRIGRAM_OPCLASS = "gin_trgm_ops"
+
+ALL_LOOKUPS = "__all__"
+
+_indexed_lookups_cache = {}
+_restricted_filter_inputs = {}
+
+
+def get_field_name(model, name):
+    try:
+        return model._meta.get_field(name.lstrip("-")).name
+    except FieldDoesNotExist:
+        return None
+
+
+def get_indexed_expression(expression):
+    """Return the `(function, field name, opclass)` of an expression of a functional index"""
+    opclass = None
+    if type(expression).__name__ == "OpClass":
+        # `OpClass(expression, name)` of Django 4.1+
+        opclass = expression.name
+        expression = expression.get_source_expressions()[0]
+    function = None
+    if isinstance(expression, Upper):
+        function = Upper
+        expression = expression.get_source_expressions()[0]
+    if isinstance(expression, F):
+        return function, expression.name, opclass
+    return None, None, None
+
+
+def get_indexed_lookups(model):
+    """Return the lookups that the indexes of `model` serve, by the name of the field"""
+    if model in _indexed_lookups_cache:
+        return _indexed_lookups_cache[model]
+
+    lookups = defaultdict(set)
+    for field in model._meta.concrete_fields:
+        if field.primary_key or field.unique or field.db_index:
+            lookups[field.name] |= BTREE_LOOKUPS
+    for fields in [*model._meta.unique_together, *model._meta.index_together]:
+        if fields:
+            lookups[get_field_name(model, fields[0])] |= BTREE_LOOKUPS
+    for constraint in model._meta.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.fields and constraint.condition is None:
+            lookups[get_field_name(model, constraint.fields[0])] |= BTREE_LOOKUPS
+
+    for index in model._meta.indexes:
+        # A partial index doesn't serve every query
+        if not isinstance(index, Index) or index.condition is not None:
+            continue
+        is_gin = type(index).__name__ == "GinIndex"
+        if index.fields:
+            name = get_field_name(model, index.fields[0])
+            if is_gin:
+                if TRIGRAM_OPCLASS in (index.opclasses or ()):
+                    lookups[name] |= TRIGRAM_LOOKUPS
+            else:
+                lookups[name] |= BTREE_LOOKUPS
+        elif index.expressions:
+            function, name, opclass = get_indexed_expression(index.expressions[0])
+            name = get_field_name(model, name) if name else None
+            if name is None:
+                continue
+            trigram = is_gin and opclass == TRIGRAM_OPCLASS
+            if function is Upper:
+                lookups[name] |= UPPER_TRIGRAM_LOOKUPS if trigram else UPPER_LOOKUPS
+            elif trigram:
+                lookups[name] |= TRIGRAM_LOOKUPS
+            elif not is_gin:
+                lookups[name] |= BTREE_LOOKUPS
+
+    lookups.pop(None, None)
+    _indexed_lookups_cache[model] = dict(lookups)
+    return _indexed_lookups_cache[model]
+
+
+def get_allowed_lookups(allowed_filters):
+    """Convert `["field", "field__lookup"]` to `{field: ALL_LOOKUPS or {lookup}}`"""
+    allowed = {}
+    for allowed_filter in allowed_filters or []:
+        name, _, lookup = allowed_filter.partition("__")
+        if not lookup:
+            allowed[name] = ALL_LOOKUPS
+        elif allowed.get(name) != ALL_LOOKUPS:
+            allowed.setdefault(name, set()).add(lookup)
+    return allowed
+
+
+def restrict_filter_input(converted_field, lookups):
+    """Return the filter input of a field with only `lookups`, None if it has none of them"""
+    input_object_type = type(converted_field)
+    if not (isinstance(input_object_type, type) and issubclass(input_object_type, graphene.InputObjectType)):
+        return converted_field if lookups else None
+
+    all_fields = input_object_type._meta.fields
+    kept = [name for name in all_fields if name in lookups]
+    if not kept:
+        return None
+    if len(kept) == len(all_fields):
+        return converted_field
+
+    base_name = input_object_type._meta.name
+    if set(kept) == BTREE_LOOKUPS & set(all_fields):
+        name = f"Indexed{base_name}"
+    else:
+        name = base_name + "".join(to_camel_case(lookup).capitalize() for lookup in kept)
+    # The filter inputs of the fields of a type are shared by every model
+    if name not in _restricted_filter_inputs:
+        _restricted_filter_inputs[name] = type(
+            name,
+            (graphene.InputObjectType,),
+            {lookup: graphene.InputField(all_fields[lookup].type, description=all_fields[lookup].description) for lookup in kept},
+        )
+    return _restricted_filter_inputs[name](**converted_field.kwargs)
+
+
+def get_indexed_filter_input_field(model, name=None):
+    """
+    The field of the where input of `model` restricted to its indexes, for a relation to it or for `name`
+    AND, OR and NOT, None if the model has no CRUDDALS.
+    """
+
+    def dynamic_type():
+        from .utils import convert_model_to_indexed_filter_input_object_type
+
+        if get_global_registry().get_registry_for_model(model) is None:
+            return None
+        input_object_type = convert_model_to_indexed_filter_input_object_type(model)
+        if name in ("AND", "OR"):
+            return graphene.InputField(graphene.List(input_object_type))
+        return graphene.InputField(input_object_type)
+
+    return graphene.Dynamic(dynamic_type)
+
+
+def is_relation_indexed(field, indexed_lookups):
+    """If the rows of a relation are found by an index, the one of its foreign key or of the through table"""
+    if field.many_to_many:
+        return True
+    if field.concrete:
+        return bool(indexed_lookups.get(field.name))
+    # A reverse relation is found by the foreign key of the related model
+    return bool(get_indexed_lookups(field.related_model).get(field.field.name))
+
+
+def restrict_input_fields(model, input_fields, purpose, meta_attrs):
+    """
+    Remove from the where (`purpose` "filter") or order_by (`purpose` "order_by") input fields of `model`
+    the lookups and the fields that its indexes can't serve.
+    """
+    indexed_lookups = get_indexed_lookups(model)
+    allowed_lookups = get_allowed_lookups(meta_attrs.get("allowed_filters", []))
+    allowed_order_by = set(meta_attrs.get("allowed_order_by", []))
+
+    restricted = type(input_fields)()
+    for name, converted_field in input_fields.items():
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # AND, OR and NOT combine the where inputs restricted as this one
+            restricted[name] = get_indexed_filter_input_field(model, name) if purpose == "filter" else converted_field
+            continue
+
+        if purpose == "order_by":
+            if (field.is_relation and not field.concrete) or field.many_to_many:
+                restricted[name] = converted_field
+            elif BTREE_LOOKUPS <= indexed_lookups.get(field.name, set()) or name in allowed_order_by:
+                restricted[name] = converted_field
+            continue
+
+        allowed = allowed_lookups.get(name, set())
+        if allowed == ALL_LOOKUPS:
+            restricted[name] = converted_field
+            continue
+        if field.is_relation:
+            # The filters of a relation are those of the where input of the related model restricted to its indexes
+            if is_relation_indexed(field, indexed_lookups):
+                restricted[name] = get_indexed_filter_input_field(field.related_model)
+            continue
+        lookups = indexed_lookups.get(field.name, set()) | allowed
+        restricted_field = restrict_filter_input(converted_field, lookups)
+        if restricted_field is not None:
+            restricted[name] = restricted_field
+    return restricted
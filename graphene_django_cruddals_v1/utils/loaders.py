@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Request scoped batch loaders for ForeignKey, OneToOneField and OneToOneRel fields,
+and window-function batching for the `paginated_*` relation fields.
+
+Graphene resolves the rows of a list one by one, so the loaders use the rows resolved together
+(the `siblings` of a row, marked by `mark_siblings`) to load the related objects of all of them
+with a single `IN` query, the same way `prefetch_related_objects` does it.
+"""
+from django.db import connections
+from django.db.models import (
+    Count,
+    F,
+    ForeignKey,
+    ManyToManyField,
+    ManyToManyRel,
+    ManyToOneRel,
+    OneToOneField,
+    OneToOneRel,
+    Window,
+)
+from django.db.models.functions import RowNumber
+
+from ..settings import cruddals_settings
+from .cursor_pagination import get_cursor_keys, get_cursor_ordering, is_cursor_pagination, order_by_cursor_keys
+
+
+SIBLINGS_ATTR = "_cruddals_siblings"
+LOADER_ATTR = "_cruddals_related_object_loader"
+BATCHED_PAGE_ATTR_PREFIX = "_cruddals_batched_page_"
+
+
+def mark_siblings(objects):
+    """Mark every instance of `objects` with the list of instances resolved together with it"""
+    objects = list(objects)
+    for obj in objects:
+        try:
+            setattr(obj, SIBLINGS_ATTR, objects)
+        except AttributeError:
+            pass
+    return objects
+
+
+def get_siblings(root):
+    siblings = getattr(root, SIBLINGS_ATTR, None) or [root]
+    return [sibling for sibling in siblings if type(sibling) is type(root)]
+
+
+def get_queryset_is_overridden(object_type):
+    """If the DjangoObjectType overrides `get_queryset`, the related objects must be filtered by it"""
+    from graphene_django_cruddals_v1.copy_graphene_django.types import DjangoObjectType
+    get_queryset = getattr(object_type.get_queryset, "__func__", object_type.get_queryset)
+    return get_queryset is not DjangoObjectType.get_queryset.__func__
+
+
+def get_relation_keys(field):
+    """
+    Return the attname of the value of the relation in the root instance and the
+    attname of the same value in the related instances.
+    """
+    if isinstance(field, OneToOneRel):
+        direct_field = field.field
+        return direct_field.target_field.attname, direct_field.attname
+    return field.attname, field.target_field.attname
+
+
+class RelatedObjectLoader:
+    """
+    Loads and caches the related objects of a request.
+    The cache is keyed by related model and by the SQL of the queryset returned by `get_queryset`
+    of the related type, so two fields pointing to the same model share the loaded objects.
+    """
+
+    def __init__(self):
+        self._querysets = {}
+        self._cache = {}
+
+    def get_queryset_and_key(self, model, related_type, info):
+        from .utils import maybe_queryset
+        if related_type not in self._querysets:
+            queryset = maybe_queryset(related_type.get_queryset(model._default_manager.all(), info))
+            self._querysets[related_type] = (queryset, (model, str(queryset.query)))
+        return self._querysets[related_type]
+
+    def load(self, root, field, related_type, info):
+        model = field.related_model
+        root_attname, related_attname = get_relation_keys(field)
+        key = getattr(root, root_attname, None)
+        if key is None:
+            return None
+
+        queryset, cache_key = self.get_queryset_and_key(model, related_type, info)
+        loaded = self._cache.setdefault((cache_key, related_attname), {})
+
+        if key not in loaded:
+            siblings = get_siblings(root)
+            keys = {getattr(sibling, root_attname, None) for sibling in siblings}
+            keys = {k for k in keys if k is not None and k not in loaded}
+            keys.add(key)
+            related_objects = mark_siblings(queryset.filter(**{f"{related_attname}__in": keys}))
+            for related_object in related_objects:
+                loaded[getattr(related_object, related_attname)] = related_object
+            for k in keys:
+                loaded.setdefault(k, None)
+
+            if not get_queryset_is_overridden(related_type):
+                for sibling in siblings:
+                    sibling_key = getattr(sibling, root_attname, None)
+                    if sibling_key in loaded and not field.is_cached(sibling):
+                        field.set_cached_value(sibling, loaded[sibling_key])
+
+        return loaded[key]
+
+
+def get_related_object_loader(info):
+    """Return the loader of the request, a new one if the context can't hold it"""
+    context = getattr(info, "context", None)
+    loader = getattr(context, LOADER_ATTR, None)
+    if loader is None:
+        loader = RelatedObjectLoader()
+        try:
+            setattr(context, LOADER_ATTR, loader)
+        except AttributeError:
+            pass
+    return loader
+
+
+def load_related_object(root, field, related_type, info):
+    """
+    Resolve a ForeignKey, OneToOneField or OneToOneRel field of `root` batching the query with its siblings.
+    The value cached in the instance (e.g. by `select_related`) is used only when the related type
+    doesn't filter its queryset.
+    """
+    assert isinstance(field, (ForeignKey, OneToOneField, OneToOneRel)), f"Can't load the related object of {field}"
+    if field.is_cached(root) and not get_queryset_is_overridden(related_type):
+        related_object = field.get_cached_value(root)
+        if related_object is not None and not hasattr(related_object, SIBLINGS_ATTR):
+            # The objects of `select_related` are resolved together as their roots, so their relations are batched
+            cached_objects = (field.get_cached_value(sibling) for sibling in get_siblings(root) if field.is_cached(sibling))
+            mark_siblings(cached_object for cached_object in cached_objects if cached_object is not None)
+        return related_object
+    return get_related_object_loader(info).load(root, field, related_type, info)
+
+
+def get_batched_page_attr(response_key):
+    """Name of the attribute where the batch leaves the page and the total of a paginated field"""
+    return f"{BATCHED_PAGE_ATTR_PREFIX}{response_key}"
+
+
+def get_parent_lookup(field):
+    """
+    Return the lookup from the related model to the parent model of a to-many relation and
+    the attname of the value of that lookup in the parent instances.
+    """
+    if isinstance(field, ManyToOneRel):
+        return field.field.name, field.field.target_field.attname
+    if isinstance(field, ManyToManyField):
+        return field.related_query_name(), field.model._meta.pk.attname
+    if isinstance(field, ManyToManyRel):
+        return field.field.name, field.model._meta.pk.attname
+    raise ValueError(f"{field} is not a to-many relation")
+
+
+def can_batch_paginated_field(queryset, paginated):
+    """
+    A paginated field with a page size and a backend with window functions is batched,
+    except when it is paginated with cursors, that are resolved for every parent with a seek predicate.
+    """
+    return (
+        cruddals_settings.BATCH_PAGINATED_FIELDS
+        and paginated.get("page_size", "All") != "All"
+        and not is_cursor_pagination(paginated)
+        and connections[queryset.db].features.supports_over_clause
+    )
+
+
+def batch_paginated_field(root, field, related_type, args, info):
+    """
+    Load the page of the paginated field `field` for `root` and all its siblings with
+    a grouped count and a `ROW_NUMBER() OVER (PARTITION BY parent ORDER BY ...)` query,
+    and leave the `(objects, total, page, has_next)` of every parent in its batched page attribute.
+
+    The rows are counted only if the field selects `total` or `pages`, otherwise one extra row of every
+    parent tells if it has a next page (`total` is None), and the parents without rows in a page after
+    the first one get None, so they are paginated alone and get their last page.
+    A root without siblings is left without it, so it is paginated alone.
+    """
+    from .utils import maybe_queryset, normalize_page_and_page_size, order_by_input_to_args, where_input_to_Q
+    from .query_optimizer import get_selected_field_names, optimize_queryset
+
+    model = related_type._meta.model
+    queryset = maybe_queryset(related_type.get_queryset(model._default_manager.all(), info))
+    paginated = args.get("paginated", {})
+    if not can_batch_paginated_field(queryset, paginated):
+        return
+    page, page_size = normalize_page_and_page_size(paginated.get("page", 1), paginated["page_size"])
+
+    siblings = get_siblings(root)
+    if len(siblings) < 2:
+        return
+    parent_lookup, parent_attname = get_parent_lookup(field)
+    keys = {getattr(sibling, parent_attname) for sibling in siblings}
+
+    base = queryset
+    if "where" in args:
+        # The where can join to-many relations, the subquery avoids the duplicated rows in the window
+        filtered = queryset.filter(where_input_to_Q(args["where"], model))
+        base = base.filter(pk__in=filtered.values("pk"))
+    base = base.filter(**{f"{parent_lookup}__in": keys})
+
+    selected_fields = get_selected_field_names(info)
+    with_total = "total" in selected_fields or "pages" in selected_fields or page < 1
+    totals = None
+    if with_total:
+        totals = dict(
+            base.order_by()
+            .values(parent_lookup)
+            .annotate(_cruddals_total=Count("pk", distinct=True))
+            .values_list(parent_lookup, "_cruddals_total")
+        )
+
+    order_by = args.get("order_by") or args.get("orderBy")
+    if isinstance(order_by, dict):
+        order_by = [order_by]
+    order_by_args = (order_by_input_to_args(order_by) if order_by else []) or ["pk"]
+    order_expressions = get_cursor_ordering(get_cursor_keys(base.order_by(*order_by_args)))
+
+    ranked = base.order_by().annotate(
+        _cruddals_parent=F(parent_lookup),
+        _cruddals_row_number=Window(expression=RowNumber(), partition_by=[F(parent_lookup)], order_by=order_expressions),
+    ).values_list("pk", "_cruddals_parent", "_cruddals_row_number")
+
+    # Like the Paginator, a page that doesn't exist returns the last page of the parent
+    pages_by_parent = {}
+    parents_by_page = {}
+    for key in keys:
+        if totals is None:
+            pages_by_parent[key] = page
+            parents_by_page.setdefault(page, []).append(key)
+            continue
+        total = totals.get(key, 0)
+        pages = max(1, -(-total // page_size))
+        pages_by_parent[key] = page if 1 <= page <= pages else pages
+        if total:
+            parents_by_page.setdefault(pages_by_parent[key], []).append(key)
+    extra_rows = 0 if with_total else 1
+
+    rows = []
+    if parents_by_page:
+        connection = connections[ranked.db]
+        quote_name = connection.ops.quote_name
+        sql, params = ranked.query.sql_with_params()
+        parent, row_number = quote_name("_cruddals_parent"), quote_name("_cruddals_row_number")
+        conditions, conditions_params = [], []
+        for parent_page, parents in parents_by_page.items():
+            placeholders = ", ".join(["%s"] * len(parents))
+            conditions.append(f"({parent} IN ({placeholders}) AND {row_number} > %s AND {row_number} <= %s)")
+            conditions_params.extend([*parents, page_size * (parent_page - 1), page_size * parent_page + extra_rows])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT * FROM ({sql}) cruddals_window WHERE {' OR '.join(conditions)}",
+                (*params, *conditions_params),
+            )
+            rows = sorted(cursor.fetchall(), key=lambda row: (row[1], row[2]))
+
+    # The extra row of a parent is not in its page
+    parents_with_next_page = {parent for _, parent, row_number in rows if row_number > page_size * pages_by_parent[parent]}
+    rows = [row for row in rows if row[2] <= page_size * pages_by_parent[row[1]]]
+
+    objects_queryset = order_by_cursor_keys(queryset.filter(pk__in={row[0] for row in rows}).order_by(*order_by_args))
+    objects_queryset = optimize_queryset(objects_queryset, info, related_type, paginated=True)
+    objects_by_pk = {obj.pk: obj for obj in mark_siblings(objects_queryset)}
+
+    objects_by_parent = {}
+    for pk, parent, _ in rows:
+        if pk in objects_by_pk:
+            objects_by_parent.setdefault(parent, []).append(objects_by_pk[pk])
+
+    batched_page_attr = get_batched_page_attr(info.path.key)
+    for sibling in siblings:
+        key = getattr(sibling, parent_attname)
+        objects = objects_by_parent.get(key, [])
+        if totals is not None:
+            setattr(sibling, batched_page_attr, (objects, totals.get(key, 0), pages_by_parent[key], None))
+        else:
+            batched_page = (objects, None, page, key in parents_with_next_page) if objects or page == 1 else None
+            setattr(sibling, batched_page_attr, batched_page)
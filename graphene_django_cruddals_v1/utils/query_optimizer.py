@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Selection-set driven optimizer for the querysets of read, list, search and paginated fields.
+
+The optimizer walks `info.field_nodes` (including fragments) against the `object_type` registered
+for every model and applies:
+
+    - `select_related` for forward ForeignKey/OneToOneField and reverse OneToOneRel fields
+    - `prefetch_related` with a nested `Prefetch` queryset for every `paginated_*` relation field
+      whose objects are not loaded by the window batch of `loaders.batch_paginated_field`, and whose
+      model has no cost limits (the paginated field checks the cost of its queryset before loading it)
+    - `only` with the columns of the requested fields, the columns needed by the relations and the
+      columns that the custom fields declare in the `fields_dependencies` option of their type
+
+so the number of queries is bounded by the depth of the selection and not by the number of rows.
+"""
+from django.db.models import (
+    ForeignKey,
+    ManyToManyField,
+    ManyToManyRel,
+    ManyToOneRel,
+    OneToOneField,
+    OneToOneRel,
+    Prefetch,
+    QuerySet,
+)
+from graphene.utils.str_converters import to_camel_case
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from graphql.execution.values import get_argument_values
+
+from ..settings import cruddals_settings
+from .cost_guard import get_cost_limits_for_model
+from .cursor_pagination import is_cursor_pagination, order_by_cursor_keys
+from .loaders import can_batch_paginated_field, get_queryset_is_overridden
+
+
+PREFETCH_TO_ATTR_PREFIX = "_cruddals_prefetched_"
+
+_fields_map_cache = {}
+
+
+def get_prefetch_to_attr(response_key):
+    """Name of the attribute where the optimizer leaves the prefetched objects of a paginated field"""
+    return f"{PREFETCH_TO_ATTR_PREFIX}{response_key}"
+
+
+def get_selected_field_nodes(selection_set, info):
+    """Yield the FieldNode of a selection set, flattening fragment spreads and inline fragments"""
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments.get(selection.name.value)
+            if fragment is not None:
+                yield from get_selected_field_nodes(fragment.selection_set, info)
+        elif isinstance(selection, InlineFragmentNode):
+            yield from get_selected_field_nodes(selection.selection_set, info)
+
+
+def get_sub_field_nodes(field_nodes, name, info):
+    """Return the children named `name` of all `field_nodes`"""
+    return [
+        sub_field_node
+        for field_node in field_nodes
+        for sub_field_node in get_selected_field_nodes(field_node.selection_set, info)
+        if sub_field_node.name.value == name
+    ]
+
+
+def get_selected_field_names(info):
+    """Return the names of the fields selected in the field resolved with `info`"""
+    return {
+        sub_field_node.name.value
+        for field_node in info.field_nodes
+        for sub_field_node in get_selected_field_nodes(field_node.selection_set, info)
+    }
+
+
+def get_fields_map_for_object_type(object_type):
+    """
+    Map the GraphQL name of every field of `object_type` to its python name, and to the name and
+    the Django field behind it, which are None for the custom fields of interfaces.
+    """
+    if object_type in _fields_map_cache:
+        return _fields_map_cache[object_type]
+
+    from .utils import get_model_fields_map
+
+    django_fields = get_model_fields_map(object_type._meta.model)
+    fields_map = {}
+    for name, field in object_type._meta.fields.items():
+        django_name = name
+        if name not in django_fields and name.startswith("paginated_"):
+            django_name = name.replace("paginated_", "", 1)
+        django_field = django_fields.get(django_name)
+        if django_field is None:
+            django_name = None
+        graphql_name = getattr(field, "name", None) or to_camel_case(name)
+        fields_map[graphql_name] = (name, django_name, django_field)
+        fields_map.setdefault(name, (name, django_name, django_field))
+
+    _fields_map_cache[object_type] = fields_map
+    return fields_map
+
+
+def get_object_type_for_model(model, registry):
+    registries_for_model = registry.get_registry_for_model(model)
+    if registries_for_model is not None:
+        return registries_for_model.get("object_type", None)
+    return None
+
+
+def get_field_arguments(object_type, field_node, info):
+    """Coerce the arguments of `field_node` the same way the executor does it for its resolver"""
+    graphql_type = info.schema.get_type(object_type._meta.name)
+    field_definition = getattr(graphql_type, "fields", {}).get(field_node.name.value)
+    if field_definition is None:
+        return {}
+    return get_argument_values(field_definition, field_node, info.variable_values)
+
+
+class QueryOptimizer:
+    """
+    Collects the `select_related` paths and the `Prefetch` objects needed by a selection set
+    and applies them to a queryset.
+    """
+
+    def __init__(self, info):
+        self.info = info
+
+    def optimize(self, queryset, field_nodes, object_type, required_fields=()):
+        select_related = []
+        prefetch_related = []
+        only = set(required_fields)
+        self.collect(field_nodes, object_type, "", select_related, prefetch_related, only)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if cruddals_settings.DEFER_UNREQUESTED_FIELDS:
+            queryset = queryset.only(*only)
+        return queryset
+
+    def collect(self, field_nodes, object_type, prefix, select_related, prefetch_related, only):
+        from .utils import get_field_name
+
+        fields_map = get_fields_map_for_object_type(object_type)
+        registry = object_type._meta.registry
+        model = object_type._meta.model
+        fields_dependencies = getattr(object_type._meta, "fields_dependencies", None) or {}
+        all_fields_are_needed = False
+        only.add(f"{prefix}{model._meta.pk.name}")
+
+        for field_node in field_nodes:
+            for sub_field_node in get_selected_field_nodes(field_node.selection_set, self.info):
+                if sub_field_node.name.value.startswith("__"):
+                    continue
+                name_and_field = fields_map.get(sub_field_node.name.value, None)
+                if name_and_field is None:
+                    continue
+                python_name, name, django_field = name_and_field
+
+                if python_name in fields_dependencies:
+                    only.update(f"{prefix}{dependency}" for dependency in fields_dependencies[python_name])
+                if django_field is None:
+                    # A custom field that doesn't declare its dependencies can use any column
+                    all_fields_are_needed = all_fields_are_needed or python_name not in fields_dependencies
+                    continue
+
+                if not django_field.is_relation:
+                    only.add(f"{prefix}{django_field.name}")
+                    continue
+
+                if isinstance(django_field, (ForeignKey, OneToOneField)):
+                    only.add(f"{prefix}{django_field.name}")
+                elif isinstance(django_field, ManyToOneRel):
+                    only.add(f"{prefix}{django_field.field.target_field.name}")
+                elif not isinstance(django_field, (ManyToManyField, ManyToManyRel)):
+                    all_fields_are_needed = True
+                    continue
+
+                related_type = get_object_type_for_model(django_field.related_model, registry)
+                if related_type is None:
+                    continue
+
+                if isinstance(django_field, (ForeignKey, OneToOneField, OneToOneRel)):
+                    # The rows of a type that filters its queryset are batched by the related object loader
+                    if get_queryset_is_overridden(related_type):
+                        continue
+                    path = f"{prefix}{get_field_name(django_field, for_queryset=True)}"
+                    if path not in select_related:
+                        select_related.append(path)
+                    if isinstance(django_field, OneToOneRel):
+                        only.add(f"{path}__{django_field.field.name}")
+                    self.collect([sub_field_node], related_type, f"{path}__", select_related, prefetch_related, only)
+
+                elif isinstance(django_field, (ManyToManyField, ManyToManyRel, ManyToOneRel)):
+                    prefetch = self.get_prefetch(object_type, sub_field_node, name, related_type, prefix)
+                    if prefetch is not None:
+                        prefetch_related.append(prefetch)
+
+        if all_fields_are_needed:
+            only.update(f"{prefix}{field.name}" for field in model._meta.concrete_fields)
+
+    def get_prefetch(self, object_type, field_node, name, related_type, prefix):
+        from .utils import apply_where_and_order_by, maybe_queryset
+
+        args = get_field_arguments(object_type, field_node, self.info)
+        related_model = related_type._meta.model
+        queryset = maybe_queryset(related_type.get_queryset(related_model._default_manager.all(), self.info))
+        # Only the requested page of every parent is loaded by the window batch of the paginated field,
+        # and a page after or before a cursor is loaded for every parent with a seek predicate
+        paginated = args.get("paginated", {})
+        if is_cursor_pagination(paginated) or can_batch_paginated_field(queryset, paginated):
+            return None
+        # A prefetched page would be served without the cost guard of the paginated field
+        if any(limit is not None for limit in get_cost_limits_for_model(related_model, related_type._meta.registry)):
+            return None
+        queryset = order_by_cursor_keys(apply_where_and_order_by(queryset, args))
+        # The prefetch of a reverse ForeignKey needs the column that points to the parent
+        django_field = get_fields_map_for_object_type(object_type)[field_node.name.value][2]
+        required_fields = [django_field.field.name] if isinstance(django_field, ManyToOneRel) else []
+        objects_field_nodes = get_sub_field_nodes([field_node], "objects", self.info)
+        queryset = self.optimize(queryset, objects_field_nodes, related_type, required_fields)
+
+        response_key = field_node.alias.value if field_node.alias else field_node.name.value
+        return Prefetch(f"{prefix}{name}", queryset=queryset, to_attr=get_prefetch_to_attr(response_key))
+
+
+def optimize_queryset(queryset, info, object_type, paginated=False):
+    """
+    Apply `select_related`/`prefetch_related` to `queryset` based on the fields requested in `info`.
+
+    :param queryset: The queryset of the model of `object_type`.
+    :param info: The ResolveInfo of the field that returns the queryset.
+    :param object_type: The DjangoObjectType used to output the rows of the queryset.
+    :param paginated: If the field returns a PaginatedType, the rows are selected in its `objects` field.
+    :return: The optimized queryset.
+    """
+    if not cruddals_settings.OPTIMIZE_QUERIES or info is None or not isinstance(queryset, QuerySet):
+        return queryset
+
+    field_nodes = info.field_nodes
+    if paginated:
+        field_nodes = get_sub_field_nodes(field_nodes, "objects", info)
+        if not field_nodes:
+            return queryset
+
+    return QueryOptimizer(info).optimize(queryset, field_nodes, object_type)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Full-text search for the `text` argument of the search fields.
+
+The fields of a model indexed for full-text search are set with the `text_search_fields` option of
+the `Search` class of its interfaces, and the text is searched with the index of the backend:
+
+    - PostgreSQL: a GIN index of the `SearchVector` of the fields, ordered by `SearchRank`
+    - SQLite: a FTS5 shadow table, kept up to date by the `post_save`/`post_delete` signals of the model
+      and ordered by `bm25`
+    - other backends, or a SQLite shadow table not built yet: an `icontains` of every word in any of the
+      fields, without relevance
+
+The indexes are built (or rebuilt) with the `cruddals_text_search_index` management command. While the
+SQLite shadow table doesn't exist, a process checks again if it exists on every save and delete of the
+model, so the table built by another process is kept up to date, and at most every
+`TEXT_SEARCH_TABLE_CHECK_INTERVAL` seconds for the searches, which don't use it in the meantime.
+"""
+import hashlib
+import time
+
+from django.db import connections, router
+from django.db.models import F, FloatField, IntegerField, Q, QuerySet
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+
+from ..settings import cruddals_settings
+
+
+TEXT_RANK_ANNOTATION = "_cruddals_text_rank"
+TEXT_VECTOR_ALIAS = "_cruddals_text_vector"
+
+_text_searches = {}
+
+
+class TextSearch:
+    """The full-text index of the `fields` of a model"""
+
+    def __init__(self, model, fields, config=None):
+        self.model = model
+        self.fields = [model._meta.get_field(field) for field in fields]
+        self.config = config or cruddals_settings.TEXT_SEARCH_CONFIG
+        self._built_tables = set()
+        # The time each database was last found without the shadow table, by its alias
+        self._missing_tables = {}
+
+    @property
+    def index_name(self):
+        digest = hashlib.md5(self.model._meta.db_table.encode()).hexdigest()[:12]
+        return f"cruddals_fts_{digest}"
+
+    @property
+    def fts_table(self):
+        return f"{self.model._meta.db_table}_cruddals_fts"
+
+    def can_use_fts_table(self, connection, recheck_missing=False):
+        """
+        If the FTS5 shadow table of the model exists in the SQLite database of `connection`.
+
+        :param recheck_missing: If a table found missing less than `TEXT_SEARCH_TABLE_CHECK_INTERVAL` seconds
+            ago is checked again, as the signals do so a row saved after another process built it isn't lost.
+        """
+        # The rowid of the shadow table is the pk of the model
+        if connection.vendor != "sqlite" or not isinstance(self.model._meta.pk, IntegerField):
+            return False
+        if connection.alias in self._built_tables:
+            return True
+        missing_since = self._missing_tables.get(connection.alias)
+        if not recheck_missing and missing_since is not None and time.monotonic() - missing_since < cruddals_settings.TEXT_SEARCH_TABLE_CHECK_INTERVAL:
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.fts_table])
+            if cursor.fetchone() is None:
+                self._missing_tables[connection.alias] = time.monotonic()
+                return False
+        self._missing_tables.pop(connection.alias, None)
+        self._built_tables.add(connection.alias)
+        return True
+
+    def get_match_query(self, text):
+        """Every word of `text` as a FTS5 prefix query, so the operators of FTS5 can't be injected"""
+        words = ['"{}"*'.format(word.replace('"', '""')) for word in text.split()]
+        return " ".join(words)
+
+    def search(self, queryset, text, order_by_rank=True):
+        """
+        Filter `queryset` by `text`.
+
+        :param queryset: The queryset of the model.
+        :param text: The text typed by the user.
+        :param order_by_rank: If the rows are ordered by relevance, when the user doesn't set an order.
+        :return: The filtered queryset, the relevance of every row is annotated in `TEXT_RANK_ANNOTATION`.
+        """
+        if not text or not text.split():
+            return queryset
+        connection = connections[queryset.db]
+
+        if connection.vendor == "postgresql":
+            from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+            search_type = "websearch" if connection.pg_version >= 110000 else "plain"
+            query = SearchQuery(text, config=self.config, search_type=search_type)
+            # `alias()` doesn't select the vector, it's new in Django 3.2
+            add_vector = queryset.alias if hasattr(QuerySet, "alias") else queryset.annotate
+            queryset = add_vector(**{TEXT_VECTOR_ALIAS: SearchVector(*[field.name for field in self.fields], config=self.config)})
+            queryset = queryset.filter(**{TEXT_VECTOR_ALIAS: query})
+            rank = SearchRank(F(TEXT_VECTOR_ALIAS), query)
+
+        elif self.can_use_fts_table(connection):
+            quote_name = connection.ops.quote_name
+            fts_table = quote_name(self.fts_table)
+            match_query = self.get_match_query(text)
+            queryset = queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s", [match_query]))
+            # bm25 is negative, the better the match the lower it is
+            column = f"{quote_name(self.model._meta.db_table)}.{quote_name(self.model._meta.pk.column)}"
+            rank = RawSQL(
+                f"SELECT -bm25({fts_table}) FROM {fts_table} WHERE {fts_table} MATCH %s AND rowid = {column}",
+                [match_query],
+                output_field=FloatField(),
+            )
+
+        else:
+            for word in text.split():
+                word_q = Q()
+                for field in self.fields:
+                    word_q |= Q(**{f"{field.name}__icontains": word})
+                queryset = queryset.filter(word_q)
+            return queryset
+
+        if order_by_rank:
+            queryset = queryset.annotate(**{TEXT_RANK_ANNOTATION: rank}).order_by(f"-{TEXT_RANK_ANNOTATION}", "pk")
+        return queryset
+
+    def get_row(self, instance):
+        return [str(value) if value is not None else "" for value in (getattr(instance, field.attname) for field in self.fields)]
+
+    def update_row(self, sender, instance, using=None, **kwargs):
+        connection = connections[using or router.db_for_write(self.model)]
+        if not self.can_use_fts_table(connection, recheck_missing=True):
+            return
+        quote_name = connection.ops.quote_name
+        columns = ", ".join(quote_name(field.column) for field in self.fields)
+        placeholders = ", ".join(["%s"] * len(self.fields))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {quote_name(self.fts_table)} WHERE rowid = %s", [instance.pk])
+            cursor.execute(
+                f"INSERT INTO {quote_name(self.fts_table)} (rowid, {columns}) VALUES (%s, {placeholders})",
+                [instance.pk, *self.get_row(instance)],
+            )
+
+    def delete_row(self, sender, instance, using=None, **kwargs):
+        connection = connections[using or router.db_for_write(self.model)]
+        if not self.can_use_fts_table(connection, recheck_missing=True):
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {connection.ops.quote_name(self.fts_table)} WHERE rowid = %s", [instance.pk])
+
+    def build_index(self, using, rebuild=False):
+        """
+        Create the index of the model in the database `using`, and fill the SQLite shadow table.
+
+        :return: False if the backend has no full-text index.
+        """
+        connection = connections[using]
+        quote_name = connection.ops.quote_name
+
+        if connection.vendor == "postgresql":
+            from django.contrib.postgres.indexes import GinIndex
+            from django.contrib.postgres.search import SearchVector
+
+            with connection.cursor() as cursor:
+                if rebuild:
+                    cursor.execute(f"DROP INDEX IF EXISTS {quote_name(self.index_name)}")
+                cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s", [self.index_name])
+                if cursor.fetchone() is not None:
+                    return True
+            index = GinIndex(SearchVector(*[field.name for field in self.fields], config=self.config), name=self.index_name)
+            with connection.schema_editor() as schema_editor:
+                schema_editor.add_index(self.model, index)
+            return True
+
+        if connection.vendor == "sqlite":
+            fts_table = quote_name(self.fts_table)
+            columns = ", ".join(quote_name(field.column) for field in self.fields)
+            values = ", ".join(f"COALESCE({quote_name(field.column)}, '')" for field in self.fields)
+            with connection.cursor() as cursor:
+                if rebuild:
+                    cursor.execute(f"DROP TABLE IF EXISTS {fts_table}")
+                cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5({columns})")
+                cursor.execute(f"DELETE FROM {fts_table}")
+                cursor.execute(
+                    f"INSERT INTO {fts_table} (rowid, {columns}) "
+                    f"SELECT {quote_name(self.model._meta.pk.column)}, {values} FROM {quote_name(self.model._meta.db_table)}"
+                )
+            self._built_tables.add(connection.alias)
+            self._missing_tables.pop(connection.alias, None)
+            return True
+
+        return False
+
+
+def register_text_search(model, fields, config=None):
+    """
+    Register the fields of `model` indexed for full-text search and connect the signals that keep
+    the SQLite shadow table up to date.
+    """
+    text_search = TextSearch(model, fields, config)
+    dispatch_uid = f"cruddals_text_search_{model._meta.label}"
+    # A schema built again replaces the handlers of the previous one
+    post_save.disconnect(sender=model, dispatch_uid=dispatch_uid)
+    post_delete.disconnect(sender=model, dispatch_uid=dispatch_uid)
+    post_save.connect(text_search.update_row, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_delete.connect(text_search.delete_row, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    _text_searches[model] = text_search
+    return text_search
+
+
+def get_text_search(model):
+    return _text_searches.get(model, None)
+
+
+def get_text_searches():
+    return list(_text_searches.values())
@@ -10,6 +10,7 @@ import warnings
 from collections import OrderedDict
 from typing import Dict
 from django.db.models.functions import Lower
+from django.db.models import Count, ForeignObjectRel, Window, prefetch_related_objects
 
 import graphene
 from graphene.types.utils import yank_fields_from_attrs
@@ -25,14 +26,22 @@ from graphene_django_cruddals_v1.converter.utils import FieldPurposeConvert, con
 from graphene_django_cruddals_v1.copy_graphene_django.types import ErrorType, ErrorsType
 from graphene_django_cruddals_v1.registry.registry_global import RegistryGlobal, TypeRegistryForField, get_global_registry
 from ..helpers.helpers import CruddalsRelationField, PaginatedInput, PaginationInterface, TypesMutation
+from .cursor_pagination import get_start_and_end_cursor, order_by_cursor_keys, paginate_queryset_by_cursor
+from .loaders import mark_siblings
+from .query_optimizer import get_selected_field_names
+from .where_compiler import compile_where
+from .aggregates import QuerysetAggregates, get_aggregatable_fields, get_aggregates_type_for_field
+from .indexed_only import restrict_input_fields
+from .bulk_mutation import bulk_mutate, get_m2m_links, save_form
+from ..settings import cruddals_settings
 
 from collections.abc import Iterable
 
 import inspect
 from django import VERSION as DJANGO_VERSION
-from django.db import connection, models, transaction
+from django.db import DatabaseError, IntegrityError, connection, connections, models, transaction
 from django.db.models.manager import Manager
-from itertools import chain
+from itertools import chain, islice
 from django.db.models import (
     NOT_PROVIDED,
     Q,
@@ -61,8 +70,8 @@ import re
 from text_unidecode import unidecode
 
 from graphene.types.mutation import MutationOptions
-from graphene_django_cruddals_v1.copy_graphene_django.constants import MUTATION_ERRORS_FLAG
-from django.core.exceptions import ValidationError
+from graphene_django_cruddals_v1.copy_graphene_django.constants import MUTATION_ERRORS_FLAG, STREAMING_RESPONSE_FLAG
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 
 
 class TypePurposeInputFields(Enum):
@@ -139,6 +148,14 @@ def get_model_fields(model: DjangoModel, for_queryset=False, for_mutation=False,
 
     return [(name, field) for name, field in all_fields if not str(name).endswith("+") and is_included(name, only_fields, exclude_fields)]
 
+_model_fields_map_cache = {}
+
+def get_model_fields_map(model: DjangoModel):
+    """Cached `{name: field}` of `get_model_fields(model)`"""
+    if model not in _model_fields_map_cache:
+        _model_fields_map_cache[model] = dict(get_model_fields(model))
+    return _model_fields_map_cache[model]
+
 def maybe_queryset(value):
     if isinstance(value, Manager):
         value = value.get_queryset()
@@ -153,7 +170,7 @@ def set_rollback():
         transaction.set_rollback(True)
 
 def validate_list_func_cruddals(functions, exclude_functions):
-    valid_values = ["create", "read", "update", "delete", "deactivate", "activate", "list", "search"]
+    valid_values = ["create", "read", "update", "delete", "deactivate", "activate", "list", "search", "facet"]
 
     if functions and exclude_functions:
         raise ValueError("You cannot provide both 'functions' and 'exclude_functions'. Please provide only one.")
@@ -259,7 +276,221 @@ def toggle_active_status(option, data, field="is_active"):
         data.update(**{field: False})
     return data
 
-def paginate_queryset(qs, page_size="All", page=1, paginated_type=None, **kwargs):
+def normalize_page_and_page_size(page, page_size):
+    try:
+        page = int(page)
+        page_size = int(page_size)
+    except:
+        page = 1
+        page_size = 1
+
+    if page == 0:
+        page = 1
+    if page_size == 0:
+        page_size = 1
+    return page, page_size
+
+def get_paginated_result(objects, total, page, page_size, paginated_type, has_next=None, **kwargs):
+    """
+    Build the paginated_type of a page already loaded, with the same values that `paginate_queryset` returns.
+
+    :param objects: The objects of the page.
+    :param total: The number of objects of all the pages, None if the page was loaded without counting them.
+    :param page: The number of the page, it must exist.
+    :param page_size: The number of items per page.
+    :param paginated_type: The pagination type to return.
+    :param has_next: If there is a next page, for a page loaded without counting the objects.
+    :param kwargs: Additional keyword arguments for the paginated_type.
+    :return: An instance of paginated_type with pagination information and objects.
+    """
+    start_cursor, end_cursor = get_start_and_end_cursor(objects)
+    if total is None:
+        offset = page_size * (page - 1)
+        return paginated_type(
+            total=None,
+            page=page,
+            pages=None,
+            has_next=has_next,
+            has_prev=page > 1,
+            index_start_obj=offset + 1 if objects else 0,
+            index_end_obj=offset + len(objects),
+            objects=objects,
+            start_cursor=start_cursor,
+            end_cursor=end_cursor,
+            **kwargs
+        )
+    pages = max(1, -(-total // page_size))
+    return paginated_type(
+        total=total,
+        page=page,
+        pages=pages,
+        has_next=page < pages,
+        has_prev=page > 1,
+        index_start_obj=0 if total == 0 else page_size * (page - 1) + 1,
+        index_end_obj=total if page == pages else page * page_size,
+        objects=objects,
+        start_cursor=start_cursor,
+        end_cursor=end_cursor,
+        **kwargs
+    )
+
+def paginate_queryset_without_count(qs, page_size, page, paginated_type, **kwargs):
+    """
+    Paginate a queryset without counting its rows, for the fields that don't select `total` nor `pages`.
+    One extra row tells if there is a next page.
+
+    :return: An instance of paginated_type without `total` and `pages`,
+        or None if the page doesn't exist and the rows must be counted to return the last page.
+    """
+    page, page_size = normalize_page_and_page_size(page, page_size)
+    if page < 1:
+        return None
+    offset = page_size * (page - 1)
+    objects = mark_siblings(qs[offset:offset + page_size + 1])
+    if not objects and page > 1:
+        return None
+
+    return get_paginated_result(objects[:page_size], None, page, page_size, paginated_type, has_next=len(objects) > page_size, **kwargs)
+
+def can_count_total_with_window(qs):
+    """
+    The total of a queryset can be read from a `COUNT(*) OVER ()` in its page if the backend supports
+    window functions and the rows of the page query are the rows of the queryset. A `DISTINCT` is only
+    allowed if the query has no multi-valued joins, because the window counts the rows before it.
+    """
+    query = qs.query
+    if (
+        not cruddals_settings.COUNT_TOTAL_WITH_WINDOW
+        or not connections[qs.db].features.supports_over_clause
+        or query.is_sliced
+        or query.group_by is not None
+        or query.distinct_fields
+        or query.combinator
+    ):
+        return False
+    return not (query.distinct and has_multivalued_joins(qs))
+
+def paginate_queryset_with_window_count(qs, page_size, page, paginated_type, **kwargs):
+    """
+    Load a page and the total of a queryset in one query annotated with `COUNT(*) OVER ()`.
+
+    :return: An instance of paginated_type, or None if the page is empty and the rows must be
+        counted apart to know the total or to return the last page.
+    """
+    page, page_size = normalize_page_and_page_size(page, page_size)
+    if page < 1:
+        return None
+    if qs.query.distinct:
+        # Without multi-valued joins every row is already distinct
+        qs = qs.all()
+        qs.query.distinct = False
+    offset = page_size * (page - 1)
+    qs = qs.annotate(_cruddals_total=Window(expression=Count("*")))
+    objects = mark_siblings(qs[offset:offset + page_size])
+    if not objects:
+        return None
+    return get_paginated_result(objects, objects[0]._cruddals_total, page, page_size, paginated_type, **kwargs)
+
+def get_estimated_count(queryset):
+    """
+    Return the number of rows of the table of `queryset` estimated by the statistics of the database:
+    `pg_class.reltuples` on PostgreSQL, `sqlite_stat1` on SQLite and `information_schema.TABLES` on MySQL.
+
+    :return: The estimated number of rows, or None if the backend has no statistics of the table.
+    """
+    db_table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        sql, params = "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [connection.ops.quote_name(db_table)]
+    elif connection.vendor == "sqlite":
+        sql, params = "SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [db_table]
+    elif connection.vendor == "mysql":
+        sql, params = "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [db_table]
+    else:
+        return None
+
+    try:
+        with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        # e.g. the `sqlite_stat1` table doesn't exist until the database is analyzed
+        return None
+    if row is None or row[0] is None:
+        return None
+    # The first number of a `sqlite_stat1` row is the number of rows of the table
+    estimated_count = int(str(row[0]).split()[0])
+    # PostgreSQL returns -1 for a table never analyzed
+    return estimated_count if estimated_count >= 0 else None
+
+def set_estimated_total(paginated, estimated_total, page_size):
+    """Replace the total of a page loaded without counting by the estimated total of its table"""
+    # Outdated statistics can estimate less rows than the rows already seen
+    seen = (paginated.index_end_obj or 0) + (1 if paginated.has_next else 0)
+    paginated.total = max(estimated_total, seen)
+    paginated.pages = max(1, -(-paginated.total // page_size))
+    paginated.total_is_approximate = True
+    return paginated
+
+class ChunkedQuerysetIterable:
+    """
+    Iterate a queryset with `QuerySet.iterator` (a server-side cursor where the backend supports it)
+    without keeping its rows in memory. The `prefetch_related` lookups of the queryset, ignored by
+    `iterator`, are prefetched for every chunk, and the rows of a chunk are marked as siblings
+    so the loaders batch their related objects.
+    """
+
+    def __init__(self, queryset, chunk_size):
+        self.queryset = queryset
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        prefetch_lookups = self.queryset._prefetch_related_lookups
+        rows = self.queryset.iterator(chunk_size=self.chunk_size)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            if prefetch_lookups:
+                prefetch_related_objects(chunk, *prefetch_lookups)
+            yield from mark_siblings(chunk)
+
+def is_streaming_response(info):
+    """If the response of the request is streamed by the view, see `GraphQLView.stream_response`"""
+    return getattr(getattr(info, "context", None), STREAMING_RESPONSE_FLAG, False)
+
+def paginate_queryset_as_stream(qs, paginated_type, with_total, **kwargs):
+    """
+    Return all the rows of a queryset as a `ChunkedQuerysetIterable` in a single page. The execution completes
+    every row into the list of the result, only the model instances of a chunk are in memory at once.
+    """
+    total = qs.count() if with_total else None
+    return paginated_type(
+        total=total,
+        page=1,
+        pages=1,
+        has_next=False,
+        has_prev=False,
+        index_start_obj=None if total is None else min(total, 1),
+        index_end_obj=total,
+        objects=ChunkedQuerysetIterable(qs, cruddals_settings.STREAMING_CHUNK_SIZE),
+        # The last row is known only after the rows are serialized
+        start_cursor=None,
+        end_cursor=None,
+        **kwargs
+    )
+
+def load_rows_for_page_size_all(qs):
+    """Load all the rows of a queryset, up to the `MAX_ROWS_FOR_PAGE_SIZE_ALL` setting"""
+    max_rows = cruddals_settings.MAX_ROWS_FOR_PAGE_SIZE_ALL
+    if max_rows is None:
+        return mark_siblings(qs)
+    rows = list(qs[:max_rows + 1])
+    if len(rows) > max_rows:
+        raise GraphQLError(f"The page size 'All' returns at most {max_rows} rows, use a page size or a streaming view")
+    return mark_siblings(rows)
+
+def paginate_queryset(qs, page_size="All", page=1, paginated_type=None, after=None, before=None, info=None, approximate_count_threshold=None, **kwargs):
     """
     Paginate a queryset based on the specified parameters.
 
@@ -267,24 +498,56 @@ def paginate_queryset(qs, page_size="All", page=1, paginated_type=None, **kwargs
     :param page_size: The number of items per page.
     :param page: The current page number.
     :param paginated_type: The pagination type to return.
+    :param after: Cursor of the row before the page, it replaces `page` by a keyset pagination.
+    :param before: Cursor of the row after the page, it replaces `page` by a keyset pagination.
+    :param info: The ResolveInfo of the paginated field, the rows are counted only if it selects `total` or `pages`.
+    :param approximate_count_threshold: If it is given, the total of an unfiltered queryset is estimated with the
+        statistics of the database when they estimate at least this number of rows.
     :param kwargs: Additional keyword arguments for the paginated_type.
     :return: An instance of paginated_type with pagination information and objects.
     """
+    selected_fields = get_selected_field_names(info) if info is not None else None
+    with_total = selected_fields is None or "total" in selected_fields or "pages" in selected_fields
+    if isinstance(qs, QuerySet) and "aggregates" not in kwargs and "aggregates" in getattr(getattr(paginated_type, "_meta", None), "fields", {}):
+        # Computed over all the rows, only if the `aggregates` field is resolved
+        kwargs["aggregates"] = QuerysetAggregates(qs)
+
+    estimated_total = None
+    if with_total and approximate_count_threshold is not None and page_size != 'All' and isinstance(qs, QuerySet):
+        estimated_total = get_estimated_count(qs)
+        if estimated_total is not None and estimated_total < approximate_count_threshold:
+            estimated_total = None
+
+    if isinstance(qs, QuerySet):
+        if after or before:
+            paginated = paginate_queryset_by_cursor(qs, page_size, after, before, paginated_type, with_total=with_total and estimated_total is None, **kwargs)
+            if estimated_total is not None:
+                paginated = set_estimated_total(paginated, estimated_total, max(1, int(page_size)))
+            return paginated
+        qs = order_by_cursor_keys(qs)
+        if page_size == 'All':
+            if is_streaming_response(info):
+                return paginate_queryset_as_stream(qs, paginated_type, with_total, **kwargs)
+            # All the rows are loaded anyway, so they are counted in memory
+            qs = load_rows_for_page_size_all(qs)
+        elif not with_total or estimated_total is not None:
+            paginated = paginate_queryset_without_count(qs, page_size, page, paginated_type, **kwargs)
+            if paginated is not None and estimated_total is not None:
+                _, page_size = normalize_page_and_page_size(page, page_size)
+                return set_estimated_total(paginated, estimated_total, page_size)
+            if paginated is not None:
+                return paginated
+        elif can_count_total_with_window(qs):
+            paginated = paginate_queryset_with_window_count(qs, page_size, page, paginated_type, **kwargs)
+            if paginated is not None:
+                return paginated
+    elif after or before:
+        raise GraphQLError("Only the rows of a queryset can be paginated with cursors")
 
     if page_size == 'All':
-        page_size = qs.count()
+        page_size = len(qs)
     
-    try:
-        page = int(page)
-        page_size = int(page_size)
-    except:
-        page = 1
-        page_size = 1
-
-    if page == 0:
-        page = 1
-    if page_size == 0:
-        page_size = 1
+    page, page_size = normalize_page_and_page_size(page, page_size)
     
     p = Paginator(qs, page_size)
     
@@ -294,7 +557,8 @@ def paginate_queryset(qs, page_size="All", page=1, paginated_type=None, **kwargs
         page_obj = p.page(1)
     except EmptyPage:
         page_obj = p.page(p.num_pages)
-    
+
+    start_cursor, end_cursor = get_start_and_end_cursor(page_obj.object_list)
     return paginated_type(
         total=p.count,
         page=page_obj.number,
@@ -304,6 +568,8 @@ def paginate_queryset(qs, page_size="All", page=1, paginated_type=None, **kwargs
         index_start_obj = page_obj.start_index(),
         index_end_obj = page_obj.end_index(),
         objects=page_obj.object_list,
+        start_cursor=start_cursor,
+        end_cursor=end_cursor,
         **kwargs
     )
 
@@ -429,6 +695,35 @@ def get_name_of_model_in_different_case(model, prefix="", suffix=""):
         "plural_pascal_case": plural_pascal_case,
     }
 
+def convert_model_to_aggregates_object_type(model, model_as_object_type=None, prefix_for_name="", suffix_for_name=""):
+    registry = get_global_registry(f"{prefix_for_name}{suffix_for_name}")
+    registries_for_model = registry.get_registry_for_model(model)
+    if registries_for_model is not None and "aggregates_object_type" in registries_for_model:
+        return registries_for_model["aggregates_object_type"]
+
+    names_of_model = get_name_of_model_in_different_case(model, prefix=prefix_for_name, suffix=suffix_for_name)
+    singular_camel_case_name = names_of_model.get("camel_case")
+    ModelAggregatesType = build_class(
+        name=f"{singular_camel_case_name}AggregatesType",
+        bases=(graphene.ObjectType,),
+        attrs={
+            "Meta": build_class(name='Meta', attrs={"name": f"{singular_camel_case_name}AggregatesType"}),
+            "count": graphene.Int(),
+            **{
+                name: graphene.Field(get_aggregates_type_for_field(field))
+                for name, field in get_aggregatable_fields(model, model_as_object_type).items()
+            },
+        }
+    )
+    registry.register_model(model, "aggregates_object_type", ModelAggregatesType)
+    return ModelAggregatesType
+
+def resolve_aggregates(root, info):
+    aggregates = getattr(root, "aggregates", None)
+    if isinstance(aggregates, QuerysetAggregates):
+        return aggregates.resolve(info)
+    return aggregates
+
 def convert_model_to_paginated_object_type(model, model_as_object_type=None, extra_attrs={}, prefix_for_name="", suffix_for_name=""):
     from graphene_django_cruddals_v1.copy_graphene_django.fields import DjangoListField
     
@@ -455,6 +750,11 @@ def convert_model_to_paginated_object_type(model, model_as_object_type=None, ext
             attrs={
                 "Meta": MetaPaginatedType, 
                 "objects": DjangoListField(model_as_object_type),
+                "aggregates": graphene.Field(
+                    convert_model_to_aggregates_object_type(model, model_as_object_type, prefix_for_name, suffix_for_name),
+                    description="The aggregates of all the rows that match the filters, not only the rows of the page",
+                ),
+                "resolve_aggregates": resolve_aggregates,
                 **extra_attrs
             }
         ) 
@@ -630,6 +930,9 @@ def get_input_fields(model: DjangoModel, registry: RegistryGlobal, purpose:TypeP
                     converted_field.kwargs["required"] = False
 
         input_fields[name] = converted_field
+
+    if purpose in ("filter", "order_by") and meta_attrs.get("indexed_only", False):
+        input_fields = restrict_input_fields(model, input_fields, purpose, meta_attrs)
     return input_fields
 
 def get_input_object_type(model, purpose, type_mutation:TypesMutation=None, meta_attrs={}, extra_attrs={}, prefix_for_name="", suffix_for_name=""):
@@ -653,6 +956,9 @@ def get_input_object_type(model, purpose, type_mutation:TypesMutation=None, meta
         attrs=attrs_final
     )
     registry.register_model(model, type_input_object_type, ModelInputObjectType)
+    if purpose == "filter" and meta_attrs.get("indexed_only", False):
+        # The relations of other indexed-only where inputs to the model use this one
+        registry.register_model(model, "input_object_type_for_indexed_filter", ModelInputObjectType)
     return ModelInputObjectType
 
 def convert_model_fields_to_mutation_input_fields(model: DjangoModel, registry:RegistryGlobal, for_type_mutation:TypesMutation=TypesMutation.CREATE.value, meta_attrs={}):
@@ -669,19 +975,39 @@ def convert_model_to_mutation_input_object_type(model:DjangoModel, type_mutation
         suffix_for_name=suffix_for_name
     )
 
-def convert_model_to_filter_input_object_type(model:DjangoModel, extra_attrs={}, prefix_for_name="", suffix_for_name=""):
+def convert_model_to_indexed_filter_input_object_type(model:DjangoModel):
+    """
+    The where input of `model` with only the filters its indexes serve, for the relations of the indexed-only
+    where inputs to it. It's the where input of the model if the model is indexed-only too.
+    """
+    registry = get_global_registry()
+    registries_for_model = registry.get_registry_for_model(model) or {}
+    if "input_object_type_for_indexed_filter" in registries_for_model:
+        return registries_for_model["input_object_type_for_indexed_filter"]
+    singular_camel_case_name = get_name_of_model_in_different_case(model).get("camel_case")
+    IndexedFilterInputObjectType = build_class(
+        name=f"Indexed{singular_camel_case_name}FilterInput",
+        bases=(graphene.InputObjectType,),
+        attrs=get_input_fields(model, registry, "filter", meta_attrs={"indexed_only": True}),
+    )
+    registry.register_model(model, "input_object_type_for_indexed_filter", IndexedFilterInputObjectType)
+    return IndexedFilterInputObjectType
+
+def convert_model_to_filter_input_object_type(model:DjangoModel, meta_attrs={}, extra_attrs={}, prefix_for_name="", suffix_for_name=""):
     return get_input_object_type(
         model=model,
         purpose='filter',
+        meta_attrs=meta_attrs,
         extra_attrs=extra_attrs,
         prefix_for_name=prefix_for_name,
         suffix_for_name=suffix_for_name
     )
 
-def convert_model_to_order_by_input_object_type(model:DjangoModel, extra_attrs={}, prefix_for_name="", suffix_for_name=""):
+def convert_model_to_order_by_input_object_type(model:DjangoModel, meta_attrs={}, extra_attrs={}, prefix_for_name="", suffix_for_name=""):
     return get_input_object_type(
         model=model, 
         purpose='order_by', 
+        meta_attrs=meta_attrs,
         extra_attrs=extra_attrs, 
         prefix_for_name=prefix_for_name, 
         suffix_for_name=suffix_for_name
@@ -740,24 +1066,26 @@ def get_args(where):
             args[arg_key] = arg_value
     return args
 
-def where_input_to_Q(where):
-
-    AND = Q()
-    OR = Q()
-    NOT = Q()
-
-    if "OR" in where.keys():
-        for w in where.pop("OR"):
-            OR = OR | Q(where_input_to_Q(w))
-
-    if "AND" in where.keys():
-        for w in where.pop("AND"):
-            AND = AND & Q(where_input_to_Q(w))
+def where_input_to_Q(where, model=None):
+    """
+    Convert a where input to a Q with the plan of its shape, see `where_compiler`.
+    If the `model` of the where is given, the filters of a to-many relation are compiled to `EXISTS` subqueries.
+    """
+    return compile_where(where, model)
 
-    if "NOT" in where.keys():
-        NOT = NOT & ~Q(where_input_to_Q(where.pop("NOT")))
+def has_multivalued_joins(queryset):
+    """If the query of `queryset` has a JOIN that can multiply its rows (a reverse ForeignKey or a ManyToMany)"""
+    for join in queryset.query.alias_map.values():
+        join_field = getattr(join, "join_field", None)
+        if isinstance(join_field, ForeignObjectRel) and join_field.multiple:
+            return True
+    return False
 
-    return Q(**get_args(where)) & OR & AND & NOT
+def distinct_if_needed(queryset):
+    """Apply `distinct()` only if a JOIN of the query can return the same row more than once"""
+    if has_multivalued_joins(queryset):
+        return queryset.distinct()
+    return queryset
 
 def order_by_input_to_args(order_by):
     args = []
@@ -775,6 +1103,31 @@ def order_by_input_to_args(order_by):
                     args.append(Lower("__".join(path)).desc())
     return args
 
+def apply_where_and_order_by(queryset, args, default_order_by="pk"):
+    """
+    Apply the `where` and `order_by` arguments of a search or paginated field to a queryset.
+
+    :param queryset: The queryset to filter and order.
+    :param args: The arguments received by the resolver.
+    :param default_order_by: The ordering used when `order_by` is not in the arguments.
+    :return: The filtered and ordered queryset, distinct if its JOINs can repeat a row.
+    """
+    if "where" in args:
+        where = args["where"]
+        obj_q = where_input_to_Q(where, queryset.model)
+        queryset = queryset.filter(obj_q)
+
+    if "order_by" in args or "orderBy" in args:
+        order_by = args.get("order_by") or args.get("orderBy")
+        if isinstance(order_by, dict):
+            order_by = [order_by]
+        list_for_order = order_by_input_to_args(order_by)
+        queryset = queryset.order_by(*list_for_order)
+    else:
+        queryset = queryset.order_by(default_order_by)
+
+    return distinct_if_needed(queryset)
+
 def get_where_arg(model, kw={}, default_required=False, prefix="", suffix=""):
     attrs_for_where_arg = kw.get("modify_where_argument", {})
     model_as_filter_input_object_type = convert_model_to_filter_input_object_type(
@@ -907,14 +1260,20 @@ def create_direct_relation_model_objects(obj_to_relate, list_objects_to_relate,
         elif isinstance( field_relation, (ManyToManyField) ):
             actual_reverse_pks_of_direct_obj = []
             if direct_field_detail["pk_field_name"] in obj_to_relate:
-                direct_pk_value = obj_to_relate[direct_field_detail["pk_field_name"]]
-                direct_actual_obj = direct_field_detail["model"].objects.get(pk=direct_pk_value)
-                query_set_actual_objs_related:QuerySet = getattr(direct_actual_obj, direct_field_detail["name_field"]).all()
-                actual_reverse_pks_of_direct_obj = list(query_set_actual_objs_related.values_list("pk", flat=True))
+                direct_pk_value = direct_field_detail["model"]._meta.pk.to_python(obj_to_relate[direct_field_detail["pk_field_name"]])
+                actual_reverse_pks_of_direct_obj = list(get_m2m_links(field_relation, [direct_pk_value])[direct_pk_value])
             obj_to_relate[name_field_relate] = reverse_pks + actual_reverse_pks_of_direct_obj
     return response_direct_objs
 
 def create_reverse_relation_model_objects(pk_obj_to_relate, list_objects_to_relate, name_field_relate, field_relation, direct_field_detail, mutation, root, info):
+    actual_links = {}
+    if isinstance( field_relation, (ManyToManyRel) ):
+        # The current objects of all the objects to relate, in one query
+        pk_field = direct_field_detail["model"]._meta.pk
+        reverse_pk_values = [pk_field.to_python(getattr(obj_to_relate, direct_field_detail["pk_field_name"])) for obj_to_relate in list_objects_to_relate if getattr(obj_to_relate, direct_field_detail["pk_field_name"], None)]
+        if reverse_pk_values:
+            actual_links = get_m2m_links(direct_field_detail["field"], reverse_pk_values)
+
     for obj_to_relate in list_objects_to_relate:
         if isinstance( field_relation, (ManyToOneRel, OneToOneRel) ):
             obj_to_relate[name_field_relate] = pk_obj_to_relate
@@ -922,10 +1281,8 @@ def create_reverse_relation_model_objects(pk_obj_to_relate, list_objects_to_rela
         elif isinstance( field_relation, (ManyToManyRel) ):
             actual_pks_of_obj_to_relate = []
             if getattr(obj_to_relate, direct_field_detail["pk_field_name"], None):
-                reverse_pk_value = getattr(obj_to_relate, direct_field_detail["pk_field_name"]) # ===> Equivalente QuestionDetail(id=1) = id=1
-                reverse_actual_obj = direct_field_detail["model"].objects.get(pk=reverse_pk_value)  # ===> QuestionDetail.objects.get(pk=)
-                query_set_reverse_actual_objs:QuerySet = getattr(reverse_actual_obj, direct_field_detail["name_field"]).all()
-                actual_pks_of_obj_to_relate = list(query_set_reverse_actual_objs.values_list("pk", flat=True))
+                reverse_pk_value = direct_field_detail["model"]._meta.pk.to_python(getattr(obj_to_relate, direct_field_detail["pk_field_name"])) # ===> Equivalente QuestionDetail(id=1) = id=1
+                actual_pks_of_obj_to_relate = list(actual_links.get(reverse_pk_value, {}))
             
             obj_to_relate[name_field_relate] = [pk_obj_to_relate] + actual_pks_of_obj_to_relate
     return mutation.mutate_and_get_payload(root, info, list_objects_to_relate)
@@ -945,9 +1302,9 @@ def handle_disconnect_objs_related(direct_field_detail, model, value_of_field, o
     list_values_to_disconnect = []
     if "disconnect" in value_of_field:
         for value_to_disconnect in value_of_field["disconnect"]:
-            obj_q = where_input_to_Q(value_to_disconnect)
+            obj_q = where_input_to_Q(value_to_disconnect, model)
             final_data = model.objects.filter(obj_q)
-            final_data = list(final_data.distinct())
+            final_data = list(distinct_if_needed(final_data))
             list_values_to_disconnect = list_values_to_disconnect+final_data
     
     if list_values_to_disconnect:
@@ -1049,6 +1406,7 @@ class DjangoModelDjangoFormMutationOptions(MutationOptions):
     form_class = None
     model = None
     return_field_name = None
+    compiled_validation = False
 
 class ClientIDMutation(graphene.Mutation):
     class Meta:
@@ -1107,7 +1465,7 @@ class DjangoModelFormMutation(ClientIDMutation):
     errors = graphene.List(ErrorsType)
 
     @classmethod
-    def __init_subclass_with_meta__( cls, form_class=None, model=None, return_field_name='objects', input_fields=None, name=None, only_fields=(), exclude_fields=(), **options):
+    def __init_subclass_with_meta__( cls, form_class=None, model=None, return_field_name='objects', input_fields=None, name=None, only_fields=(), exclude_fields=(), compiled_validation=False, **options):
         
         if not form_class:
             raise Exception("form_class is required for DjangoModelFormMutation")
@@ -1148,6 +1506,7 @@ class DjangoModelFormMutation(ClientIDMutation):
         _meta.form_class = form_class
         _meta.model = model
         _meta.return_field_name = return_field_name
+        _meta.compiled_validation = compiled_validation
         _meta.fields = yank_fields_from_attrs(output_fields, _as=graphene.Field)
 
         input_fields = yank_fields_from_attrs(input_fields, _as=graphene.InputField)
@@ -1176,55 +1535,79 @@ class DjangoModelFormMutation(ClientIDMutation):
         return kwargs
 
     @classmethod
-    def mutate_and_get_payload(cls, root, info, input, **kwargs):
-        registry = get_global_registry()
-        arr_obj = []
-        arr_errors = []
-        object_counter = 0
-        for obj_to_modify in input:
-            with transaction.atomic():
-                internal_arr_errors = []
-                model: DjangoModel = cls._meta.model
-                responses_direct = create_relation_model_objects("field_direct", model, registry, obj_to_modify, None, root, info)
-                for name_related_field, obj in responses_direct.items():
+    def mutate_item(cls, root, info, obj_to_modify, object_position, registry, form=None):
+        """
+        Create or update the object of an item of the input, with its nested relations, in its own transaction.
+
+        :param form: The form of the item, already validated, if it has no nested relations.
+        :return: A tuple with the instance saved (None if the item has errors) and the list of its `ErrorsType`.
+        """
+        try:
+            return cls.save_item(root, info, obj_to_modify, object_position, registry, form=form)
+        except IntegrityError as e:
+            # A row saved after the validation of the item has its unique values
+            if info and info.context:
+                setattr(info.context, MUTATION_ERRORS_FLAG, True)
+            return None, [ErrorsType.from_errors(object_position, ErrorType.from_errors({NON_FIELD_ERRORS: [str(e)]}))]
+
+    @classmethod
+    def save_item(cls, root, info, obj_to_modify, object_position, registry, form=None):
+        """`mutate_item` without the handling of the rows that conflict with the item when it's saved"""
+        with transaction.atomic():
+            internal_arr_errors = []
+            model: DjangoModel = cls._meta.model
+            responses_direct = create_relation_model_objects("field_direct", model, registry, obj_to_modify, None, root, info)
+            for name_related_field, obj in responses_direct.items():
+                for response in obj.values():
+                    if response:
+                        if response.errors:
+                            for related_error in response.errors:
+                                setattr(related_error, 'object_position', object_position)
+                                for internal_related_error in related_error.errors:
+                                    setattr(internal_related_error, 'field', f"{to_camel_case(name_related_field)}.{internal_related_error.field}")
+                            internal_arr_errors.extend(response.errors)
+            if len(internal_arr_errors) > 0:
+                return None, internal_arr_errors
+            if form is None:
+                form:DjangoModelForm = cls.get_form(root, info, obj_to_modify)
+            if form.is_valid():
+                instance = save_form(form)
+                responses_reverse = create_relation_model_objects("field_inverse", model, registry, obj_to_modify, instance, root, info)
+                for name_related_field, obj in responses_reverse.items():
                     for response in obj.values():
                         if response:
                             if response.errors:
                                 for related_error in response.errors:
-                                    setattr(related_error, 'object_position', object_counter)
+                                    setattr(related_error, 'object_position', object_position)
                                     for internal_related_error in related_error.errors:
                                         setattr(internal_related_error, 'field', f"{to_camel_case(name_related_field)}.{internal_related_error.field}")
                                 internal_arr_errors.extend(response.errors)
+                                transaction.set_rollback(True)
+
                 if len(internal_arr_errors) > 0:
-                    arr_errors.extend(internal_arr_errors)
-                    continue
-                form:DjangoModelForm = cls.get_form(root, info, obj_to_modify)
-                if form.is_valid():
-                    instance = form.save()
-                    responses_reverse = create_relation_model_objects("field_inverse", model, registry, obj_to_modify, instance, root, info)
-                    for name_related_field, obj in responses_reverse.items():
-                        for response in obj.values():
-                            if response:
-                                if response.errors:
-                                    for related_error in response.errors:
-                                        setattr(related_error, 'object_position', object_counter)
-                                        for internal_related_error in related_error.errors:
-                                            setattr(internal_related_error, 'field', f"{to_camel_case(name_related_field)}.{internal_related_error.field}")
-                                    internal_arr_errors.extend(response.errors)
-                                    transaction.set_rollback(True)
-
-                    if len(internal_arr_errors) > 0:
-                        arr_errors.extend(internal_arr_errors)
-                        continue
+                    return None, internal_arr_errors
+                return instance, []
+            else:
+                errors = ErrorType.from_errors(form.errors)
+                e = ErrorsType.from_errors(object_position, errors)
+                if info and info.context:
+                    setattr(info.context, MUTATION_ERRORS_FLAG, True)
+                transaction.set_rollback(True)
+                return None, [e]
+
+    @classmethod
+    def mutate_and_get_payload(cls, root, info, input, **kwargs):
+        registry = get_global_registry()
+        if cruddals_settings.BULK_CREATE_MUTATIONS:
+            arr_obj, arr_errors = bulk_mutate(cls, root, info, input, registry)
+        else:
+            arr_obj = []
+            arr_errors = []
+            for object_counter, obj_to_modify in enumerate(input):
+                instance, errors = cls.mutate_item(root, info, obj_to_modify, object_counter, registry)
+                if instance is not None:
                     arr_obj.append(instance)
-                else:
-                    errors = ErrorType.from_errors(form.errors)
-                    e = ErrorsType.from_errors(object_counter, errors)
-                    arr_errors.append(e)
-                    if info and info.context:
-                        setattr(info.context, MUTATION_ERRORS_FLAG, True)
-                    transaction.set_rollback(True)
-            object_counter = object_counter + 1
+                arr_errors.extend(errors)
         if len(arr_obj) == 0:
             arr_obj = None
         if len(arr_errors) == 0:
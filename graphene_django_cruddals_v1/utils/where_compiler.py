@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+Compiler of the where inputs to Q objects.
+
+A where input is read in a single pass that splits it in its shape (the keys, the lookups and the
+nesting of the `OR`/`AND`/`NOT` operators) and the list of its values. The shape is compiled once to a
+plan, cached by shape and model, so two searches with the same filters and different values only walk
+the plan binding the new values. The where input is never mutated.
+
+With the model of the where, the filters of a to-many relation are compiled to an `EXISTS` subquery
+instead of a JOIN that multiplies the rows, except the relations filtered in more than one level of the
+`OR`/`AND` tree, that must share the JOIN to keep their meaning (Django requires the same related row to
+match every level). The filters inside `NOT` are compiled as lookups, Django already filters them with
+subqueries.
+
+The Q of a where is normalized by `simplify_Q` before it's filtered, so the SQL has no empty or
+duplicated predicates and an `OR` of `exact` values of the same column becomes an `IN`.
+
+An `in` filter of a column of the filtered model with more values than `LARGE_IN_LIST_THRESHOLD` is bound
+as a single parameter, an array on PostgreSQL and a JSON array read with `json_each` on SQLite, so the
+SQL doesn't grow with the list and SQLite doesn't hit its limit of variables.
+"""
+import json
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import BooleanField, Exists, F, ManyToManyField, ManyToManyRel, ManyToOneRel, OneToOneRel, OuterRef, Q
+from django.db.models.expressions import Expression
+
+from ..settings import cruddals_settings
+from .loaders import get_parent_lookup
+
+
+LEAF = None
+
+
+def get_where_shape(where, values):
+    """
+    Return the hashable shape of `where` and append its values to `values`, in the order of the shape.
+    """
+    shape = []
+    for key, value in where.items():
+        if key in ("OR", "AND"):
+            shape.append((key, tuple(get_where_shape(sub_where, values) for sub_where in value or [])))
+        elif key == "NOT":
+            if value is not None:
+                shape.append((key, get_where_shape(value, values)))
+        elif isinstance(value, dict):
+            shape.append((key, get_where_shape(value, values)))
+        else:
+            values.append(value)
+            shape.append((key, LEAF))
+    return tuple(shape)
+
+
+def get_relation_field(model, name):
+    if model is None:
+        return None
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    if not field.is_relation or field.related_model is None:
+        return None
+    return field
+
+
+def is_to_many(field):
+    return field.one_to_many or field.many_to_many
+
+
+def can_filter_with_exists(field):
+    if isinstance(field, ManyToManyField):
+        # Without a reverse query name the related model can't be filtered by its parent
+        return not field.remote_field.is_hidden()
+    return isinstance(field, (ManyToManyRel, ManyToOneRel)) and not isinstance(field, OneToOneRel)
+
+
+def count_to_many_paths(shape, model, counter, prefix="", level=None):
+    """Count the levels of the `OR`/`AND` tree of `shape` that filter every to-many path"""
+    is_new_level = level is None
+    level = set() if is_new_level else level
+    for key, sub_shape in shape:
+        if key in ("OR", "AND"):
+            for sub_where_shape in sub_shape:
+                count_to_many_paths(sub_where_shape, model, counter, prefix)
+        elif key == "NOT" or sub_shape is LEAF:
+            continue
+        else:
+            field = get_relation_field(model, key)
+            if field is None:
+                continue
+            if is_to_many(field):
+                level.add(f"{prefix}{key}")
+            else:
+                count_to_many_paths(sub_shape, field.related_model, counter, f"{prefix}{key}__", level)
+    if is_new_level:
+        for path in level:
+            counter[path] = counter.get(path, 0) + 1
+    return counter
+
+
+class InList(Expression):
+    """`column IN (values)` with the values bound as a single parameter when the backend can read an array"""
+
+    def __init__(self, expression, values, nullable=False):
+        super().__init__(output_field=BooleanField())
+        self.expression = expression
+        self.values = values
+        self.nullable = nullable
+
+    def get_source_expressions(self):
+        return [self.expression]
+
+    def set_source_expressions(self, exprs):
+        self.expression, = exprs
+
+    def as_sql(self, compiler, connection):
+        sql, params = compiler.compile(self.expression)
+        field = self.expression.output_field
+        values = list(dict.fromkeys(
+            field.get_db_prep_value(value, connection, prepared=False) for value in self.values if value is not None
+        ))
+        if not values:
+            return "1 = 0", []
+        if connection.vendor == "postgresql":
+            in_sql, in_params = f"{sql} = ANY(%s)", [*params, values]
+        elif connection.vendor == "sqlite" and connection.features.supports_json_field:
+            in_sql, in_params = f"{sql} IN (SELECT value FROM json_each(%s))", [*params, json.dumps(values, cls=DjangoJSONEncoder)]
+        else:
+            in_sql, in_params = f"{sql} IN ({', '.join(['%s'] * len(values))})", [*params, *values]
+        if self.nullable:
+            # Like the `in` lookup, a negated filter keeps the rows with NULL
+            return f"({in_sql} AND {sql} IS NOT NULL)", [*in_params, *params]
+        return in_sql, in_params
+
+
+def get_in_list_field(model, lookup):
+    """
+    Return the concrete field of `model` filtered by an `in` lookup, or the ForeignKey filtered by the pk of the
+    related model, None if the lookup needs a JOIN or a transform.
+    """
+    if model is None or not lookup.endswith("__in"):
+        return None
+    parts = lookup[:-len("__in")].split("__")
+    try:
+        field = model._meta.pk if parts[0] == "pk" else model._meta.get_field(parts[0])
+    except FieldDoesNotExist:
+        return None
+    if not getattr(field, "concrete", False) or len(parts) > 2:
+        return None
+    if len(parts) == 2 and not ((field.many_to_one or field.one_to_one) and parts[1] in ("pk", field.target_field.name)):
+        return None
+    return field
+
+
+def get_lookup(path):
+    if path.endswith("__equals"):
+        return path[:-len("__equals")] + "__exact"
+    return path
+
+
+class WherePlan:
+    """
+    The compiled steps of a level of a where input. A level collects its lookups in a single `Q(**lookups)`,
+    the lookups of the fields and to-one relations nested in it included, so they share their JOINs as before.
+    """
+
+    def __init__(self, shape, model, shared_paths, prefix="", root_model=None):
+        from .utils import get_real_id
+
+        if not prefix and model is not None:
+            root_model = model
+        self.steps = []
+        for key, sub_shape in shape:
+            path = f"{prefix}{key}"
+            if key in ("OR", "AND"):
+                sub_plans = [WherePlan(sub_where_shape, model, shared_paths, prefix, root_model) for sub_where_shape in sub_shape]
+                self.steps.append((key, sub_plans))
+            elif key == "NOT":
+                self.steps.append((key, WherePlan(sub_shape, None, None, prefix, root_model)))
+            elif sub_shape is LEAF:
+                lookup = get_lookup(path)
+                is_id = lookup in ("id__exact", "id__in") or lookup.endswith(("__id__exact", "__id__in"))
+                in_list_field = get_in_list_field(root_model, lookup)
+                self.steps.append(("LOOKUP", (lookup, get_real_id if is_id else None, in_list_field)))
+            else:
+                field = get_relation_field(model, key) if shared_paths is not None else None
+                if field is not None and is_to_many(field) and path not in shared_paths and can_filter_with_exists(field):
+                    self.steps.append(("EXISTS", (field, prefix, compile_where_shape(sub_shape, field.related_model, True))))
+                elif field is not None and not is_to_many(field):
+                    self.steps.append(("NESTED", WherePlan(sub_shape, field.related_model, shared_paths, f"{path}__", root_model)))
+                else:
+                    # The filters under a shared JOIN keep the lookups of the JOIN
+                    self.steps.append(("NESTED", WherePlan(sub_shape, None, None, f"{path}__", root_model)))
+
+    def collect(self, values, lookups, conditions):
+        threshold = cruddals_settings.LARGE_IN_LIST_THRESHOLD
+        for kind, step in self.steps:
+            if kind == "LOOKUP":
+                lookup, get_real_id, in_list_field = step
+                value = next(values)
+                if get_real_id is not None:
+                    value = [get_real_id(v) for v in value] if isinstance(value, list) else get_real_id(value)
+                if in_list_field is not None and threshold is not None and isinstance(value, (list, tuple)) and len(value) > threshold:
+                    conditions.append(Q(InList(F(in_list_field.attname), value, in_list_field.null)))
+                else:
+                    lookups[lookup] = value
+            elif kind == "NESTED":
+                step.collect(values, lookups, conditions)
+            elif kind == "EXISTS":
+                field, prefix, sub_plan = step
+                parent_lookup, parent_attname = get_parent_lookup(field)
+                related_queryset = field.related_model._base_manager.filter(**{parent_lookup: OuterRef(f"{prefix}{parent_attname}")})
+                related_queryset = related_queryset.filter(simplify_Q(sub_plan.build(values)))
+                conditions.append(Q(Exists(related_queryset.values("pk"))))
+            elif kind == "OR":
+                OR = Q()
+                for sub_plan in step:
+                    OR = OR | Q(sub_plan.build(values))
+                conditions.append(OR)
+            elif kind == "AND":
+                AND = Q()
+                for sub_plan in step:
+                    AND = AND & Q(sub_plan.build(values))
+                conditions.append(AND)
+            elif kind == "NOT":
+                conditions.append(~Q(step.build(values)))
+
+    def build(self, values):
+        """Return the Q of the level binding the next values of the iterator `values`"""
+        lookups, conditions = {}, []
+        self.collect(values, lookups, conditions)
+        q = Q(**lookups)
+        for condition in conditions:
+            q &= condition
+        return q
+
+
+def get_foldable_values(child):
+    """
+    Return the column and the values of a `exact` or `in` lookup that can be folded in an `IN`, None if it can't.
+    NULL values and expressions are left out, `IN` doesn't match them the same way.
+    """
+    if not isinstance(child, tuple):
+        return None
+    lookup, value = child
+    if lookup.endswith("__exact"):
+        column, values = lookup[:-len("__exact")], [value]
+    elif lookup.endswith("__in") and isinstance(value, (list, tuple)):
+        column, values = lookup[:-len("__in")], list(value)
+    else:
+        return None
+    for value in values:
+        if value is None or hasattr(value, "resolve_expression"):
+            return None
+        try:
+            hash(value)
+        except TypeError:
+            return None
+    return column, values
+
+
+def fold_exact_into_in(children):
+    """Fold the `exact`/`in` lookups of the same column of an `OR` in a single `IN` lookup"""
+    children_by_column = {}
+    for child in children:
+        foldable = get_foldable_values(child)
+        if foldable is not None:
+            children_by_column.setdefault(foldable[0], []).append(foldable[1])
+
+    folded_children = []
+    folded_columns = set()
+    for child in children:
+        foldable = get_foldable_values(child)
+        if foldable is None or len(children_by_column[foldable[0]]) < 2:
+            folded_children.append(child)
+        elif foldable[0] not in folded_columns:
+            folded_columns.add(foldable[0])
+            values = dict.fromkeys(value for values in children_by_column[foldable[0]] for value in values)
+            folded_children.append((f"{foldable[0]}__in", list(values)))
+    return folded_children
+
+
+def dedupe_children(children):
+    deduped_children = []
+    seen = set()
+    for child in children:
+        try:
+            key = hash(child)
+        except TypeError:
+            key = None
+        if key is not None and key not in seen:
+            seen.add(key)
+            deduped_children.append(child)
+        elif child not in deduped_children:
+            deduped_children.append(child)
+    return deduped_children
+
+
+def simplify_Q(q):
+    """
+    Normalize a Q tree without changing its meaning: the nested nodes with the same connector are flattened,
+    the empty nodes are dropped, the double negations are removed, the duplicated predicates are dropped and
+    the `exact` lookups of the same column joined by `OR` are folded in an `IN` lookup.
+    """
+    children = []
+    for child in q.children:
+        if isinstance(child, Q):
+            child = simplify_Q(child)
+            if not child.children:
+                # As `Q() | Q(x)` is `Q(x)`, a branch without filters is dropped for both connectors
+                continue
+            if not child.negated and (child.connector == q.connector or len(child.children) == 1):
+                children.extend(child.children)
+                continue
+        children.append(child)
+
+    if q.negated and len(children) == 1 and isinstance(children[0], Q) and children[0].negated:
+        inner = children[0]
+        simplified = Q(*inner.children, _connector=inner.connector)
+        return simplified.children[0] if len(simplified.children) == 1 and isinstance(simplified.children[0], Q) else simplified
+
+    if q.connector == Q.OR:
+        children = fold_exact_into_in(children)
+    children = dedupe_children(children)
+    if not q.negated and len(children) == 1 and isinstance(children[0], Q):
+        return children[0]
+    return Q(*children, _connector=q.connector, _negated=q.negated and bool(children))
+
+
+@lru_cache(maxsize=512)
+def compile_where_shape(shape, model, use_exists):
+    shared_paths = None
+    if model is not None and use_exists:
+        shared_paths = {path for path, count in count_to_many_paths(shape, model, {}).items() if count > 1}
+    return WherePlan(shape, model, shared_paths)
+
+
+def compile_where(where, model=None):
+    """
+    Convert a where input to a Q.
+
+    :param where: The where input, it isn't modified.
+    :param model: The model filtered by the where. Without it the to-many filters are not compiled to `EXISTS`.
+    :return: The Q of the where.
+    """
+    values = []
+    shape = get_where_shape(where, values)
+    plan = compile_where_shape(shape, model, bool(cruddals_settings.USE_EXISTS_FOR_TO_MANY_FILTERS))
+    return simplify_Q(plan.build(iter(values)))
@@ -3,7 +3,7 @@ import json
 import re
 
 from django.db import connection, transaction
-from django.http import HttpResponse, HttpResponseNotAllowed
+from django.http import HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
 from django.http.response import HttpResponseBadRequest
 from django.shortcuts import render
 from django.utils.decorators import method_decorator
@@ -16,7 +16,7 @@ from graphql.execution import ExecutionResult
 from graphene import Schema
 from graphql.execution.middleware import MiddlewareManager
 
-from graphene_django_cruddals_v1.copy_graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django_cruddals_v1.copy_graphene_django.constants import MUTATION_ERRORS_FLAG, STREAMING_RESPONSE_FLAG
 from graphene_django_cruddals_v1.utils.utils import set_rollback
 
 from ..copy_graphene_django.settings import graphene_settings
@@ -87,6 +87,12 @@ class GraphQLView(View):
     batch = False
     subscription_path = None
     execution_context_class = None
+    # The rows of the page size 'All' are read from the database in chunks of the `STREAMING_CHUNK_SIZE` setting,
+    # without the `MAX_ROWS_FOR_PAGE_SIZE_ALL` limit, and the JSON of the response is written in chunks of
+    # `stream_buffer_size` characters. The query is executed before the response starts, so the result of the
+    # execution is in memory, but neither all the model instances nor the whole JSON are
+    stream_response = False
+    stream_buffer_size = 64 * 1024
 
     def __init__(
         self,
@@ -98,6 +104,7 @@ class GraphQLView(View):
         batch=False,
         subscription_path=None,
         execution_context_class=None,
+        stream_response=False,
     ):
         if not schema:
             schema = graphene_settings.SCHEMA
@@ -115,6 +122,7 @@ class GraphQLView(View):
         self.pretty = self.pretty or pretty
         self.graphiql = self.graphiql or graphiql
         self.batch = self.batch or batch
+        self.stream_response = self.stream_response or stream_response
         self.execution_context_class = execution_context_class
         if subscription_path is None:
             self.subscription_path = graphene_settings.SUBSCRIPTION_PATH
@@ -180,6 +188,13 @@ class GraphQLView(View):
                     and max(responses, key=lambda response: response[1])[1]
                     or 200
                 )
+            elif self.stream_response:
+                # The rows of the page size 'All' are read in chunks and the JSON is written in chunks
+                setattr(request, STREAMING_RESPONSE_FLAG, True)
+                result, status_code = self.get_response(request, data, show_graphiql)
+                return StreamingHttpResponse(
+                    status=status_code, streaming_content=result or (), content_type="application/json"
+                )
             else:
                 result, status_code = self.get_response(request, data, show_graphiql)
 
@@ -226,7 +241,10 @@ class GraphQLView(View):
                 response["id"] = id
                 response["status"] = status_code
 
-            result = self.json_encode(request, response, pretty=show_graphiql)
+            if getattr(request, STREAMING_RESPONSE_FLAG, False):
+                result = self.json_encode_iter(request, response)
+            else:
+                result = self.json_encode(request, response, pretty=show_graphiql)
         else:
             result = None
 
@@ -241,6 +259,23 @@ class GraphQLView(View):
 
         return json.dumps(d, sort_keys=True, indent=2, separators=(",", ": "))
 
+    def json_encode_iter(self, request, d):
+        """Encode `d` as JSON in chunks of `stream_buffer_size` characters for a StreamingHttpResponse"""
+        if not self.pretty and not request.GET.get("pretty"):
+            chunks = json.JSONEncoder(separators=(",", ":")).iterencode(d)
+        else:
+            chunks = json.JSONEncoder(sort_keys=True, indent=2, separators=(",", ": ")).iterencode(d)
+
+        buffer, size = [], 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= self.stream_buffer_size:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+
     def parse_body(self, request):
         content_type = self.get_content_type(request)
 
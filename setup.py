@@ -10,7 +10,8 @@ with open("graphene_django_cruddals_v1/__init__.py", "rb") as f:
     )
 
 tests_require = [
-    "pytest>=3.6.3"
+    "pytest>=3.6.3",
+    "pytest-django>=3.4",
 ]
 
 setup(
@@ -0,0 +1,79 @@
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.db import models
+
+
+class Customer(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    secret = models.CharField(max_length=50, blank=True, default="")
+    hidden = models.BooleanField(default=False)
+    credit = models.IntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=50)
+
+    def __str__(self):
+        return self.name
+
+
+class Product(models.Model):
+    sku = models.CharField(max_length=20, unique=True)
+    price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    tags = models.ManyToManyField(Tag, blank=True)
+
+
+class Order(models.Model):
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="orders")
+    amount = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=[("new", "New"), ("done", "Done")], default="new")
+    note = models.CharField(max_length=50, blank=True, null=True)
+
+
+class Item(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="lines")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    qty = models.IntegerField(default=1)
+
+
+class Author(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=50, unique=True)
+
+
+class Label(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=50)
+
+
+class Book(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    title = models.CharField(max_length=50)
+    isbn = models.CharField(max_length=20, unique=True)
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name="books", null=True, blank=True)
+    labels = models.ManyToManyField(Label, blank=True)
+
+
+def validate_no_bad_words(value):
+    if "bad" in value:
+        raise ValidationError("Bad words are not allowed", code="bad_word")
+
+
+class Review(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="reviews")
+    kind = models.CharField(max_length=5, choices=[("short", "Short"), ("Long", [("long", "Long"), ("essay", "Essay")])], default="short")
+    text = models.CharField(max_length=30, validators=[validate_no_bad_words])
+    score = models.IntegerField(validators=[MinValueValidator(1)], error_messages={"min_value": "The score is too low"})
+    note = models.CharField(max_length=10, blank=True, null=True)
+
+    def clean(self):
+        if self.score == 3 and self.text == "three":
+            raise ValidationError({"text": "A score of three can't say three"})
+        if self.score == 4:
+            raise ValidationError("A score of four isn't allowed")
@@ -0,0 +1,22 @@
+from graphene_django_cruddals_v1 import CruddalsApp
+
+
+class CustomerInterface:
+    class ObjectType:
+        class Meta:
+            exclude = ["secret", "credit"]
+
+        @classmethod
+        def get_queryset(cls, queryset, info):
+            return queryset.filter(hidden=False)
+
+
+class ShopApp(CruddalsApp):
+    class Meta:
+        app_name = "shop"
+        settings_for_model = {
+            "Customer": {"interfaces": [CustomerInterface]},
+        }
+
+
+schema = ShopApp.Schema
@@ -0,0 +1,80 @@
+import pytest
+from django.db import connection
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.test.utils import CaptureQueriesContext
+
+from .shop.models import Customer, Order, Product, Tag
+from .shop.schema import schema
+
+
+@pytest.fixture
+def shop(db):
+    tags = [Tag.objects.create(name=name) for name in ("red", "green", "blue")]
+    for i in range(7):
+        Product.objects.create(sku=f"p{i}", price=f"{i * 3}.25").tags.set(tags[:i % 4])
+    customers = [Customer.objects.create(name=f"c{i}") for i in range(4)]
+    for i in range(13):
+        # The last customer has no orders
+        Order.objects.create(customer=customers[i % 3], amount=i * i % 7)
+    return {"tags": tags, "customers": customers}
+
+
+def execute(query):
+    """The data of `query` and the SQL of the queries it runs"""
+    with CaptureQueriesContext(connection) as queries:
+        result = schema.execute(query, context_value=type("Context", (), {})())
+    assert result.errors is None, result.errors
+    return result.data, [query["sql"] for query in queries.captured_queries]
+
+
+def get_aggregate_queries(queries):
+    return [query for query in queries if any(function in query for function in ("SUM(", "AVG(", "MIN(", "MAX("))]
+
+
+def get_amount_aggregates(queryset):
+    values = queryset.aggregate(count=Count("pk"), sum=Sum("amount"), avg=Avg("amount"), min=Min("amount"), max=Max("amount"))
+    return {"count": values["count"], "amount": {function: values[function] for function in ("sum", "avg", "min", "max")}}
+
+
+def test_aggregates_of_all_the_rows_not_only_the_page(shop):
+    data, queries = execute("{ searchOrders(paginated: {pageSize: 2, page: 3}) { objects { amount } aggregates { count amount { sum avg min max } } } }")
+    assert len(data["searchOrders"]["objects"]) == 2
+    assert data["searchOrders"]["aggregates"] == get_amount_aggregates(Order.objects.all())
+    assert len(get_aggregate_queries(queries)) == 1
+
+
+def test_only_the_selected_aggregates(shop):
+    _, queries = execute("{ searchOrders { objects { amount } } }")
+    assert get_aggregate_queries(queries) == []
+    data, queries = execute("{ searchOrders { aggregates { amount { max } } } }")
+    assert data["searchOrders"]["aggregates"] == {"amount": {"max": Order.objects.aggregate(max=Max("amount"))["max"]}}
+    aggregate_query = get_aggregate_queries(queries)[0]
+    assert "MAX(" in aggregate_query
+    assert not any(function in aggregate_query for function in ("COUNT(", "SUM(", "AVG(", "MIN("))
+
+
+def test_aggregates_of_the_rows_of_the_where(shop):
+    # The tags of the where join several rows of every product, which are aggregated once
+    data, _ = execute('{ searchProducts(where: {tags: {name: {in: ["red", "green"]}}}) { aggregates { count price { sum avg min max } } } }')
+    products = Product.objects.filter(pk__in=Product.objects.filter(tags__name__in=["red", "green"]).values("pk"))
+    values = products.aggregate(count=Count("pk"), sum=Sum("price"), avg=Avg("price"), min=Min("price"), max=Max("price"))
+    assert data["searchProducts"]["aggregates"] == {
+        "count": values["count"],
+        "price": {function: str(values[function]) for function in ("sum", "avg", "min", "max")},
+    }
+    assert values["count"] == 5
+
+
+@pytest.mark.parametrize("paginated", ["", "(paginated: {pageSize: 2})"])
+def test_aggregates_of_the_nested_fields(shop, paginated):
+    data, _ = execute(f"{{ searchCustomers {{ objects {{ name paginatedOrders{paginated} {{ aggregates {{ count amount {{ sum avg min max }} }} }} }} }} }}")
+    assert [customer["paginatedOrders"]["aggregates"] for customer in data["searchCustomers"]["objects"]] == [
+        get_amount_aggregates(customer.orders.all()) for customer in Customer.objects.order_by("pk")
+    ]
+
+
+def test_fields_of_the_aggregates_types(shop):
+    # The choices and the fields excluded from the object type aren't aggregated
+    assert set(schema.graphql_schema.get_type("OrderAggregatesType").fields) == {"count", "amount"}
+    assert set(schema.graphql_schema.get_type("CustomerAggregatesType").fields) == {"count"}
+    assert set(schema.graphql_schema.get_type("ProductAggregatesType").fields) == {"count", "price"}
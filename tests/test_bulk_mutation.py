@@ -0,0 +1,384 @@
+import pytest
+from django.db.models.signals import m2m_changed, post_save, pre_save
+
+from graphene_django_cruddals_v1 import CruddalsModel
+from graphene_django_cruddals_v1.helpers.helpers import CruddalsRelationField
+from graphene_django_cruddals_v1.settings import cruddals_settings
+
+from .shop.models import Author, Book, Customer, Label, Product, Review, Tag
+from .shop.schema import schema
+
+
+UPDATE_CUSTOMERS = """
+mutation ($input: [UpdateCustomerInput!]) {
+  updateCustomers(input: $input) {
+    objects { name }
+    errors { objectPosition errors { field messages } }
+  }
+}
+"""
+
+CREATE_BOOKS = """
+mutation ($input: [CreateBookInput!]) {
+  createBooks(input: $input) {
+    objects { title isbn author { name } }
+    errors { objectPosition errors { field messages } }
+  }
+}
+"""
+
+UPDATE_BOOKS = """
+mutation ($input: [UpdateBookInput!]) {
+  updateBooks(input: $input) {
+    objects { title isbn author { name } }
+    errors { objectPosition errors { field messages } }
+  }
+}
+"""
+
+CREATE_NESTED_BOOKS = """
+mutation ($input: [CreatenestedBookInput!]) {
+  createNestedBooks(input: $input) {
+    objects { title isbn }
+    errors { objectPosition errors { field messages } }
+  }
+}
+"""
+
+
+CREATE_NESTED_PRODUCTS = """
+mutation ($input: [CreatenestedProductInput!]) {
+  createNestedProducts(input: $input) {
+    objects { sku }
+    errors { objectPosition errors { field messages } }
+  }
+}
+"""
+
+
+class NestedAuthorInterface:
+    class Create:
+        modify_input_argument = {"extra_fields": {"author": CruddalsRelationField(), "reviews": CruddalsRelationField()}}
+
+
+class NestedBooks(CruddalsModel):
+    """The books created with their new author and reviews"""
+
+    class Meta:
+        model = Book
+        prefix = "Nested"
+        interfaces = [NestedAuthorInterface]
+
+
+class NestedTagsInterface:
+    class Create:
+        modify_input_argument = {"extra_fields": {"tags": CruddalsRelationField()}}
+
+
+class NestedProducts(CruddalsModel):
+    """The products created with their new tags, their pk has no default so they aren't inserted in bulk on SQLite"""
+
+    class Meta:
+        model = Product
+        prefix = "Nested"
+        interfaces = [NestedTagsInterface]
+
+
+def execute(query, variables, schema=schema):
+    result = schema.execute(query, variable_values=variables, context_value=type("Context", (), {})())
+    assert result.errors is None
+    return result.data
+
+
+def get_names():
+    return list(Customer.objects.order_by("pk").values_list("name", flat=True))
+
+
+def get_books():
+    """The rows of the books and of their labels and authors, by isbn"""
+    return {
+        book.isbn: (book.title, book.author.name if book.author else None, sorted(label.name for label in book.labels.all()))
+        for book in Book.objects.select_related("author").prefetch_related("labels")
+    }
+
+
+def run_in_both_paths(monkeypatch, setup, run, get_rows):
+    """The result of `run` and the rows after it with the bulk path and with the per-item path, they must be the same"""
+    results = []
+    for bulk in (True, False):
+        monkeypatch.setattr(cruddals_settings, "BULK_CREATE_MUTATIONS", bulk)
+        for model in (Book, Author, Label, Customer, Product, Tag):
+            model.objects.all().delete()
+        results.append((run(setup()), get_rows()))
+    assert results[0] == results[1]
+    return results[0]
+
+
+def setup_labels():
+    author = Author.objects.create(name="Ann")
+    labels = {name: Label.objects.create(name=name) for name in ("new", "old", "rare")}
+    return author, labels
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("get_names_input, expected_names", [
+    # A swap is rejected as the per-item saves reject it, the other row still has the name
+    (lambda a, b: [(a, "y"), (b, "x")], ["x", "y"]),
+    # The name released by a previous item can be taken by the next one
+    (lambda a, b: [(a, "z"), (b, "x")], ["z", "x"]),
+    (lambda a, b: [(b, "w"), (a, "y")], ["y", "w"]),
+    # but not by a previous one
+    (lambda a, b: [(b, "x"), (a, "z")], ["z", "y"]),
+    (lambda a, b: [(a, "q"), (b, "q")], ["q", "y"]),
+])
+def test_unique_values_changed_in_the_batch(monkeypatch, get_names_input, expected_names):
+    data, names = run_in_both_paths(
+        monkeypatch,
+        lambda: [Customer.objects.create(name="x"), Customer.objects.create(name="y")],
+        lambda objects: execute(UPDATE_CUSTOMERS, {"input": [{"id": obj.pk, "name": name} for obj, name in get_names_input(*objects)]}),
+        get_names,
+    )
+    assert names == expected_names
+
+
+@pytest.mark.django_db
+def test_payload_and_errors_of_the_bulk_path(monkeypatch):
+    def create_books(objects):
+        author, labels = objects
+        Book.objects.create(title="Taken", isbn="0")
+        return execute(CREATE_BOOKS, {"input": [
+            {"title": "One", "isbn": "1", "author": str(author.pk), "labels": [str(labels["new"].pk), str(labels["old"].pk)]},
+            {"title": "t" * 51, "isbn": "2"},
+            {"title": "Three", "isbn": "3", "labels": [str(labels["rare"].pk)]},
+            {"title": "Taken", "isbn": "0"},
+            {"title": "Repeated", "isbn": "1"},
+            {"title": "No author", "isbn": "6", "author": "00000000-0000-0000-0000-000000000000"},
+            {"title": "Seven", "isbn": "7"},
+        ]})
+
+    data, books = run_in_both_paths(monkeypatch, setup_labels, create_books, get_books)
+    assert [book["isbn"] for book in data["createBooks"]["objects"]] == ["1", "3", "7"]
+    assert [error["objectPosition"] for error in data["createBooks"]["errors"]] == ["1", "3", "4", "5"]
+    assert books["1"] == ("One", "Ann", ["new", "old"])
+
+
+@pytest.mark.django_db
+def test_save_signals_of_the_bulk_path(monkeypatch):
+    monkeypatch.setattr(cruddals_settings, "BULK_CREATE_MUTATIONS", True)
+    events = []
+
+    def receiver(signal, instance, **kwargs):
+        events.append((signal, instance.isbn, kwargs.get("created", None)))
+
+    pre_save.connect(receiver, sender=Book, weak=False)
+    post_save.connect(receiver, sender=Book, weak=False)
+    try:
+        data = execute(CREATE_BOOKS, {"input": [{"title": "Book", "isbn": isbn} for isbn in ("1", "2", "3")]})
+    finally:
+        pre_save.disconnect(receiver, sender=Book)
+        post_save.disconnect(receiver, sender=Book)
+
+    assert data["createBooks"]["errors"] is None
+    # Every row gets one pre_save before it's inserted and one post_save after it, in the order of the input
+    assert [(isbn, created) for signal, isbn, created in events if signal is pre_save] == [("1", None), ("2", None), ("3", None)]
+    assert [(isbn, created) for signal, isbn, created in events if signal is post_save] == [("1", True), ("2", True), ("3", True)]
+    for isbn in ("1", "2", "3"):
+        assert events.index((pre_save, isbn, None)) < events.index((post_save, isbn, True))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("invalid_item", [
+    # A nested author fails
+    {"title": "Two", "isbn": "2", "author": {"name": "n" * 51}},
+    # the book of a nested author fails
+    {"title": "t" * 51, "isbn": "2", "author": {"name": "Bea"}},
+    {"title": "Two", "isbn": "1", "author": {"name": "Bea"}},
+])
+def test_nested_relations_fallback(monkeypatch, invalid_item):
+    def create_books(objects):
+        return execute(CREATE_NESTED_BOOKS, {"input": [
+            {"title": "One", "isbn": "1", "author": {"name": "Ann"}},
+            invalid_item,
+            {"title": "Three", "isbn": "3", "author": {"name": "Cid"}},
+            {"title": "Four", "isbn": "4"},
+        ]}, schema=NestedBooks.Schema)
+
+    def get_rows():
+        return get_books(), sorted(Author.objects.values_list("name", flat=True))
+
+    data, (books, authors) = run_in_both_paths(monkeypatch, lambda: None, create_books, get_rows)
+    assert [book["isbn"] for book in data["createNestedBooks"]["objects"]] == ["1", "3", "4"]
+    assert [error["objectPosition"] for error in data["createNestedBooks"]["errors"]] == ["1"]
+    # The objects of the failed plan are rolled back, only the authors of the saved books are left
+    assert books == {"1": ("One", "Ann", []), "3": ("Three", "Cid", []), "4": ("Four", None, [])}
+    assert authors == ["Ann", "Cid"]
+
+
+def record_m2m_changed(events):
+    def receiver(action, instance, pk_set, **kwargs):
+        if action in ("pre_add", "post_add", "pre_remove", "post_remove"):
+            events.append((instance.isbn, action, frozenset(Label.objects.get(pk=pk).name for pk in pk_set)))
+
+    m2m_changed.connect(receiver, sender=Book.labels.through, weak=False)
+    return receiver
+
+
+def update_labels(objects):
+    """Create books with labels and change them with `createBooks` and `updateBooks`"""
+    author, labels = objects
+    books = [Book.objects.create(title=f"Book {i}", isbn=str(i)) for i in range(3)]
+    books[0].labels.set([labels["new"], labels["old"]])
+    books[1].labels.set([labels["old"]])
+    events = []
+    receiver = record_m2m_changed(events)
+    try:
+        created = execute(CREATE_BOOKS, {"input": [
+            {"title": "Created", "isbn": "10", "labels": [str(labels["new"].pk), str(labels["rare"].pk)]},
+            {"title": "Created", "isbn": "11", "labels": []},
+            {"title": "Created", "isbn": "12", "labels": [str(labels["old"].pk)]},
+        ]})
+        updated = execute(UPDATE_BOOKS, {"input": [
+            {"id": str(books[0].pk), "labels": [str(labels["old"].pk), str(labels["rare"].pk)]},
+            {"id": str(books[1].pk), "labels": []},
+            {"id": str(books[2].pk), "labels": [str(labels["new"].pk)]},
+        ]})
+    finally:
+        m2m_changed.disconnect(receiver, sender=Book.labels.through)
+    return created, updated, events
+
+
+def get_events_by_book(events):
+    events_by_book = {}
+    for isbn, action, names in events:
+        events_by_book.setdefault(isbn, []).append((action, names))
+    return events_by_book
+
+
+@pytest.mark.django_db
+def test_many_to_many_fields_of_the_bulk_path(monkeypatch):
+    monkeypatch.setattr(cruddals_settings, "M2M_CHANGED_SIGNALS", True)
+    results = []
+    for bulk in (True, False):
+        monkeypatch.setattr(cruddals_settings, "BULK_CREATE_MUTATIONS", bulk)
+        for model in (Book, Author, Label):
+            model.objects.all().delete()
+        created, updated, events = update_labels(setup_labels())
+        results.append((created, updated, get_events_by_book(events), get_books()))
+    # The links and the m2m_changed of every book are the ones of `set()`
+    assert results[0] == results[1]
+    created, updated, events_by_book, books = results[0]
+    assert {isbn: labels for isbn, (_, _, labels) in books.items()} == {
+        "0": ["old", "rare"], "1": [], "2": ["new"], "10": ["new", "rare"], "11": [], "12": ["old"],
+    }
+    assert events_by_book["0"] == [
+        ("pre_remove", frozenset({"new"})), ("post_remove", frozenset({"new"})),
+        ("pre_add", frozenset({"rare"})), ("post_add", frozenset({"rare"})),
+    ]
+
+
+@pytest.mark.django_db
+def test_many_to_many_fields_of_the_bulk_path_without_signals(monkeypatch):
+    monkeypatch.setattr(cruddals_settings, "BULK_CREATE_MUTATIONS", True)
+    monkeypatch.setattr(cruddals_settings, "M2M_CHANGED_SIGNALS", False)
+    created, updated, events = update_labels(setup_labels())
+    assert created["createBooks"]["errors"] is None and updated["updateBooks"]["errors"] is None
+    assert events == []
+    assert {isbn: labels for isbn, (_, _, labels) in get_books().items()} == {
+        "0": ["old", "rare"], "1": [], "2": ["new"], "10": ["new", "rare"], "11": [], "12": ["old"],
+    }
+
+
+def get_error_positions(data):
+    return [error["objectPosition"] for error in data["errors"] or []]
+
+
+@pytest.mark.django_db
+def test_plain_items_after_an_item_saved_alone(monkeypatch):
+    def create_products(objects):
+        return execute(CREATE_NESTED_PRODUCTS, {"input": [
+            {"sku": "a", "price": 1, "tags": [{"name": "t1"}]},
+            {"sku": "a", "price": 2},
+            {"sku": "b", "price": 3},
+        ]}, schema=NestedProducts.Schema)
+
+    def get_rows():
+        return sorted((product.sku, int(product.price), sorted(tag.name for tag in product.tags.all())) for product in Product.objects.all())
+
+    data, products = run_in_both_paths(monkeypatch, lambda: None, create_products, get_rows)
+    # The plain items are validated after the item before them is saved
+    assert get_error_positions(data["createNestedProducts"]) == ["1"]
+    assert products == [("a", 1, ["t1"]), ("b", 3, [])]
+
+
+@pytest.mark.django_db
+def test_bulk_insert_after_an_item_saved_alone(monkeypatch):
+    def create_books(objects):
+        return execute(CREATE_NESTED_BOOKS, {"input": [
+            {"title": "A", "isbn": "1", "author": {"name": "Ann"}},
+            {"title": "B", "isbn": "1"},
+            {"title": "C", "isbn": "2"},
+            {"title": "D", "isbn": "3"},
+        ]}, schema=NestedBooks.Schema)
+
+    data, books = run_in_both_paths(monkeypatch, lambda: None, create_books, get_books)
+    # The first item keeps its isbn, as when the items are saved one by one
+    assert get_error_positions(data["createNestedBooks"]) == ["1"]
+    assert books == {"1": ("A", "Ann", []), "2": ("C", None, []), "3": ("D", None, [])}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("other_position", [0, 1, 3])
+def test_plan_of_the_nested_relations_in_the_order_of_the_input(monkeypatch, other_position):
+    def create_books(objects):
+        items = [
+            {"title": "B", "isbn": "1", "author": {"name": "Ann"}},
+            {"title": "C", "isbn": "2", "author": {"name": "Bea"}},
+            {"title": "D", "isbn": "3", "author": {"name": "Cid"}},
+        ]
+        # An item with reverse relations isn't in the plan
+        items.insert(other_position, {"title": "A", "isbn": "1", "reviews": [{"kind": "SHORT", "text": "Good", "score": 5}]})
+        return execute(CREATE_NESTED_BOOKS, {"input": items}, schema=NestedBooks.Schema)
+
+    def get_rows():
+        return get_books(), sorted(Author.objects.values_list("name", flat=True)), Review.objects.count()
+
+    data, (books, authors, reviews) = run_in_both_paths(monkeypatch, lambda: None, create_books, get_rows)
+    # The item first in the input keeps the isbn
+    winner = "A" if other_position == 0 else "B"
+    loser_position = 1 if other_position == 0 else other_position
+    assert get_error_positions(data["createNestedBooks"]) == [str(loser_position)]
+    assert books["1"][0] == winner
+    assert books["2"] == ("C", "Bea", []) and books["3"] == ("D", "Cid", [])
+    assert authors == (["Bea", "Cid"] if winner == "A" else ["Ann", "Bea", "Cid"])
+    assert reviews == (1 if winner == "A" else 0)
+
+
+CREATE_PRODUCTS = """
+mutation ($input: [CreateProductInput!]) {
+  createProducts(input: $input) {
+    objects { sku }
+    errors { objectPosition errors { field messages } }
+  }
+}
+"""
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("bulk", [True, False])
+def test_row_saved_after_the_validation(monkeypatch, bulk):
+    monkeypatch.setattr(cruddals_settings, "BULK_CREATE_MUTATIONS", bulk)
+
+    def receiver(instance, **kwargs):
+        # Another request saves the sku between the validation and the save of the item
+        if instance.sku == "x":
+            Product.objects.bulk_create([Product(sku="x")])
+
+    pre_save.connect(receiver, sender=Product, weak=False)
+    try:
+        data = execute(CREATE_PRODUCTS, {"input": [{"sku": sku, "price": 1} for sku in ("w", "x", "y")]})
+    finally:
+        pre_save.disconnect(receiver, sender=Product)
+    assert [product["sku"] for product in data["createProducts"]["objects"]] == ["w", "y"]
+    assert get_error_positions(data["createProducts"]) == ["1"]
+    # The row of the receiver is rolled back with the item
+    assert sorted(Product.objects.values_list("sku", flat=True)) == ["w", "y"]
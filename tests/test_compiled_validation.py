@@ -0,0 +1,176 @@
+import pytest
+from django.forms.models import model_to_dict
+
+from graphene_django_cruddals_v1.utils.bulk_mutation import validate_forms
+from graphene_django_cruddals_v1.utils.compiled_validation import CompiledForm, get_compiled_validator
+from graphene_django_cruddals_v1.utils.utils import DjangoModelFormMutation, convert_model_to_model_form
+
+from .shop.models import Author, Book, Customer, Label, Order, Review
+from .shop.schema import schema  # noqa: F401, the types of the models of the mutations
+
+
+def get_codes(errors):
+    return {name: [error.code for error in error_list] for name, error_list in errors.items()}
+
+
+def validate_both(model, data, instance=None):
+    """The `ModelForm` of `data` and its `CompiledForm`, both validated"""
+    form_class = convert_model_to_model_form(model)
+    validator = get_compiled_validator(form_class)
+    assert validator is not None
+    form = form_class(data=dict(data), instance=model._default_manager.get(pk=instance.pk) if instance else None)
+    compiled_data = dict(data, id=instance.pk) if instance else dict(data)
+    compiled_form = validator.get_forms({0: compiled_data})[0]
+    assert isinstance(compiled_form, CompiledForm)
+    assert compiled_form.is_valid() == form.is_valid()
+    assert compiled_form.errors == {name: list(messages) for name, messages in form.errors.items()}
+    assert get_codes(compiled_form._errors) == get_codes(form.errors.as_data())
+    return form, compiled_form
+
+
+def assert_same_saved(model, form, compiled_form):
+    """Both forms save the same row, the one of the `ModelForm` is deleted before saving the other one"""
+    fields = [field.name for field in model._meta.get_fields() if field.concrete and not field.primary_key]
+    saved = form.save()
+    expected = model_to_dict(model._default_manager.get(pk=saved.pk), fields)
+    saved.delete()
+    compiled_saved = compiled_form.save()
+    assert model_to_dict(model._default_manager.get(pk=compiled_saved.pk), fields) == expected
+
+
+@pytest.fixture
+def book(db):
+    author = Author.objects.create(name="Ann")
+    labels = [Label.objects.create(name=name) for name in ("new", "old")]
+    book = Book.objects.create(title="A book", isbn="1", author=author)
+    book.labels.set(labels[:1])
+    return book
+
+
+@pytest.mark.parametrize("data", [
+    {},
+    {"book": "", "text": "", "score": ""},
+    {"text": "x" * 31, "score": 0},
+    {"text": "a bad one", "score": "ten"},
+    {"text": "bad" * 11, "score": -1, "note": "y" * 11},
+    {"text": "fine", "score": 5, "kind": "other"},
+    {"text": "three", "score": 3},
+    {"text": "four", "score": 4},
+    {"text": "fine", "score": 5, "book": "00000000-0000-0000-0000-000000000000"},
+    {"text": "fine", "score": 5, "book": "not a uuid"},
+])
+def test_invalid_reviews(book, data):
+    data = {"book": str(book.pk), **data}
+    form, compiled_form = validate_both(Review, data)
+    assert not form.is_valid()
+
+
+@pytest.mark.parametrize("data", [
+    {"text": "fine", "score": 5, "kind": "short"},
+    {"text": "an essay", "score": 1, "kind": "essay", "note": ""},
+    {"text": "three", "score": 2, "kind": "long", "note": "short"},
+])
+def test_valid_reviews(book, data):
+    data = {"book": str(book.pk), **data}
+    form, compiled_form = validate_both(Review, data)
+    assert form.is_valid()
+    assert_same_saved(Review, form, compiled_form)
+
+
+def test_books(book):
+    labels = list(Label.objects.values_list("pk", flat=True))
+    form, _ = validate_both(Book, {"title": "Other", "isbn": "2", "labels": [str(pk) for pk in labels]})
+    form.save()
+    _, compiled_form = validate_both(Book, {"title": "Other", "isbn": "3", "labels": [str(pk) for pk in labels]})
+    compiled_form.save()
+    # The isbn of the books saved by each form is taken
+    for isbn in ("2", "3"):
+        form, _ = validate_both(Book, {"title": "Other", "isbn": isbn})
+        assert not form.is_valid()
+    validate_both(Book, {"title": "t" * 51, "isbn": "1", "labels": ["not a uuid"]})
+    form, compiled_form = validate_both(Book, {"title": "Same", "isbn": "4", "author": "", "labels": [str(labels[1])]})
+    assert form.is_valid()
+    assert_same_saved(Book, form, compiled_form)
+    assert set(Book.objects.get(pk=compiled_form.instance.pk).labels.all()) == {Label.objects.get(pk=labels[1])}
+
+
+def test_updated_books(book):
+    form, compiled_form = validate_both(Book, {"title": "Renamed", "isbn": "1"}, instance=book)
+    assert form.is_valid()
+    compiled_form.save()
+    book.refresh_from_db()
+    assert book.title == "Renamed"
+    assert list(book.labels.all()) == []
+    Book.objects.create(title="Other", isbn="2")
+    form, compiled_form = validate_both(Book, {"title": "Renamed", "isbn": "2"}, instance=book)
+    assert not form.is_valid()
+    validate_both(Book, {"isbn": "1"}, instance=book)
+
+
+@pytest.mark.parametrize("data", [
+    {"amount": 5},
+    {"amount": "", "status": "new"},
+    {"amount": "ten", "status": "lost", "note": "n" * 51},
+    {"status": "done", "note": ""},
+])
+def test_orders(db, data):
+    customer = Customer.objects.create(name="c")
+    data = {"customer": str(customer.pk), **data}
+    form, compiled_form = validate_both(Order, data)
+    if form.is_valid():
+        assert_same_saved(Order, form, compiled_form)
+
+
+BookForm = convert_model_to_model_form(Book)
+
+
+class CompiledBookMutation(DjangoModelFormMutation):
+    class Meta:
+        form_class = BookForm
+        compiled_validation = True
+        name = "CompiledBookMutation"
+
+
+class BookWithDefaultTitleMutation(DjangoModelFormMutation):
+    """Fill in the title of the books without one"""
+
+    class Meta:
+        form_class = BookForm
+        compiled_validation = True
+        name = "BookWithDefaultTitleMutation"
+
+    @classmethod
+    def get_form_kwargs(cls, root, info, input):
+        kwargs = super().get_form_kwargs(root, info, input)
+        kwargs["data"] = {"title": f"Book {input['isbn']}", **kwargs["data"]}
+        return kwargs
+
+
+class BookWithOwnFormMutation(DjangoModelFormMutation):
+    """Validate the books with a form of its own"""
+
+    class Meta:
+        form_class = BookForm
+        compiled_validation = True
+        name = "BookWithOwnFormMutation"
+
+    @classmethod
+    def get_form(cls, root, info, input):
+        return cls._meta.form_class(data={"title": "Own form", **input})
+
+
+@pytest.mark.parametrize("mutation, title", [
+    (BookWithDefaultTitleMutation, "Book 2"),
+    (BookWithOwnFormMutation, "Own form"),
+])
+def test_mutations_that_build_their_forms(db, mutation, title):
+    items = [{"isbn": "2"}, {"isbn": "3", "title": "Titled"}]
+    valid_forms, errors_by_position = validate_forms(mutation, None, None, items, [0, 1])
+    assert errors_by_position == {}
+    assert not any(isinstance(form, CompiledForm) for form in valid_forms.values())
+    assert [form.cleaned_data["title"] for form in valid_forms.values()] == [title, "Titled"]
+
+    # Without the overrides the items are validated by the compiled form
+    valid_forms, errors_by_position = validate_forms(CompiledBookMutation, None, None, items, [0, 1])
+    assert list(errors_by_position) == [0]
+    assert isinstance(valid_forms[1], CompiledForm)
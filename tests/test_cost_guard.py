@@ -0,0 +1,112 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from graphene_django_cruddals_v1 import CruddalsModel
+from graphene_django_cruddals_v1.registry.registry_global import get_global_registry
+from graphene_django_cruddals_v1.settings import cruddals_settings
+from graphene_django_cruddals_v1.utils import cost_guard
+
+from .shop.models import Customer, Order, Product
+from .shop.schema import schema
+
+
+class LimitsInterface:
+    class Search:
+        max_estimated_rows = 3
+
+
+class GuardedProducts(CruddalsModel):
+    """The products searched with cost limits"""
+
+    class Meta:
+        model = Product
+        prefix = "Guarded"
+        interfaces = [LimitsInterface]
+
+
+def execute(query, schema=schema):
+    return schema.execute(query, context_value=type("Context", (), {})())
+
+
+def get_messages(result):
+    return [error.message for error in result.errors or []]
+
+
+@pytest.fixture
+def shop(db):
+    cost_guard._estimates.clear()
+    customers = [Customer.objects.create(name=f"c{i}") for i in range(2)]
+    for i in range(20):
+        Order.objects.create(customer=customers[i % 2], amount=i)
+        Product.objects.create(sku=f"p{i}", price=i)
+    return customers
+
+
+@pytest.fixture
+def order_limits(monkeypatch):
+    """The limits of the orders, as set by `max_estimated_rows` in the interfaces of their CRUDDALS"""
+    meta = get_global_registry().get_registry_for_model(Order)["cruddals"].meta
+    monkeypatch.setattr(meta, "max_estimated_rows", 3)
+    return meta
+
+
+NESTED_ORDERS = [
+    "{{ readCustomer(where: {{id: {{exact: {pk}}}}}) {{ name paginatedOrders{arguments} {{ total objects {{ amount }} }} }} }}",
+    "{{ searchCustomers {{ objects {{ name paginatedOrders{arguments} {{ total objects {{ amount }} }} }} }} }}",
+]
+
+
+@pytest.mark.parametrize("query", NESTED_ORDERS)
+@pytest.mark.parametrize("arguments", ["", "(paginated: {pageSize: 2})", "(paginated: {pageSize: \"All\"})"])
+def test_nested_paginated_fields_over_the_limits(shop, order_limits, query, arguments):
+    result = execute(query.format(pk=shop[0].pk, arguments=arguments))
+    # The page of every size is rejected, the prefetch of the parent doesn't skip the guard
+    assert any("The query of orders is too expensive" in message for message in get_messages(result))
+
+
+@pytest.mark.parametrize("query", NESTED_ORDERS)
+def test_nested_paginated_fields_without_limits(shop, query):
+    with CaptureQueriesContext(connection) as context:
+        result = execute(query.format(pk=shop[0].pk, arguments=""))
+    assert result.errors is None
+    assert not any("EXPLAIN" in captured["sql"] for captured in context.captured_queries)
+    customers = result.data["readCustomer"] if "readCustomer" in result.data else result.data["searchCustomers"]["objects"][0]
+    assert customers["paginatedOrders"]["total"] == 10
+
+
+def test_paginate_action_caps_the_nested_pages(shop, order_limits, monkeypatch):
+    monkeypatch.setattr(cruddals_settings, "COST_GUARD_ACTION", "paginate")
+    monkeypatch.setattr(cruddals_settings, "COST_GUARD_PAGE_SIZE", 4)
+    result = execute(NESTED_ORDERS[1].format(arguments=""))
+    assert result.errors is None
+    for customer in result.data["searchCustomers"]["objects"]:
+        assert customer["paginatedOrders"]["total"] == 10
+        assert len(customer["paginatedOrders"]["objects"]) == 4
+
+
+def test_search_over_the_limits(shop):
+    result = execute("{ searchguardedProducts { total objects { sku } } }", schema=GuardedProducts.Schema)
+    assert any("The query of products is too expensive" in message for message in get_messages(result))
+    # A search by the pk is estimated with one row
+    product = Product.objects.first()
+    result = execute(f"{{ searchguardedProducts(where: {{id: {{exact: {product.pk}}}}}) {{ objects {{ sku }} }} }}", schema=GuardedProducts.Schema)
+    assert result.errors is None
+    assert result.data["searchguardedProducts"]["objects"] == [{"sku": product.sku}]
+
+
+def test_search_without_limits(shop):
+    result = execute("{ searchProducts { total } }")
+    assert result.errors is None
+    assert result.data["searchProducts"]["total"] == 20
+
+
+def test_estimates_are_cached_by_the_shape_of_the_query(shop):
+    queries = [
+        f"{{ searchguardedProducts(where: {{id: {{exact: {product.pk}}}}}) {{ total }} }}"
+        for product in Product.objects.all()[:3]
+    ]
+    with CaptureQueriesContext(connection) as context:
+        for query in queries:
+            assert execute(query, schema=GuardedProducts.Schema).errors is None
+    assert sum("EXPLAIN" in captured["sql"] for captured in context.captured_queries) == 1
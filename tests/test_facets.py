@@ -0,0 +1,89 @@
+import pytest
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from .shop.models import Customer, Order, Product, Tag
+from .shop.schema import schema
+
+
+@pytest.fixture
+def shop(db):
+    tags = [Tag.objects.create(name=name) for name in ("red", "green", "blue")]
+    for i in range(8):
+        Product.objects.create(sku=f"p{i}", price=i % 3).tags.set(tags[:i % 4])
+    customers = [Customer.objects.create(name=f"c{i}", hidden=i == 2) for i in range(3)]
+    for i in range(11):
+        Order.objects.create(customer=customers[i % 3], amount=i % 4, status="done" if i % 4 == 0 else "new", note=None if i % 2 else f"note {i % 3}")
+    return {"tags": tags, "customers": customers}
+
+
+def execute(query):
+    """The data of `query` and the SQL of the queries it runs"""
+    with CaptureQueriesContext(connection) as queries:
+        result = schema.execute(query, context_value=type("Context", (), {})())
+    assert result.errors is None, result.errors
+    return result.data, [query["sql"] for query in queries.captured_queries]
+
+
+def get_buckets(data, field):
+    return {facet["field"]: facet["buckets"] for facet in data[field]}
+
+
+def get_expected_rows(queryset, field_name):
+    """The `(value, count)` rows of a field counted by the ORM, the values with more rows first"""
+    return [
+        (row[field_name], row["count"])
+        for row in queryset.order_by().values(field_name).annotate(count=Count("pk", distinct=True)).order_by("-count", field_name)
+    ]
+
+
+def test_counts_of_every_field_in_a_query(shop):
+    data, queries = execute('{ facetOrders(fields: ["amount", "note"]) { field buckets { value label count } } }')
+    assert len(queries) == 2
+    buckets = get_buckets(data, "facetOrders")
+    assert list(buckets) == ["amount", "note"]
+    for field_name in ("amount", "note"):
+        assert [(bucket["value"], bucket["count"]) for bucket in buckets[field_name]] == get_expected_rows(Order.objects.all(), field_name)
+    # The null values have no label
+    assert {bucket["value"]: bucket["label"] for bucket in buckets["note"]} == {None: None, "note 0": "note 0", "note 1": "note 1", "note 2": "note 2"}
+
+
+def test_labels_of_the_choices_and_the_relations(shop):
+    data, queries = execute('{ facetOrders(fields: ["status", "customer"]) { field buckets { value label count } } }')
+    # The labels of the customers are read with a single query
+    assert len(queries) == 3
+    buckets = get_buckets(data, "facetOrders")
+    assert buckets["status"] == [{"value": "new", "label": "New", "count": 8}, {"value": "done", "label": "Done", "count": 3}]
+    customers = shop["customers"]
+    # The type of the customers hides the hidden ones, so their name isn't the label
+    assert buckets["customer"] == [
+        {"value": customers[0].pk, "label": "c0", "count": 4},
+        {"value": customers[1].pk, "label": "c1", "count": 4},
+        {"value": customers[2].pk, "label": str(customers[2].pk), "count": 3},
+    ]
+
+
+def test_counts_of_the_filtered_rows(shop):
+    # The tags of the where join several rows of every product, which are counted once
+    data, _ = execute('{ facetProducts(where: {tags: {name: {in: ["red", "green"]}}}, fields: ["price"]) { field buckets { value count } } }')
+    products = Product.objects.filter(tags__name__in=["red", "green"])
+    assert [(bucket["value"], bucket["count"]) for bucket in get_buckets(data, "facetProducts")["price"]] == [
+        (str(price), count) for price, count in get_expected_rows(products, "price")
+    ]
+    assert sum(bucket["count"] for bucket in get_buckets(data, "facetProducts")["price"]) == products.distinct().count()
+
+
+def test_buckets_with_more_rows_first_up_to_the_limit(shop):
+    data, _ = execute('{ facetOrders(fields: ["amount"], limit: 2) { field buckets { value count } } }')
+    assert get_buckets(data, "facetOrders")["amount"] == [{"value": 0, "count": 3}, {"value": 1, "count": 3}]
+
+
+@pytest.mark.parametrize("query, message", [
+    ('{ facetCustomers(fields: ["secret"]) { field } }', "'secret' is not a field of Customer that can be faceted"),
+    ('{ facetProducts(fields: ["tags"]) { field } }', "'tags' is not a field of Product that can be faceted"),
+    ('{ facetOrders(fields: ["amount"], limit: -1) { field } }', "The limit of the buckets can't be negative"),
+])
+def test_fields_that_cant_be_faceted(shop, query, message):
+    result = schema.execute(query, context_value=type("Context", (), {})())
+    assert result.errors[0].message == message
@@ -0,0 +1,121 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from graphene_django_cruddals_v1.management.commands.cruddals_index_advice import Command as IndexAdviceCommand
+from graphene_django_cruddals_v1.settings import cruddals_settings
+from graphene_django_cruddals_v1.utils import index_advisor
+from graphene_django_cruddals_v1.utils.index_advisor import (
+    BTREE,
+    LOWER,
+    QueryUsageRecorder,
+    get_index_suggestions,
+    load_query_usage,
+)
+
+from .shop.models import Customer, Order
+from .shop.schema import schema
+
+
+@pytest.fixture
+def recorder(db, monkeypatch, tmp_path):
+    """A recorder of this test, which writes the usage in a temporary directory"""
+    monkeypatch.setattr(cruddals_settings, "RECORD_QUERY_USAGE", True)
+    monkeypatch.setattr(cruddals_settings, "QUERY_USAGE_DIR", str(tmp_path))
+    recorder = QueryUsageRecorder()
+    monkeypatch.setattr(index_advisor, "_recorder", recorder)
+    return recorder
+
+
+def execute(query):
+    result = schema.execute(query, context_value=type("Context", (), {})())
+    assert result.errors is None, result.errors
+    return result.data
+
+
+def get_usage(recorder):
+    return {(row["model"], row["kind"], row["path"], row["lookup"]): row["count"] for row in recorder.get_usage()}
+
+
+def get_row(model, kind, path, lookup, count=1, total_ms=1.0, max_ms=1.0):
+    return {"model": model, "kind": kind, "path": path, "lookup": lookup, "count": count, "total_ms": total_ms, "max_ms": max_ms}
+
+
+def test_filters_and_sort_keys_of_the_fields_recorded(recorder):
+    for _ in range(2):
+        execute('{ searchProducts(where: {sku: {exact: "p0"}, OR: [{price: {gte: 1}}, {tags: {name: {icontains: "r"}}}]}, orderBy: {price: DESC}) { total } }')
+    execute('{ searchCustomers(where: {NOT: {name: {startswith: "c"}}}) { total } }')
+    execute('{ facetOrders(where: {customer: {id: {in: [1, 2]}}}, fields: ["amount"]) { field } }')
+    assert get_usage(recorder) == {
+        ("shop.Product", "filter", "sku", "exact"): 2,
+        ("shop.Product", "filter", "price", "gte"): 2,
+        ("shop.Product", "filter", "tags__name", "icontains"): 2,
+        ("shop.Product", "order", "price", "desc"): 2,
+        ("shop.Customer", "filter", "name", "startswith"): 1,
+        ("shop.Order", "filter", "customer__id", "in"): 1,
+    }
+
+
+def test_nothing_recorded_without_the_setting(recorder, monkeypatch):
+    monkeypatch.setattr(cruddals_settings, "RECORD_QUERY_USAGE", False)
+    execute('{ searchProducts(where: {sku: {exact: "p0"}}) { total } }')
+    assert recorder.get_usage() == []
+
+
+def test_usage_of_every_process_merged(tmp_path):
+    for total_ms in (10.0, 30.0):
+        recorder = QueryUsageRecorder(str(tmp_path))
+        recorder.record(Order, [("filter", "amount", "gt")], total_ms)
+        recorder.flush()
+    assert load_query_usage(str(tmp_path)) == [get_row("shop.Order", "filter", "amount", "gt", count=2, total_ms=40.0, max_ms=30.0)]
+
+
+def test_usage_written_after_the_interval(recorder, monkeypatch, tmp_path):
+    recorder.record(Order, [("filter", "amount", "gt")], 1.0)
+    assert load_query_usage(str(tmp_path)) == []
+    monkeypatch.setattr(cruddals_settings, "QUERY_USAGE_FLUSH_INTERVAL", 0)
+    recorder.record(Order, [("filter", "amount", "gt")], 1.0)
+    assert load_query_usage(str(tmp_path))[0]["count"] == 2
+
+
+@pytest.mark.django_db
+def test_indexes_missing_for_the_usage():
+    usage = [
+        get_row("shop.Order", "filter", "amount", "gte", total_ms=5.0),
+        get_row("shop.Order", "order", "amount", "desc", total_ms=5.0),
+        # The reverse relation of the customers filters the column of the orders
+        get_row("shop.Customer", "filter", "orders__amount", "exact", total_ms=5.0),
+        get_row("shop.Customer", "order", "name", "iasc", total_ms=20.0),
+        # The columns of the foreign keys and the unique fields have their index
+        get_row("shop.Order", "filter", "customer__id", "in"),
+        get_row("shop.Product", "filter", "sku", "exact"),
+        get_row("shop.Product", "filter", "tags__name", "icontains"),
+    ]
+    suggestions, not_indexable = get_index_suggestions(usage, connection)
+    assert [(suggestion.model, suggestion.field.name, suggestion.kind, suggestion.lookups, suggestion.count) for suggestion in suggestions] == [
+        (Customer, "name", LOWER, ["iasc"], 1),
+        (Order, "amount", BTREE, ["gte", "desc", "exact"], 3),
+    ]
+    # SQLite has no index for the contains lookups
+    assert not_indexable == [usage[-1]]
+
+    suggestions, _ = get_index_suggestions(usage, connection, min_count=2)
+    assert [suggestion.field.name for suggestion in suggestions] == ["amount"]
+
+
+def test_command_proposes_the_indexes(recorder, tmp_path):
+    execute('{ searchOrders(orderBy: {amount: ASC}) { total } }')
+    recorder.flush()
+    suggestion = get_index_suggestions(load_query_usage(str(tmp_path)), connection)[0][0]
+    out = StringIO()
+    # The app of the command isn't installed in the tests
+    call_command(IndexAdviceCommand(), directory=str(tmp_path), clear=True, stdout=out)
+    assert "shop.Order.amount [asc]: used 1 times" in out.getvalue()
+    assert f'models.Index(fields=["amount"], name="{suggestion.name}")' in out.getvalue()
+    # The usage is cleared after reading it
+    assert load_query_usage(str(tmp_path)) == []
+    out = StringIO()
+    call_command(IndexAdviceCommand(), directory=str(tmp_path), stdout=out)
+    assert "There is no recorded usage" in out.getvalue()
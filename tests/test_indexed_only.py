@@ -0,0 +1,150 @@
+import pytest
+
+from graphene_django_cruddals_v1 import CruddalsApp
+from graphene_django_cruddals_v1.registry import registry_global
+
+from .shop.models import Customer, Order, Product, Tag
+
+
+class IndexedOnlyInterface:
+    class Search:
+        indexed_only = True
+
+
+class AllowedOrdersInterface:
+    class Search:
+        indexed_only = True
+        allowed_filters = ["orders"]
+
+
+def build_schema(monkeypatch, customer_interfaces):
+    """The schema of the shop with indexed-only customers and products, in a registry of its own"""
+    monkeypatch.setattr(registry_global, "registry", None)
+
+    class IndexedShopApp(CruddalsApp):
+        class Meta:
+            app_name = "shop"
+            models = ["Customer", "Order", "Product", "Tag"]
+            settings_for_model = {
+                "Customer": {"interfaces": customer_interfaces},
+                "Product": {"interfaces": [IndexedOnlyInterface]},
+            }
+
+    return IndexedShopApp.Schema
+
+
+@pytest.fixture
+def schema(monkeypatch):
+    return build_schema(monkeypatch, [IndexedOnlyInterface])
+
+
+def get_input_fields(schema, name):
+    return schema.graphql_schema.get_type(name).fields
+
+
+def get_input_type_name(schema, input_name, field_name):
+    field_type = get_input_fields(schema, input_name)[field_name].type
+    while hasattr(field_type, "of_type"):
+        field_type = field_type.of_type
+    return field_type.name
+
+
+def execute(schema, query):
+    return schema.execute(query, context_value=type("Context", (), {})())
+
+
+def test_reverse_relation_with_the_indexed_input_of_the_related_model(schema):
+    assert get_input_type_name(schema, "CustomerFilterInput", "orders") == "IndexedOrderFilterInput"
+    # The orders are found by their customer and their pk, the only indexed fields
+    assert set(get_input_fields(schema, "IndexedOrderFilterInput")) == {"id", "customer", "AND", "OR", "NOT"}
+    assert get_input_type_name(schema, "IndexedOrderFilterInput", "customer") == "CustomerFilterInput"
+    assert get_input_type_name(schema, "IndexedOrderFilterInput", "AND") == "IndexedOrderFilterInput"
+
+
+def test_many_to_many_with_the_indexed_input_of_the_related_model(schema):
+    assert get_input_type_name(schema, "ProductFilterInput", "tags") == "IndexedTagFilterInput"
+    assert set(get_input_fields(schema, "IndexedTagFilterInput")) == {"id", "product", "AND", "OR", "NOT"}
+    # The products are indexed-only, so their where input is the indexed one
+    assert get_input_type_name(schema, "IndexedTagFilterInput", "product") == "ProductFilterInput"
+
+
+def test_logical_fields_with_the_restricted_input(schema):
+    for name in ("AND", "OR", "NOT"):
+        assert get_input_type_name(schema, "CustomerFilterInput", name) == "CustomerFilterInput"
+    # The search of the orders, which aren't indexed-only, keeps their unrestricted where input
+    assert "note" in get_input_fields(schema, "OrderFilterInput")
+    assert get_input_type_name(schema, "OrderFilterInput", "AND") == "OrderFilterInput"
+
+
+@pytest.mark.parametrize("query", [
+    '{ searchCustomers(where: {orders: {note: {icontains: "x"}}}) { total } }',
+    '{ searchCustomers(where: {OR: [{orders: {amount: {exact: 1}}}]}) { total } }',
+    '{ searchProducts(where: {tags: {name: {iregex: "x"}}}) { total } }',
+])
+def test_filters_of_the_relations_not_served_by_indexes(schema, query):
+    result = execute(schema, query)
+    assert result.errors is not None
+    assert "is not defined by type" in result.errors[0].message
+
+
+@pytest.mark.django_db
+def test_filters_of_the_relations_served_by_indexes(schema):
+    customers = [Customer.objects.create(name=f"c{i}") for i in range(2)]
+    order = Order.objects.create(customer=customers[1])
+    tag = Tag.objects.create(name="t")
+    Product.objects.create(sku="p0")
+    Product.objects.create(sku="p1").tags.add(tag)
+
+    result = execute(schema, f"{{ searchCustomers(where: {{orders: {{id: {{exact: {order.pk}}}}}}}) {{ objects {{ name }} }} }}")
+    assert result.errors is None
+    assert result.data["searchCustomers"]["objects"] == [{"name": "c1"}]
+
+    result = execute(schema, f"{{ searchProducts(where: {{tags: {{id: {{in: [{tag.pk}]}}}}}}) {{ objects {{ sku }} }} }}")
+    assert result.errors is None
+    assert result.data["searchProducts"]["objects"] == [{"sku": "p1"}]
+
+
+def test_allowed_relation_keeps_the_where_input_of_the_related_model(monkeypatch):
+    schema = build_schema(monkeypatch, [AllowedOrdersInterface])
+    assert get_input_type_name(schema, "CustomerFilterInput", "orders") == "OrderFilterInput"
+    assert "note" in get_input_fields(schema, "OrderFilterInput")
+
+
+class AllowedScalarsInterface:
+    class Search:
+        indexed_only = True
+        allowed_filters = ["credit", "name__icontains"]
+        allowed_order_by = ["credit"]
+
+
+def test_scalar_fields_with_the_lookups_of_their_indexes(schema):
+    # The unique name has a B-tree index, the other fields of the customers have none
+    assert set(get_input_fields(schema, "CustomerFilterInput")) == {"id", "name", "orders", "AND", "OR", "NOT"}
+    assert get_input_type_name(schema, "CustomerFilterInput", "name") == "IndexedStringFilter"
+    assert set(get_input_fields(schema, "IndexedStringFilter")) == {"exact", "in", "gt", "gte", "lt", "lte", "range", "isnull"}
+    assert set(get_input_fields(schema, "ProductFilterInput")) == {"id", "sku", "tags", "AND", "OR", "NOT"}
+
+
+def test_order_by_the_indexed_fields(schema):
+    assert set(get_input_fields(schema, "CustomerOrderByInput")) == {"id", "name"}
+    assert set(get_input_fields(schema, "ProductOrderByInput")) == {"id", "sku"}
+
+
+def test_allowed_fields_and_lookups(monkeypatch):
+    schema = build_schema(monkeypatch, [AllowedScalarsInterface])
+    assert get_input_type_name(schema, "CustomerFilterInput", "credit") == "IntFilter"
+    assert set(get_input_fields(schema, get_input_type_name(schema, "CustomerFilterInput", "name"))) == {
+        "exact", "in", "gt", "gte", "lt", "lte", "range", "isnull", "icontains",
+    }
+    assert set(get_input_fields(schema, "CustomerOrderByInput")) == {"id", "name", "credit"}
+
+
+@pytest.mark.django_db
+def test_same_rows_with_the_indexed_lookups(schema):
+    for i in range(6):
+        Customer.objects.create(name=f"c{i}")
+    result = execute(schema, '{ searchCustomers(where: {OR: [{name: {in: ["c1", "c4"]}}, {name: {gte: "c5"}}]}, orderBy: {name: DESC}) { objects { name } } }')
+    assert result.errors is None
+    assert result.data["searchCustomers"]["objects"] == [
+        {"name": customer.name} for customer in Customer.objects.filter(name__in=["c1", "c4", "c5"]).order_by("-name")
+    ]
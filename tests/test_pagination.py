@@ -0,0 +1,219 @@
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from graphene_django_cruddals_v1 import CruddalsModel
+from graphene_django_cruddals_v1.settings import cruddals_settings
+
+from .shop.models import Customer, Order, Product, Tag
+from .shop.schema import schema
+
+
+@pytest.fixture
+def shop(db):
+    tags = [Tag.objects.create(name=f"t{i}") for i in range(5)]
+    for i in range(10):
+        # Repeated prices, so the pk breaks the ties
+        Product.objects.create(sku=f"p{i}", price=i % 3).tags.set(tags[:i % 6])
+    customer = Customer.objects.create(name="c")
+    for i in range(12):
+        Order.objects.create(customer=customer, amount=i, note=None if i % 3 == 0 else f"note {i % 4}")
+
+
+def execute(query):
+    """The data of `query` and the SQL of the queries it runs"""
+    with CaptureQueriesContext(connection) as queries:
+        result = schema.execute(query, context_value=type("Context", (), {})())
+    assert result.errors is None, result.errors
+    return result.data, [query["sql"] for query in queries.captured_queries]
+
+
+def get_arguments(**paginated):
+    return ", ".join(f"{key}: {json.dumps(value)}" for key, value in paginated.items())
+
+
+def search_page(field, order_by, selection, **paginated):
+    query = f"{{ {field}(orderBy: {order_by}, paginated: {{{get_arguments(**paginated)}}}) {{ total page hasNext hasPrev startCursor endCursor objects {{ {selection} }} }} }}"
+    data, queries = execute(query)
+    return data[field], queries
+
+
+PRODUCTS = ("searchProducts", "{price: DESC}", "sku")
+ORDERS = ("searchOrders", "{note: ASC}", "amount")
+
+
+def get_expected(field):
+    if field == "searchProducts":
+        return [product.sku for product in Product.objects.order_by("-price", "pk")]
+    return [order.amount for order in Order.objects.order_by("note", "pk")]
+
+
+def get_values(page):
+    return [next(iter(obj.values())) for obj in page["objects"]]
+
+
+@pytest.mark.parametrize("field, order_by, selection", [PRODUCTS, ORDERS])
+def test_pages_after_the_cursors(shop, field, order_by, selection):
+    values = []
+    page, _ = search_page(field, order_by, selection, pageSize=5)
+    values += get_values(page)
+    while page["hasNext"]:
+        page, queries = search_page(field, order_by, selection, pageSize=5, after=page["endCursor"])
+        assert page["hasPrev"] and page["page"] is None
+        assert not any(" OFFSET " in query for query in queries)
+        values += get_values(page)
+    assert values == get_expected(field)
+
+
+@pytest.mark.parametrize("field, order_by, selection", [PRODUCTS, ORDERS])
+def test_pages_before_the_cursors(shop, field, order_by, selection):
+    page, _ = search_page(field, order_by, selection, pageSize=20)
+    page, _ = search_page(field, order_by, selection, pageSize=3, before=page["endCursor"])
+    values = get_values(page)
+    while page["hasPrev"]:
+        page, _ = search_page(field, order_by, selection, pageSize=3, before=page["startCursor"])
+        values = get_values(page) + values
+    # The row of the first cursor is after the pages
+    assert values == get_expected(field)[:-1]
+
+
+@pytest.mark.parametrize("field, order_by, selection", [PRODUCTS, ORDERS])
+def test_cursors_of_the_pages_by_number(shop, field, order_by, selection):
+    second, _ = search_page(field, order_by, selection, pageSize=4, page=2)
+    third, _ = search_page(field, order_by, selection, pageSize=4, page=3)
+    assert search_page(field, order_by, selection, pageSize=4, after=second["endCursor"])[0]["objects"] == third["objects"]
+    first, _ = search_page(field, order_by, selection, pageSize=4, page=1)
+    assert search_page(field, order_by, selection, pageSize=4, before=second["startCursor"])[0]["objects"] == first["objects"]
+
+
+def test_cursors_of_the_nested_pages(shop):
+    product = Product.objects.get(sku="p5")
+    query = "{ readProduct(where: {id: {exact: %d}}) { paginatedTags(orderBy: {name: DESC}, paginated: {%s}) { hasNext endCursor objects { name } } } }"
+    data, _ = execute(query % (product.pk, "pageSize: 2"))
+    page = data["readProduct"]["paginatedTags"]
+    data, _ = execute(query % (product.pk, get_arguments(pageSize=2, after=page["endCursor"])))
+    assert data["readProduct"]["paginatedTags"]["objects"] == [{"name": "t2"}, {"name": "t1"}]
+
+
+def test_cursor_of_another_order(shop):
+    page, _ = search_page(*PRODUCTS, pageSize=2)
+    result = schema.execute(
+        f'{{ searchProducts(orderBy: {{price: DESC, sku: ASC}}, paginated: {{after: "{page["endCursor"]}"}}) {{ total }} }}',
+        context_value=type("Context", (), {})(),
+    )
+    assert "is not valid for the order of this field" in result.errors[0].message
+
+
+def count_queries(queries):
+    return sum("COUNT(" in query for query in queries)
+
+
+@pytest.mark.parametrize("page", [1, 3, 4])
+def test_page_without_counting_the_rows(shop, page):
+    without_total, queries = execute(f"{{ searchProducts(paginated: {{pageSize: 3, page: {page}}}) {{ page hasNext hasPrev objects {{ sku }} }} }}")
+    assert count_queries(queries) == 0
+    assert len(queries) == 1
+    with_total, queries = execute(f"{{ searchProducts(paginated: {{pageSize: 3, page: {page}}}) {{ total pages page hasNext hasPrev objects {{ sku }} }} }}")
+    assert count_queries(queries) == 1
+    assert with_total["searchProducts"]["total"] == 10
+    assert with_total["searchProducts"]["pages"] == 4
+    assert without_total["searchProducts"] == {key: value for key, value in with_total["searchProducts"].items() if key not in ("total", "pages")}
+
+
+@pytest.mark.parametrize("page", [1, 2, 3])
+def test_nested_pages_without_counting_the_rows(shop, page):
+    query = "{ searchProducts { objects { paginatedTags(paginated: {pageSize: 2, page: %d}) { %s page hasNext hasPrev indexStartObj indexEndObj objects { name } } } } }"
+    without_total, queries = execute(query % (page, ""))
+    if page == 1:
+        assert count_queries(queries) == 0
+    with_total, queries = execute(query % (page, "total"))
+    assert count_queries(queries) == 1
+    # A page that doesn't exist returns the last page of the product
+    for product, with_total_product in zip(without_total["searchProducts"]["objects"], with_total["searchProducts"]["objects"]):
+        del with_total_product["paginatedTags"]["total"]
+        assert product == with_total_product
+
+
+WINDOW_COUNT_PAGES = "{ searchProducts(%s paginated: {pageSize: 3, page: %d}) { total pages page hasNext hasPrev indexStartObj indexEndObj objects { sku } } }"
+
+
+@pytest.mark.parametrize("where", ["", 'where: {tags: {name: {in: ["t1", "t2"]}}},', 'where: {sku: {exact: "none"}},'])
+@pytest.mark.parametrize("page", [1, 2, 4, 9])
+def test_page_and_total_in_one_query(shop, monkeypatch, where, page):
+    monkeypatch.setattr(cruddals_settings, "COUNT_TOTAL_WITH_WINDOW", True)
+    data, queries = execute(WINDOW_COUNT_PAGES % (where, page))
+    # The empty pages are counted apart, to return the last page
+    if data["searchProducts"]["objects"] and data["searchProducts"]["page"] == page:
+        assert len(queries) == 1
+        assert "COUNT(*) OVER ()" in queries[0]
+    monkeypatch.setattr(cruddals_settings, "COUNT_TOTAL_WITH_WINDOW", False)
+    counted_data, counted_queries = execute(WINDOW_COUNT_PAGES % (where, page))
+    assert count_queries(counted_queries) == 1
+    assert data == counted_data
+
+
+class ApproximateCountInterface:
+    class List:
+        approximate_count = True
+        approximate_count_threshold = 5
+
+    class Search:
+        approximate_count = True
+        approximate_count_threshold = 5
+
+
+class EstimatedProducts(CruddalsModel):
+    """The products with an estimated total"""
+
+    class Meta:
+        model = Product
+        prefix = "Estimated"
+        interfaces = [ApproximateCountInterface]
+
+
+def analyze():
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def execute_estimated(query):
+    with CaptureQueriesContext(connection) as queries:
+        result = EstimatedProducts.Schema.execute(query, context_value=type("Context", (), {})())
+    assert result.errors is None, result.errors
+    return next(iter(result.data.values())), [query["sql"] for query in queries.captured_queries]
+
+
+ESTIMATED_PAGE = "{ %s(%s paginated: {pageSize: 4, page: %d}) { total pages hasNext totalIsApproximate objects { sku } } }"
+
+
+@pytest.mark.parametrize("field", ["searchestimatedProducts", "listestimatedProducts"])
+def test_total_estimated_by_the_statistics(shop, field):
+    analyze()
+    # The statistics don't know the rows inserted after them
+    for i in range(10, 15):
+        Product.objects.create(sku=f"p{i}")
+    page, queries = execute_estimated(ESTIMATED_PAGE % (field, "", 1))
+    assert count_queries(queries) == 0
+    assert page["totalIsApproximate"] is True
+    assert (page["total"], page["pages"], page["hasNext"]) == (10, 3, True)
+    assert [obj["sku"] for obj in page["objects"]] == ["p0", "p1", "p2", "p3"]
+    # The rows seen in the page are more than the estimate
+    page, _ = execute_estimated(ESTIMATED_PAGE % (field, "", 4))
+    assert (page["total"], page["hasNext"], len(page["objects"])) == (15, False, 3)
+
+
+@pytest.mark.parametrize("case", ["filtered", "small", "without statistics"])
+def test_total_counted(shop, case):
+    where = ""
+    if case == "filtered":
+        analyze()
+        where = 'where: {sku: {startswith: "p"}},'
+    elif case == "small":
+        Product.objects.filter(sku__in=["p0", "p1", "p2", "p3", "p4", "p5"]).delete()
+        analyze()
+    page, queries = execute_estimated(ESTIMATED_PAGE % ("searchestimatedProducts", where, 1))
+    assert count_queries(queries) == 1
+    assert not page["totalIsApproximate"]
+    assert page["total"] == Product.objects.count()
@@ -0,0 +1,216 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from graphene_django_cruddals_v1.settings import cruddals_settings
+
+from .shop.models import Customer, Item, Order, Product, Tag
+from .shop.schema import schema
+
+
+@pytest.fixture
+def shop(db):
+    tags = [Tag.objects.create(name=name) for name in ("red", "green", "blue")]
+    products = []
+    for i in range(6):
+        product = Product.objects.create(sku=f"p{i}", price=i * 10)
+        product.tags.set(tags[:i % 4])
+        products.append(product)
+    # The hidden customer, filtered out by the `get_queryset` of its type, has no orders
+    customers = [Customer.objects.create(name=f"c{i}", hidden=i == 5) for i in range(6)]
+    for i in range(20):
+        order = Order.objects.create(customer=customers[i % 5], amount=i)
+        for j in range(i % 3):
+            Item.objects.create(order=order, product=products[(i + j) % 6], qty=j + 1)
+    return {"tags": tags, "products": products, "customers": customers}
+
+
+def disable_optimizations(monkeypatch):
+    monkeypatch.setattr(cruddals_settings, "OPTIMIZE_QUERIES", False)
+    monkeypatch.setattr(cruddals_settings, "BATCH_PAGINATED_FIELDS", False)
+    monkeypatch.setattr(cruddals_settings, "DEFER_UNREQUESTED_FIELDS", False)
+
+
+def execute(query):
+    """The data of `query` and the SQL of the queries it runs"""
+    with CaptureQueriesContext(connection) as queries:
+        result = schema.execute(query, context_value=type("Context", (), {})())
+    assert result.errors is None
+    return result.data, [query["sql"] for query in queries.captured_queries]
+
+
+def get_objects(data, field):
+    return data[field]["objects"]
+
+
+SEARCH_ITEMS = "{ searchItems { objects { qty product { sku } order { amount } } } }"
+SEARCH_PRODUCTS = "{ searchProducts { objects { sku paginatedTags { total objects { name } } } } }"
+SEARCH_CUSTOMERS = """
+    { searchCustomers { objects { name paginatedOrders { objects { amount paginatedLines { objects { qty product { sku } } } } } } } }
+"""
+SEARCH_CUSTOMERS_WITH_FRAGMENTS = """
+    fragment line on ItemType { qty ... on ItemType { product { sku } } }
+    fragment order on OrderType { amount paginatedLines { objects { ...line } } }
+    { searchCustomers { objects { name paginatedOrders { objects { ...order } } } } }
+"""
+
+
+def test_forward_foreign_keys_in_the_same_query(shop):
+    data, queries = execute(SEARCH_ITEMS)
+    assert len(queries) == 1
+    assert get_objects(data, "searchItems") == [
+        {"qty": item.qty, "product": {"sku": item.product.sku}, "order": {"amount": item.order.amount}}
+        for item in Item.objects.order_by("pk")
+    ]
+
+
+def test_many_to_many_prefetched(shop):
+    data, queries = execute(SEARCH_PRODUCTS)
+    assert len(queries) == 2
+    assert get_objects(data, "searchProducts") == [
+        {"sku": product.sku, "paginatedTags": {"total": product.tags.count(), "objects": [{"name": tag.name} for tag in product.tags.order_by("pk")]}}
+        for product in Product.objects.order_by("pk")
+    ]
+
+
+@pytest.mark.parametrize("query", [SEARCH_CUSTOMERS, SEARCH_CUSTOMERS_WITH_FRAGMENTS])
+def test_nested_relations_with_a_query_per_level(shop, query):
+    data, queries = execute(query)
+    # The customers, their orders and the lines of the orders with their products
+    assert len(queries) == 3
+    assert get_objects(data, "searchCustomers") == [
+        {"name": customer.name, "paginatedOrders": {"objects": [
+            {"amount": order.amount, "paginatedLines": {"objects": [
+                {"qty": item.qty, "product": {"sku": item.product.sku}} for item in order.lines.order_by("pk")
+            ]}}
+            for order in customer.orders.order_by("pk")
+        ]}}
+        # The search of the customers doesn't filter them by the `get_queryset` of their type
+        for customer in Customer.objects.order_by("pk")
+    ]
+
+
+def test_read_with_its_relations(shop):
+    product = shop["products"][3]
+    data, queries = execute(f"{{ readProduct(where: {{id: {{exact: {product.pk}}}}}) {{ sku paginatedTags {{ objects {{ name }} }} }} }}")
+    assert len(queries) == 2
+    assert data["readProduct"] == {"sku": "p3", "paginatedTags": {"objects": [{"name": "red"}, {"name": "green"}, {"name": "blue"}]}}
+
+
+@pytest.mark.parametrize("query", [SEARCH_ITEMS, SEARCH_PRODUCTS, SEARCH_CUSTOMERS])
+def test_same_data_as_without_the_optimizer(shop, monkeypatch, query):
+    data, queries = execute(query)
+    disable_optimizations(monkeypatch)
+    unoptimized_data, unoptimized_queries = execute(query)
+    assert data == unoptimized_data
+    assert len(queries) < len(unoptimized_queries)
+
+
+def test_foreign_keys_to_a_filtered_type_batched(shop):
+    data, queries = execute("{ searchOrders { objects { amount customer { name } } } }")
+    # The type of the customers filters them by its `get_queryset`, so they are loaded with an `IN` query
+    assert len(queries) == 2
+    assert get_objects(data, "searchOrders") == [
+        {"amount": order.amount, "customer": {"name": order.customer.name}}
+        for order in Order.objects.order_by("pk")
+    ]
+
+
+def test_foreign_keys_of_the_selected_related_objects_batched(shop):
+    data, queries = execute("{ searchItems { objects { qty order { amount customer { name } } } } }")
+    # The orders are selected with the items, and the customers of all of them are loaded together
+    assert len(queries) == 2
+    assert get_objects(data, "searchItems") == [
+        {"qty": item.qty, "order": {"amount": item.order.amount, "customer": {"name": item.order.customer.name}}}
+        for item in Item.objects.order_by("pk")
+    ]
+
+
+def test_related_objects_loaded_once_per_request(shop):
+    data, queries = execute("{ searchOrders { objects { customer { name } buyer: customer { name } } } }")
+    assert len(queries) == 2
+    assert all(order["customer"] == order["buyer"] for order in get_objects(data, "searchOrders"))
+
+
+def test_foreign_keys_batched_without_the_optimizer(shop, monkeypatch):
+    disable_optimizations(monkeypatch)
+    data, queries = execute(SEARCH_ITEMS)
+    # The items, and the orders and the products of all of them
+    assert len(queries) == 3
+    assert [item["order"]["amount"] for item in get_objects(data, "searchItems")] == [item.order.amount for item in Item.objects.order_by("pk")]
+
+
+PAGES_OF_ORDERS = """
+    { searchCustomers { objects { name paginatedOrders(paginated: {pageSize: 2, page: %d}) { total pages page hasNext hasPrev objects { amount } } } } }
+"""
+PAGES_OF_TAGS = """
+    { searchProducts { objects { sku paginatedTags(where: {name: {icontains: "e"}}, orderBy: {name: DESC}, paginated: {pageSize: 1}) { total objects { name } } } } }
+"""
+
+
+@pytest.mark.parametrize("page", [1, 2, 4])
+def test_pages_of_nested_fields_batched_with_a_window(shop, monkeypatch, page):
+    data, queries = execute(PAGES_OF_ORDERS % page)
+    # The customers, the totals, the window of the rows of the page and their columns
+    assert len(queries) == 4
+    assert any("ROW_NUMBER() OVER (PARTITION BY" in query for query in queries)
+    # Without the window all the orders are prefetched and paginated in memory
+    monkeypatch.setattr(cruddals_settings, "BATCH_PAGINATED_FIELDS", False)
+    assert execute(PAGES_OF_ORDERS % page)[0] == data
+
+
+def test_pages_of_nested_fields_with_their_where_and_order_by(shop, monkeypatch):
+    data, queries = execute(PAGES_OF_TAGS)
+    assert len(queries) == 4
+    assert get_objects(data, "searchProducts") == [
+        {"sku": product.sku, "paginatedTags": {
+            "total": product.tags.filter(name__icontains="e").count(),
+            "objects": [{"name": tag.name} for tag in product.tags.filter(name__icontains="e").order_by("-name")[:1]],
+        }}
+        for product in Product.objects.order_by("pk")
+    ]
+    monkeypatch.setattr(cruddals_settings, "BATCH_PAGINATED_FIELDS", False)
+    assert execute(PAGES_OF_TAGS)[0] == data
+
+
+def test_queries_of_the_pages_of_nested_fields_without_the_number_of_parents(shop):
+    _, queries = execute(PAGES_OF_ORDERS % 1)
+    for i in range(10):
+        Order.objects.create(customer=Customer.objects.create(name=f"new {i}"), amount=i)
+    data, more_queries = execute(PAGES_OF_ORDERS % 1)
+    assert len(get_objects(data, "searchCustomers")) == 16
+    assert len(more_queries) == len(queries)
+
+
+def get_selected_columns(sql, table):
+    """The columns of `table` selected by a query"""
+    select = sql[:sql.index(" FROM ")]
+    return {column for column in (field.strip() for field in select[len("SELECT "):].split(",")) if column.startswith(f'"{table}".') and " AS " not in column}
+
+
+def test_only_the_requested_columns(shop):
+    _, queries = execute("{ searchProducts { objects { sku } } }")
+    assert get_selected_columns(queries[0], "shop_product") == {'"shop_product"."id"', '"shop_product"."sku"'}
+
+
+def test_columns_of_the_relations(shop):
+    _, queries = execute("{ searchOrders { objects { customer { name } paginatedLines { objects { qty } } } } }")
+    # The column of the foreign key, and the column of the reverse relation in the prefetch of the lines
+    assert get_selected_columns(queries[0], "shop_order") == {'"shop_order"."id"', '"shop_order"."customer_id"'}
+    lines_query = next(query for query in queries if 'FROM "shop_item"' in query)
+    assert get_selected_columns(lines_query, "shop_item") == {'"shop_item"."id"', '"shop_item"."order_id"', '"shop_item"."qty"'}
+
+
+def test_columns_of_the_selected_related_objects(shop):
+    _, queries = execute(SEARCH_ITEMS)
+    assert get_selected_columns(queries[0], "shop_product") == {'"shop_product"."id"', '"shop_product"."sku"'}
+    assert get_selected_columns(queries[0], "shop_order") == {'"shop_order"."id"', '"shop_order"."amount"'}
+
+
+def test_all_the_columns_without_deferring_them(shop, monkeypatch):
+    data, queries = execute(SEARCH_ITEMS)
+    monkeypatch.setattr(cruddals_settings, "DEFER_UNREQUESTED_FIELDS", False)
+    all_columns_data, all_columns_queries = execute(SEARCH_ITEMS)
+    assert all_columns_data == data
+    assert len(all_columns_queries) == len(queries)
+    assert '"shop_order"."note"' in get_selected_columns(all_columns_queries[0], "shop_order")
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from graphene_django_cruddals_v1.settings import cruddals_settings
+from graphene_django_cruddals_v1.views.graphql_views import GraphQLView
+
+from .shop.models import Product, Tag
+from .shop.schema import schema
+
+SEARCH_PRODUCTS = "{ searchProducts(orderBy: {sku: ASC}) { total objects { sku paginatedTags { objects { name } } } } }"
+
+
+@pytest.fixture
+def products(db):
+    tag = Tag.objects.create(name="t")
+    for i in range(5):
+        Product.objects.create(sku=f"p{i}").tags.add(tag)
+
+
+def post(query, **view_kwargs):
+    view = GraphQLView.as_view(schema=schema, **view_kwargs)
+    request = RequestFactory().post("/graphql", json.dumps({"query": query}), content_type="application/json")
+    return view(request)
+
+
+def test_streamed_response_as_the_response_of_the_view(products):
+    response = post(SEARCH_PRODUCTS)
+    streamed = post(SEARCH_PRODUCTS, stream_response=True)
+    assert streamed.streaming
+    assert streamed.status_code == response.status_code == 200
+    assert b"".join(streamed.streaming_content) == response.content
+    assert len(json.loads(response.content)["data"]["searchProducts"]["objects"]) == 5
+
+
+def test_rows_read_in_chunks_before_the_response(products, monkeypatch):
+    monkeypatch.setattr(cruddals_settings, "STREAMING_CHUNK_SIZE", 2)
+    with CaptureQueriesContext(connection) as queries:
+        response = post(SEARCH_PRODUCTS, stream_response=True)
+    # The tags are loaded for each chunk of 2 products
+    assert sum('"shop_tag"' in query["sql"] for query in queries.captured_queries) == 3
+
+    # The execution is over, only the JSON is written while the response is streamed
+    with CaptureQueriesContext(connection) as queries:
+        content = b"".join(response.streaming_content)
+    assert queries.captured_queries == []
+    assert [row["sku"] for row in json.loads(content)["data"]["searchProducts"]["objects"]] == [f"p{i}" for i in range(5)]
+
+
+def test_json_written_in_chunks(products, monkeypatch):
+    monkeypatch.setattr(GraphQLView, "stream_buffer_size", 64)
+    chunks = list(post(SEARCH_PRODUCTS, stream_response=True).streaming_content)
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 64 for chunk in chunks[:-1])
+
+
+def test_streamed_rows_without_the_limit_of_the_page_size_all(products, monkeypatch):
+    monkeypatch.setattr(cruddals_settings, "MAX_ROWS_FOR_PAGE_SIZE_ALL", 2)
+    assert "errors" in json.loads(post(SEARCH_PRODUCTS).content)
+    content = json.loads(b"".join(post(SEARCH_PRODUCTS, stream_response=True).streaming_content))
+    assert "errors" not in content
+    assert content["data"]["searchProducts"]["total"] == 5
@@ -0,0 +1,139 @@
+import json
+
+import pytest
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.test.utils import CaptureQueriesContext
+
+from graphene_django_cruddals_v1 import CruddalsApp
+from graphene_django_cruddals_v1.registry import registry_global
+from graphene_django_cruddals_v1.settings import cruddals_settings
+from graphene_django_cruddals_v1.utils import text_search as text_search_module
+from graphene_django_cruddals_v1.utils.text_search import TextSearch, get_text_search, register_text_search
+
+from .shop.models import Customer, Tag
+
+
+def unregister_text_search(model):
+    dispatch_uid = f"cruddals_text_search_{model._meta.label}"
+    post_save.disconnect(sender=model, dispatch_uid=dispatch_uid)
+    post_delete.disconnect(sender=model, dispatch_uid=dispatch_uid)
+    text_search_module._text_searches.pop(model, None)
+
+
+@pytest.fixture
+def tag_search(db):
+    """The full-text search of the names of the tags, without its shadow table"""
+    yield register_text_search(Tag, ["name"])
+    unregister_text_search(Tag)
+
+
+def get_indexed_rows(text_search):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT rowid, name FROM {connection.ops.quote_name(text_search.fts_table)} ORDER BY rowid")
+        return cursor.fetchall()
+
+
+def is_searched_with_fts_table(text_search, text):
+    with CaptureQueriesContext(connection) as queries:
+        list(text_search.search(Tag.objects.all(), text))
+    return " MATCH " in queries.captured_queries[-1]["sql"]
+
+
+def test_rows_saved_after_another_process_builds_the_table(tag_search):
+    old = Tag.objects.create(name="old")
+    assert not tag_search.can_use_fts_table(connection)
+
+    # The table is built by the command in another process
+    TextSearch(Tag, ["name"]).build_index(connection.alias)
+    new = Tag.objects.create(name="new")
+    old.name = "renamed"
+    old.save()
+    assert get_indexed_rows(tag_search) == [(old.pk, "renamed"), (new.pk, "new")]
+    new.delete()
+    assert get_indexed_rows(tag_search) == [(old.pk, "renamed")]
+
+
+def test_searches_check_again_the_missing_table_after_the_interval(tag_search, monkeypatch):
+    Tag.objects.create(name="first")
+    assert not is_searched_with_fts_table(tag_search, "first")
+    TextSearch(Tag, ["name"]).build_index(connection.alias)
+    assert not is_searched_with_fts_table(tag_search, "first")
+
+    monkeypatch.setattr(cruddals_settings, "TEXT_SEARCH_TABLE_CHECK_INTERVAL", 0)
+    assert is_searched_with_fts_table(tag_search, "first")
+    assert [tag.name for tag in tag_search.search(Tag.objects.all(), "fir")] == ["first"]
+
+
+class TextSearchInterface:
+    class Search:
+        text_search_fields = ["name", "secret"]
+
+
+@pytest.fixture
+def schema(db, monkeypatch):
+    """The schema of the shop with the text search of the customers, in a registry of its own"""
+    monkeypatch.setattr(registry_global, "registry", None)
+
+    class TextSearchShopApp(CruddalsApp):
+        class Meta:
+            app_name = "shop"
+            models = ["Customer", "Order"]
+            settings_for_model = {"Customer": {"interfaces": [TextSearchInterface]}}
+
+    for name, secret in [
+        ("Ann", "ann ann"),
+        ("Annabel Smith Jones Brown", "long and unrelated words"),
+        ("Bob", "gold"),
+        ("Carl Ann", "silver"),
+        ("Dan", "gold ring"),
+    ]:
+        Customer.objects.create(name=name, secret=secret)
+    yield TextSearchShopApp.Schema
+    unregister_text_search(Customer)
+
+
+def search_customers(schema, text, arguments=""):
+    """The names found by the search and the SQL of its queries"""
+    with CaptureQueriesContext(connection) as queries:
+        result = schema.execute(
+            f"{{ searchCustomers(text: {json.dumps(text)}{arguments}) {{ objects {{ name }} }} }}",
+            context_value=type("Context", (), {})(),
+        )
+    assert result.errors is None, result.errors
+    return [customer["name"] for customer in result.data["searchCustomers"]["objects"]], [query["sql"] for query in queries.captured_queries]
+
+
+@pytest.mark.parametrize("text", ["ann", "GOLD", "gold ring", "car an", "nobody"])
+def test_same_rows_with_the_fts_table_as_with_icontains(schema, text):
+    names, queries = search_customers(schema, text)
+    assert not any(" MATCH " in query for query in queries)
+    get_text_search(Customer).build_index(connection.alias)
+    fts_names, fts_queries = search_customers(schema, text)
+    assert any(" MATCH " in query for query in fts_queries)
+    assert sorted(fts_names) == sorted(names)
+
+
+def test_rows_ordered_by_relevance(schema):
+    get_text_search(Customer).build_index(connection.alias)
+    # The prefix of a word matches it, and the more times a short row has the word the more relevant it is
+    names, _ = search_customers(schema, "ann")
+    assert names[0] == "Ann"
+    assert set(names) == {"Ann", "Annabel Smith Jones Brown", "Carl Ann"}
+    # The order of the user replaces the relevance
+    names, _ = search_customers(schema, "ann", ", orderBy: {name: DESC}")
+    assert names == ["Carl Ann", "Annabel Smith Jones Brown", "Ann"]
+
+
+def test_text_with_the_where(schema):
+    get_text_search(Customer).build_index(connection.alias)
+    names, _ = search_customers(schema, "gold", ', where: {name: {exact: "Dan"}}')
+    assert names == ["Dan"]
+
+
+@pytest.mark.parametrize("text", ['ann"', '"ann" OR bob', "NOT ann", "ann*", "(ann", "name:ann", "NEAR(ann bob)"])
+def test_operators_of_fts5_searched_as_words(schema, text):
+    get_text_search(Customer).build_index(connection.alias)
+    names, queries = search_customers(schema, text)
+    assert any(" MATCH " in query for query in queries)
+    assert "Bob" not in names
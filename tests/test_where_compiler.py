@@ -0,0 +1,161 @@
+import copy
+
+import pytest
+from django.db.models import Q
+
+from graphene_django_cruddals_v1.settings import cruddals_settings
+from graphene_django_cruddals_v1.utils.utils import get_args
+from graphene_django_cruddals_v1.utils.where_compiler import compile_where, compile_where_shape
+
+from .shop.models import Customer, Item, Order, Product, Tag
+
+
+def baseline_where_input_to_Q(where):
+    """The conversion of the where inputs before the compiler, the reference of the row sets"""
+    where = copy.copy(where)
+    AND = Q()
+    OR = Q()
+    NOT = Q()
+    if "OR" in where.keys():
+        for w in where.pop("OR"):
+            OR = OR | Q(baseline_where_input_to_Q(w))
+    if "AND" in where.keys():
+        for w in where.pop("AND"):
+            AND = AND & Q(baseline_where_input_to_Q(w))
+    if "NOT" in where.keys():
+        NOT = NOT & ~Q(baseline_where_input_to_Q(where.pop("NOT")))
+    return Q(**get_args(where)) & OR & AND & NOT
+
+
+def get_pks(model, q):
+    return set(model._default_manager.filter(q).values_list("pk", flat=True))
+
+
+def assert_same_rows(model, where):
+    original = copy.deepcopy(where)
+    expected = get_pks(model, baseline_where_input_to_Q(copy.deepcopy(where)))
+    assert get_pks(model, compile_where(where, model)) == expected
+    assert get_pks(model, compile_where(where)) == expected
+    # The where input isn't modified
+    assert where == original
+    return expected
+
+
+@pytest.fixture
+def shop(db):
+    tags = [Tag.objects.create(name=name) for name in ("red", "green", "blue")]
+    products = []
+    for i in range(6):
+        product = Product.objects.create(sku=f"p{i}", price=i * 10)
+        product.tags.set(tags[:i % 4])
+        products.append(product)
+    customers = [Customer.objects.create(name=f"c{i}", credit=i) for i in range(6)]
+    for i in range(30):
+        order = Order.objects.create(
+            customer=customers[i % 5],
+            amount=i,
+            status="done" if i % 3 == 0 else "new",
+            note=None if i % 4 == 0 else f"note {i % 7}",
+        )
+        for j in range(i % 4):
+            Item.objects.create(order=order, product=products[(i + j) % 6], qty=(i * j) % 5)
+    return {"tags": tags, "products": products, "customers": customers}
+
+
+@pytest.mark.parametrize("where", [
+    {},
+    {"amount": {"gte": 10}},
+    {"amount": {"gte": 10, "lt": 20}, "status": {"equals": "new"}},
+    {"id": {"in": [1, 2, 3, 100]}},
+    {"note": {"isnull": True}},
+    {"customer": {"name": {"exact": "c1"}}},
+    {"customer": {"id": {"exact": 2}}, "amount": {"lte": 15}},
+])
+def test_leaf_filters(shop, where):
+    assert_same_rows(Order, where)
+
+
+@pytest.mark.parametrize("where", [
+    {"OR": [{"amount": {"lt": 3}}, {"amount": {"gt": 27}}]},
+    {"OR": [{"id": {"exact": 1}}, {"id": {"exact": 5}}, {"id": {"in": [7, 9]}}]},
+    {"OR": [{"status": {"exact": "done"}}, {"customer": {"name": {"exact": "c2"}}}], "amount": {"gte": 5}},
+    {"AND": [{"amount": {"gte": 5}}, {"amount": {"lte": 20}}, {"status": {"exact": "new"}}]},
+    {"NOT": {"status": {"exact": "done"}}},
+    {"NOT": {"OR": [{"amount": {"lt": 10}}, {"note": {"isnull": True}}]}},
+    {"NOT": {"NOT": {"amount": {"lt": 10}}}},
+    {"AND": [{"OR": [{"amount": {"lt": 5}}, {"amount": {"gt": 25}}]}, {"NOT": {"status": {"exact": "new"}}}]},
+    {"OR": [{"AND": [{"amount": {"gte": 10}}, {"status": {"exact": "done"}}]}, {"AND": [{"amount": {"lt": 10}}, {"note": {"isnull": True}}]}]},
+    # The empty branches are dropped as `Q() | Q(x)` drops them
+    {"OR": [{}, {"id": {"exact": 1}}]},
+    {"NOT": {"OR": [{}, {"id": {"exact": 1}}]}},
+    {"OR": [{}, {}]},
+    {"AND": [{}, {"id": {"exact": 2}}]},
+    {"OR": [{"AND": []}, {"id": {"exact": 3}}]},
+])
+def test_logical_operators(shop, where):
+    assert_same_rows(Order, where)
+
+
+@pytest.mark.parametrize("where", [
+    {"orders": {"amount": {"gte": 25}}},
+    {"orders": {"amount": {"gte": 10}, "status": {"exact": "done"}}},
+    {"orders": {"lines": {"qty": {"gte": 3}}}},
+    {"orders": {"lines": {"product": {"sku": {"exact": "p2"}}}, "amount": {"lt": 15}}},
+    {"orders": {"lines": {"product": {"tags": {"name": {"exact": "green"}}}}}},
+    {"OR": [{"orders": {"amount": {"exact": 3}}}, {"orders": {"amount": {"exact": 29}}}]},
+    {"AND": [{"orders": {"amount": {"gte": 10}}}, {"orders": {"status": {"exact": "done"}}}]},
+    {"orders": {"amount": {"gte": 10}}, "AND": [{"orders": {"status": {"exact": "done"}}}]},
+    {"NOT": {"orders": {"status": {"exact": "done"}}}},
+    {"NOT": {"orders": {"lines": {"qty": {"gte": 1}}}}},
+    {"OR": [{"name": {"exact": "c5"}}, {"orders": {"lines": {"qty": {"exact": 4}}}}]},
+])
+def test_to_many_filters(shop, where):
+    assert_same_rows(Customer, where)
+
+
+@pytest.mark.parametrize("model, where", [
+    (Product, {"tags": {"name": {"exact": "red"}}}),
+    (Product, {"tags": {"name": {"in": ["red", "blue"]}}, "price": {"gte": 20}}),
+    (Product, {"NOT": {"tags": {"name": {"exact": "blue"}}}}),
+    (Tag, {"product": {"sku": {"in": ["p1", "p3"]}}}),
+    (Order, {"lines": {"product": {"tags": {"name": {"exact": "blue"}}}}, "customer": {"name": {"exact": "c1"}}}),
+])
+def test_many_to_many_filters(shop, model, where):
+    assert_same_rows(model, where)
+
+
+def test_to_many_filters_without_exists(shop, monkeypatch):
+    monkeypatch.setattr(cruddals_settings, "USE_EXISTS_FOR_TO_MANY_FILTERS", False)
+    assert_same_rows(Customer, {"orders": {"lines": {"qty": {"gte": 3}}, "amount": {"lt": 20}}})
+    assert_same_rows(Customer, {"OR": [{"orders": {"amount": {"exact": 3}}}, {"name": {"exact": "c4"}}]})
+
+
+def test_same_shape_with_other_values(shop):
+    compile_where_shape.cache_clear()
+    first = assert_same_rows(Order, {"amount": {"in": [1, 2, 3]}, "OR": [{"status": {"exact": "new"}}, {"note": {"isnull": True}}]})
+    second = assert_same_rows(Order, {"amount": {"in": [4, 8]}, "OR": [{"status": {"exact": "done"}}, {"note": {"isnull": False}}]})
+    assert first != second
+    assert compile_where_shape.cache_info().hits >= 1
+
+
+@pytest.mark.parametrize("where", [
+    {"id": {"in": list(range(-500, 1500, 3))}},
+    {"customer": {"id": {"in": list(range(0, 1500, 2))}}},
+    {"note": {"in": [f"note {i}" for i in range(0, 1000, 2)]}},
+    {"NOT": {"note": {"in": [f"note {i}" for i in range(0, 1000, 2)]}}},
+    {"NOT": {"id": {"in": list(range(10, 1500))}}},
+    {"OR": [{"id": {"in": list(range(20, 1500))}}, {"amount": {"lt": 2}}]},
+    {"customer": {"orders": {"id": {"in": list(range(0, 1500, 7))}}}},
+])
+def test_large_in_lists(shop, monkeypatch, where):
+    monkeypatch.setattr(cruddals_settings, "LARGE_IN_LIST_THRESHOLD", 100)
+    assert_same_rows(Order, where)
+
+
+def test_large_in_list_is_a_single_parameter(shop, monkeypatch):
+    monkeypatch.setattr(cruddals_settings, "LARGE_IN_LIST_THRESHOLD", 100)
+    queryset = Order.objects.filter(compile_where({"id": {"in": list(range(5000))}}, Order))
+    sql, params = queryset.query.sql_with_params()
+    assert "json_each" in sql
+    assert len(params) == 1
+    assert queryset.count() == Order.objects.count()